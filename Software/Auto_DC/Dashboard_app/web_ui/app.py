@@ -1,8 +1,14 @@
-from flask import Flask, render_template, redirect, url_for
+from flask import Flask, Response, render_template, redirect, stream_with_context, url_for
+import json
+import os
 import subprocess
+import urllib.request
 
 app = Flask(__name__)
 
+# Live telemetry published by the data collection host (Auto_DC/telemetry.py)
+TELEMETRY_URL = os.environ.get("STARFISH_TELEMETRY_URL", "http://127.0.0.1:5006")
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -27,5 +33,19 @@ def run_pi_client():
     subprocess.Popen(["python3", "../Pi_Client/Pi_Client.py"])
     return redirect(url_for("index"))
 
+@app.route("/telemetry")
+def telemetry():
+    """Relay the host's server-sent events so the page only talks to this server."""
+    def relay():
+        try:
+            with urllib.request.urlopen(TELEMETRY_URL + "/events", timeout=60) as upstream:
+                for line in upstream:
+                    yield line
+        except OSError as e:
+            # The browser's EventSource reconnects by itself after the stream ends
+            yield f"event: offline\ndata: {json.dumps(str(e))}\n\n".encode()
+    return Response(stream_with_context(relay()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
@@ -18,18 +18,21 @@
 
 # === Import libraries ===
 import socket
-import json
+import select
 import time
-import datetime
 import RPi.GPIO as GPIO
 from daqhats import mcc134, HatIDs, HatError, TcTypes
 import os
+from collections import deque
 
 # Specify dependency path for daqhats
 import sys
 sys.path.append('/home/starfish2/STARFISH/Thermal/daqhats_custom_stuff/examples/python/mcc134')
 
 from daqhats_utils import select_hat_device
+from wire_protocol import MessageStream, choose_protocol, PROTOCOL_JSON, NUM_CHANNELS
+from tc_sampler import SampleRing, ThermocoupleSampler
+from sma_control import SMAController
 
 ################################ CONFIGURATION ################################
 PC_IP = '192.168.0.100'        # Update with current Host PC's IP address
@@ -39,7 +42,12 @@ SMA_GPIO_PIN = 16
 
 DEBUG = True                   # Set to False to reduce debug output
 
-MAX_CONSECUTIVE_ERRORS = 10    # Exit after this many consecutive errors
+MAX_CONSECUTIVE_ERRORS = 10    # Exit (or reconnect) after this many consecutive errors
+
+RECONNECT = True               # Reconnect and wait for the next host session when the connection to the host is lost
+RECONNECT_DELAY = 5.0          # seconds between connection attempts
+
+SAMPLER_STALL_TICKS = 5        # SMA controller turns off if the sampler publishes nothing for this many periods
 
 ########################## Helper and Cleanup Functions #######################
 def cleanup_and_exit():
@@ -54,25 +62,76 @@ def cleanup_and_exit():
     print("[INFO] Cleanup complete. Exiting.")
     os._exit(1)
 
+def connection_failed(reason):
+    """Give up on the current host connection: reconnect if RECONNECT is set, otherwise exit."""
+    if RECONNECT:
+        raise ConnectionResetError(reason)
+    cleanup_and_exit()
+
 error_count = 0                # Counter for consecutive errors, (start at 0)
+deferred_messages = deque()    # Host commands received while sampling, handled after the run
+
 def read_socket_line():
-    """Read a line from the socket with proper error handling."""
+    """Read the next command from the host with proper error handling."""
+    if deferred_messages:
+        return deferred_messages.popleft()
+    return recv_host_message()
+
+def recv_host_message():
     global error_count, client
     try:
-        data = client.recv(1024).decode().strip()
-        if data:  # Reset error count on successful read
+        msg = host_stream.recv_message()
+        if msg is not None:  # Reset error count on successful read
             error_count = 0
-        return data
-    except socket.timeout:
-        return None
+        if isinstance(msg, str) and answer_sync_request(msg):
+            return None
+        return msg if isinstance(msg, str) else None
+    except ConnectionResetError as e:
+        print(f"[ERROR] Host closed the connection: {e}")
+        connection_failed(str(e))
     except Exception as e:
         error_count += 1
         if error_count >= MAX_CONSECUTIVE_ERRORS:
-            print(f"[FATAL] Too many consecutive errors ({error_count}). Exiting program.")
-            cleanup_and_exit()
+            print(f"[FATAL] Too many consecutive errors ({error_count}).")
+            connection_failed(str(e))
         print(f"[ERROR] Socket read error: {e}")
         return None
 
+# Answer a host clock sync exchange: "sync_req:<seq>" -> "sync_resp:<seq>:<t_recv>:<t_send>"
+def answer_sync_request(msg):
+    if not msg.startswith("sync_req:"):
+        return False
+    t_recv = time.time()
+    seq = msg.split(":", 1)[1]
+    send_with_retry(host_stream.encode_text(f"sync_resp:{seq}:{t_recv}:{time.time()}"))
+    return True
+
+# Handle host messages for up to `timeout` seconds without blocking sampling
+def poll_host_commands(timeout=0.0):
+    global should_exit, host_stopped, end_run_requested
+    deadline = time.time() + timeout
+    while True:
+        if not host_stream.has_pending():
+            readable, _, _ = select.select([client], [], [], max(deadline - time.time(), 0))
+            if not readable:
+                return
+        client.settimeout(0.05)
+        try:
+            msg = recv_host_message()
+        finally:
+            client.settimeout(None)
+        if msg is None:
+            continue
+        if msg.lower() == "stop":
+            print("[INFO] Received stop command from host during data collection. Ending session.")
+            should_exit = host_stopped = True
+            return
+        if msg.lower() == "end run":
+            # Host detected the end of the run (SMA relaxed) before RUN_TIME
+            end_run_requested = True
+            return
+        deferred_messages.append(msg)   # e.g. the next run's 'start dc'
+
 # If connection fails, retry connection and send data
 def send_with_retry(data, max_retries=3):
     global error_count, client
@@ -84,8 +143,8 @@ def send_with_retry(data, max_retries=3):
         except Exception as e:
             error_count += 1
             if error_count >= MAX_CONSECUTIVE_ERRORS:
-                print(f"[FATAL] Too many consecutive errors ({error_count}). Exiting program.")
-                cleanup_and_exit()
+                print(f"[FATAL] Too many consecutive errors ({error_count}).")
+                connection_failed(str(e))
             print(f"[ERROR] Send attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
                 time.sleep(1)  # Wait before retry
@@ -98,11 +157,6 @@ GPIO.setmode(GPIO.BCM)
 GPIO.setup(SMA_GPIO_PIN, GPIO.OUT)
 GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
 
-# Connect to Host
-client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client.connect((PC_IP, PC_PORT))
-print(f"[INFO] Connected to PC at {PC_IP}:{PC_PORT}")
-
 # Initialize MCC 134
 try:
     address = select_hat_device(HatIDs.MCC_134)
@@ -110,33 +164,101 @@ try:
 except HatError as e:
     print(f"[ERROR] Could not initialize MCC 134: {e}")
     GPIO.cleanup()
-    client.close()
     exit(1)
 
+# Connect to Host (retried while the host isn't up yet when RECONNECT is set)
+client = None
+host_stream = None
+
+def connect_to_host():
+    global client, host_stream, error_count
+    while True:
+        try:
+            client = socket.create_connection((PC_IP, PC_PORT))
+            break
+        except OSError as e:
+            if not RECONNECT:
+                raise
+            print(f"[WARN] Could not connect to PC at {PC_IP}:{PC_PORT} ({e}). Retrying in {RECONNECT_DELAY:.0f}s...")
+            time.sleep(RECONNECT_DELAY)
+    host_stream = MessageStream(client)
+    deferred_messages.clear()
+    error_count = 0
+    print(f"[INFO] Connected to PC at {PC_IP}:{PC_PORT}")
+
 ######################### Receive Configuration From Host ######################
-config = json.loads(client.recv(1024).decode())
-print(f"[INFO] Received config: {config}")
-
-# Default settings are updated by Host upon connection
-TC_CHANNELS = config.get("channels", [0])                # default: [0]
-# SMA_PULSE_DURATION = config.get("pulse_duration", 1.0) # No longer used
-SEND_INTERVAL = config.get("send_interval", 0.25)        # default: 0.25 sec
-TC_TYPE = getattr(TcTypes, f"TYPE_{config.get('tc_type', 'J')}")
-NUM_RUNS = config.get("num_runs", 1)
-RUN_TIME = config.get("run_time", 20.0)                  # seconds
-LEAD_TIME = config.get("lead_time", 2.0)                 # seconds
-TARGET_TEMP_C = config.get("target_temp_c", 70.0)        # celsius
-MAX_HEAT_TIME = config.get("max_heat_time", 90.0)        # seconds
-END_TEMP_MARGIN = config.get("end_temp_margin", 2.0)     # New
-
-for ch in TC_CHANNELS:
-    hat.tc_type_write(ch, TC_TYPE)
+def receive_config():
+    """Receive the host configuration, negotiate the wire protocol and apply the settings."""
+    global TC_CHANNELS, SEND_INTERVAL, TC_TYPE, NUM_RUNS, RUN_TIME, LEAD_TIME, TARGET_TEMP_C, MAX_HEAT_TIME
+    global END_TEMP_MARGIN, BATCH_SIZE, BATCH_WINDOW_MS, SAMPLE_INTERVAL, SMA_CONTROL_MODE, SMA_PROFILE
+    global SMA_PID_GAINS, SMA_FEED_FORWARD, SMA_PWM_FREQ, SMA_MAX_TEMP_C
+    config = host_stream.recv_message()
+    print(f"[INFO] Received config: {config}")
+
+    # Negotiate wire protocol version (hosts that don't offer one stay on protocol 1)
+    if "protocol_versions" in config:
+        protocol_version = choose_protocol(config["protocol_versions"])
+        channel_slots = config.get("channel_slots", NUM_CHANNELS)
+        host_stream.send_json({"protocol_version": protocol_version, "channel_slots": channel_slots, "clock_sync": True})
+        host_stream.set_version(protocol_version, channel_slots)
+    else:
+        host_stream.set_version(PROTOCOL_JSON)
+    print(f"[INFO] Using wire protocol version {host_stream.version}")
+
+    # Default settings are updated by Host upon connection
+    TC_CHANNELS = config.get("channels", [0])                # default: [0]
+    # SMA_PULSE_DURATION = config.get("pulse_duration", 1.0) # No longer used
+    SEND_INTERVAL = config.get("send_interval", 0.25)        # default: 0.25 sec
+    TC_TYPE = getattr(TcTypes, f"TYPE_{config.get('tc_type', 'J')}")
+    NUM_RUNS = config.get("num_runs", 1)
+    RUN_TIME = config.get("run_time", 20.0)                  # seconds
+    LEAD_TIME = config.get("lead_time", 2.0)                 # seconds
+    TARGET_TEMP_C = config.get("target_temp_c", 70.0)        # celsius
+    MAX_HEAT_TIME = config.get("max_heat_time", 90.0)        # seconds
+    END_TEMP_MARGIN = config.get("end_temp_margin", 2.0)     # New
+    BATCH_SIZE = config.get("batch_size", 1)                 # samples per packet, default: 1 (no batching)
+    BATCH_WINDOW_MS = config.get("batch_window_ms", 0)       # max ms of samples per packet, 0 = no time limit
+    SAMPLE_INTERVAL = config.get("sample_interval", SEND_INTERVAL)  # sampler tick (SMA control rate), <= send_interval
+    SMA_CONTROL_MODE = config.get("control_mode", "bang_bang")      # "bang_bang" or "pid" (see sma_control.py)
+    SMA_PROFILE = config.get("sma_profile")                  # [[t_sec, temp_C], ...] after pulse start, pid mode
+    SMA_PID_GAINS = config.get("pid_gains", [0.1, 0.0, 0.0]) # kp, ki, kd
+    SMA_FEED_FORWARD = config.get("feed_forward", 0.0)       # duty per C of setpoint above pre-pulse temp
+    SMA_PWM_FREQ = config.get("pwm_freq", 50)                # Hz
+    SMA_MAX_TEMP_C = config.get("max_temp_c")                # hard over-temperature cut-off, None = off
+
+    for ch in TC_CHANNELS:
+        hat.tc_type_write(ch, TC_TYPE)
+
+############################### Sample Batching ###############################
+def flush_batch(batch):
+    """Send all batched samples to the host in one frame. Returns False if sending failed."""
+    if not batch:
+        return True
+    if DEBUG:
+        print(f"[DEBUG] Sending {len(batch)} sample(s)...")
+    if not send_with_retry(host_stream.encode_packets(batch)):
+        return False
+    if DEBUG:
+        for packet in batch:
+            print(f"[INFO] Sent: {packet}")
+    batch.clear()
+    return True
+
+def batch_is_due(batch):
+    """A batch is flushed once it holds BATCH_SIZE samples or spans BATCH_WINDOW_MS."""
+    if len(batch) >= BATCH_SIZE:
+        return True
+    span_ms = (batch[-1]["timestamp"] - batch[0]["timestamp"]) * 1000
+    return BATCH_WINDOW_MS > 0 and span_ms >= BATCH_WINDOW_MS
 
 ################################## MAIN LOOP ##################################
 should_exit = False
+host_stopped = False           # The host ended the session with 'stop' (no reconnect)
+end_run_requested = False
 
 def data_collection_loop(run_index):
-    global client, should_exit
+    global client, should_exit, host_stopped, end_run_requested
+    end_run_requested = False
     # Lead-in is already done
     # Wait for 'trigger' from host
     while True:
@@ -147,139 +269,149 @@ def data_collection_loop(run_index):
             print("[INFO] Received 'trigger' from host. Starting data collection.")
             break
         elif msg.lower() == "stop":
-            print("[INFO] Received stop command from host during handshake. Exiting.")
-            should_exit = True
+            print("[INFO] Received stop command from host during handshake. Ending session.")
+            should_exit = host_stopped = True
             return
 
     # Main data collection loop
     start_time = time.time()
-    sma_active = False
-    pulse_start_time = None
-    last_sample_time = time.time()
+    next_send_time = start_time  # Telemetry is sent every SEND_INTERVAL, control uses every sample
     pulse_sent = False
-    heating_should_stop = False
-    stop_reason = ""
     main_tc_channel = TC_CHANNELS[0] if TC_CHANNELS else 0
+    batch = []                 # Samples waiting to be sent to the host
+    last_batched_sma = False   # SMA state of the last batched sample
+
+    # The sampler thread reads every channel once per tick into a shared ring buffer;
+    # the SMA controller thread and the telemetry below both consume it
+    sampler = ThermocoupleSampler(hat, TC_CHANNELS, SAMPLE_INTERVAL, SampleRing(), debug=DEBUG)
+    controller = SMAController(SMA_GPIO_PIN, sampler.ring, main_tc_channel, mode=SMA_CONTROL_MODE,
+                               target_temp_c=TARGET_TEMP_C, max_heat_time=MAX_HEAT_TIME,
+                               max_temp_c=SMA_MAX_TEMP_C, profile=SMA_PROFILE, gains=SMA_PID_GAINS,
+                               feed_forward=SMA_FEED_FORWARD, pwm_freq=SMA_PWM_FREQ,
+                               stall_timeout=SAMPLER_STALL_TICKS * SAMPLE_INTERVAL, debug=DEBUG)
+    sampler.start()
+    controller.start()
+    last_seq = 0
 
-    while True:
-        if should_exit:
-            GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
-            break
+    try:
+        while True:
+            if should_exit:
+                break
 
-        now = time.time()
-        elapsed = now - start_time
-
-        # Lead-in period: wait before activating SMA
-        if not pulse_sent and elapsed >= LEAD_TIME:
-            GPIO.output(SMA_GPIO_PIN, GPIO.HIGH)
-            sma_active = True
-            pulse_start_time = now
-            pulse_sent = True
-            if DEBUG:
-                print(f"[INFO] SMA pulse started at t={elapsed:.2f}s (target_temp_c={TARGET_TEMP_C}, max_heat_time={MAX_HEAT_TIME})")
-            # When the SMA pulse is triggered (right after setting sma_active = True):
-            pulse_start_msg = f"pulse_start_ts:{time.time()}"
-            send_with_retry((pulse_start_msg + "\n").encode())
-
-        # Check temperature and timeout for SMA deactivation
-        if sma_active and pulse_sent and not heating_should_stop:
-            try:
-                current_temp = hat.t_in_read(main_tc_channel)
+            now = time.time()
+            elapsed = now - start_time
+
+            # Lead-in period: wait before activating SMA
+            if not pulse_sent and elapsed >= LEAD_TIME:
+                controller.begin(now)
+                pulse_sent = True
                 if DEBUG:
-                    print(f"[DEBUG] Main TC channel {main_tc_channel} temp: {current_temp:.2f} C (target: {TARGET_TEMP_C})")
-
-                # 1. Check for target temperature
-                if current_temp >= TARGET_TEMP_C:
-                    heating_should_stop = True
-                    stop_reason = "target_temp"
-                # 2. Check for max heat time safety override
-                elif (now - pulse_start_time) >= MAX_HEAT_TIME:
-                    heating_should_stop = True
-                    stop_reason = "max_heat_time"
-
-                if heating_should_stop:
-                    GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
-                    sma_active = False
-                    print(f"[INFO] SMA pulse ended (reason: {stop_reason}). Temp: {current_temp:.2f}C, Time: {now - pulse_start_time:.1f}s")
-
-            except Exception as e:
-                print(f"[ERROR] Temp read failed for SMA control, deactivating for safety: {e}")
-                GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
-                sma_active = False
-
-        # Sample temperature and send to host at fixed interval
-        if now >= last_sample_time:
-            temps = {}
-            for ch in TC_CHANNELS:
+                    print(f"[INFO] SMA pulse started at t={elapsed:.2f}s (mode={SMA_CONTROL_MODE}, target_temp_c={TARGET_TEMP_C}, max_heat_time={MAX_HEAT_TIME})")
+                # When the SMA pulse is triggered (right after setting sma_active = True):
+                # Flush batched samples first so the host sees events in order
+                pulse_start_msg = f"pulse_start_ts:{now}"
+                flush_batch(batch)
+                send_with_retry(host_stream.encode_text(pulse_start_msg))
+
+            send_failed = False
+            for last_seq, sample_ts, temps in sampler.ring.since(last_seq):
+                # Send temperature samples to host at fixed interval
+                if sample_ts < next_send_time:
+                    continue
+                next_send_time += SEND_INTERVAL
+                if next_send_time <= sample_ts:   # Fell behind (e.g. a stalled send): don't burst
+                    next_send_time = sample_ts + SEND_INTERVAL
+
+                sma_active = controller.active_at(sample_ts)   # State when the sample was taken, not when it is sent
+                packet = {
+                    "run_index": run_index + 1,
+                    "timestamp": sample_ts,  # Unix timestamp of the sampler tick
+                    "temperatures_C": temps,
+                    "sma_active": sma_active
+                }
+                # SMA state transitions are sent immediately, everything else is batched
+                sma_transition = sma_active != last_batched_sma
+                last_batched_sma = sma_active
                 try:
-                    value = hat.t_in_read(ch)
-                    temps[f"ch{ch}"] = round(value, 2)
+                    if sma_transition and not flush_batch(batch):
+                        send_failed = True
+                        break
+                    batch.append(packet)
+                    if (sma_transition or batch_is_due(batch)) and not flush_batch(batch):
+                        send_failed = True
+                        break
                 except Exception as e:
-                    temps[f"ch{ch}"] = None
-                    if DEBUG:
-                        print(f"[ERROR] Temp read failed for ch{ch}: {e}")
-
-            packet = {
-                "run_index": run_index + 1,
-                "timestamp": now,  # Send Unix timestamp
-                "temperatures_C": temps,
-                "sma_active": sma_active
-            }
-            # Debugging messages for packet handling
-            try:
-                if DEBUG:
-                    print("[DEBUG] Sending packet...")
-                if not send_with_retry((json.dumps(packet) + '\n').encode()):
-                    print("[ERROR] Failed to send packet after retries")
+                    print(f"[ERROR] Failed to send packet to host: {e}")
                     should_exit = True
                     break
-                if DEBUG:
-                    print(f"[INFO] Sent: {packet}")
-            except Exception as e:
-                print(f"[ERROR] Failed to send packet to host: {e}")
+            if send_failed:
+                print("[ERROR] Failed to send packet after retries")
                 should_exit = True
-                break
+                continue
 
-            last_sample_time += SEND_INTERVAL
-            sleep_time = last_sample_time - time.time()
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+            # Stop after run_time seconds, or once the host has seen the SMA relax
+            if elapsed > RUN_TIME:
+                break
+            if end_run_requested:
+                print("[INFO] Host ended the run (SMA relaxed).")
+                break
 
-        # Stop after run_time seconds
-        if elapsed > RUN_TIME:
-            GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
-            break
+            # Wait for the sampler's next tick while answering clock sync requests from the host
+            poll_host_commands(max(sampler.next_tick - time.monotonic(), 0) + 0.002)
+    finally:
+        controller.stop()           # SMA output off
+        sampler.stop()
+        if SMA_CONTROL_MODE == "pid" and controller.finished:
+            print(f"[INFO] SMA profile tracking: max error {controller.max_error:.2f} C (end: {controller.stop_reason})")
+        if DEBUG:
+            print(f"[DEBUG] Sampler: {sampler.stats()}")
+
+    # Send any samples still waiting in the batch
+    try:
+        if not flush_batch(batch):
+            print("[ERROR] Failed to send final batch after retries")
+    except Exception as e:
+        print(f"[ERROR] Failed to send final batch to host: {e}")
 
 # Handle sync request from host
 def handle_sync():
     try:
         # Send current Unix timestamp
         sync_time = time.time()
-        client.sendall(f"sync_ts:{sync_time}\n".encode())
+        host_stream.send_text(f"sync_ts:{sync_time}")
         print(f"[INFO] Sent sync timestamp to host: {sync_time} at {time.time()}")
     except Exception as e:
         print(f"[ERROR] Failed to send sync timestamp: {e}")
 
-try:
+def run_session():
+    """Run the host's runs on the current connection (returns when they are done or the host says stop)."""
+    global should_exit, host_stopped
     print("[INFO] Waiting for 'start dc' or 'stop' commands from host...")
     run_index = 0
     while run_index < NUM_RUNS:
-        msg = client.recv(1024).decode().strip()
+        msg = read_socket_line()
+        if msg is None:
+            continue
         if msg.lower() == "start dc":
             print(f"[INFO] Starting data collection run {run_index + 1}...")
             # Send 'ready' to host immediately
-            client.sendall(b"ready\n")
+            host_stream.send_text("ready")
             print("[INFO] Sent 'ready' to host. Waiting for 'sync' for pre-match...")
-            # Now wait for 'sync' from host for pre-match
+            # Now wait for 'sync' from host for pre-match (clock sync exchanges are answered meanwhile)
             try:
                 client.settimeout(10)  # 10 second timeout for sync
-                sync_msg = client.recv(1024).decode().strip()
+                sync_deadline = time.time() + 10
+                sync_msg = read_socket_line()
+                while sync_msg is None:
+                    if time.time() >= sync_deadline:
+                        raise socket.timeout()
+                    sync_msg = read_socket_line()
                 if sync_msg.lower() == "sync":
                     print("[INFO] Received 'sync' from host. Syncing clocks and sending timestamp...")
                     handle_sync()
                 elif sync_msg.lower() == "stop":
-                    print("[INFO] Received stop command from host during pre-match. Exiting.")
-                    should_exit = True
+                    print("[INFO] Received stop command from host during pre-match. Ending session.")
+                    should_exit = host_stopped = True
                     break
                 else:
                     print(f"[WARN] Received unexpected message from host during pre-match sync: {sync_msg}")
@@ -295,15 +427,43 @@ try:
                 time.sleep(0.05)
             print(f"[INFO] Lead-in complete. Waiting for 'trigger' from host...")
             data_collection_loop(run_index)
+            if should_exit:
+                break
             run_index += 1
         elif msg.lower() == "stop":
-            print("[INFO] Received stop command from host. Exiting.")
-            should_exit = True
+            print("[INFO] Received stop command from host. Ending session.")
+            should_exit = host_stopped = True
+            break
+
+
+try:
+    while True:
+        connect_to_host()
+        should_exit = host_stopped = False
+        try:
+            receive_config()
+            run_session()
+            # Without a 'stop', should_exit here means sending to the host failed
+            connection_lost = should_exit and not host_stopped
+        except (ConnectionError, OSError) as e:
+            print(f"[WARN] Lost connection to host: {e}")
+            connection_lost = True
+        finally:
+            GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
+            client.close()
+        if not connection_lost:
+            # Stopped by the host or all runs done: reconnecting would start the campaign again
+            print("[INFO] Host session finished. Exiting.")
+            break
+        if not RECONNECT:
             break
+        print(f"[INFO] Waiting {RECONNECT_DELAY:.0f}s before reconnecting to the host for its next session...")
+        time.sleep(RECONNECT_DELAY)
 
 except KeyboardInterrupt:
     print("\n[INFO] Stopping script.")
 finally:
     GPIO.output(SMA_GPIO_PIN, GPIO.LOW)
     GPIO.cleanup()
-    client.close()
+    if client is not None:
+        client.close()
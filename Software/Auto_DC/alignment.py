@@ -0,0 +1,158 @@
+# """
+# (PC) Host Timestamp Alignment
+# Sorted ring buffer of position samples used to match thermocouple packets
+# from the Pi to camera position data.
+#
+# Timestamps are stored as float Unix seconds in NumPy arrays, so lookups are
+# a binary search (np.searchsorted) instead of a scan over every buffered
+# sample, and the cost stays flat as the camera rate and buffer size grow.
+# Positions can either be snapped to the nearest sample or interpolated
+# (linear / cubic) at the thermocouple timestamp.
+# """
+
+# === Import libraries ===
+import numpy as np
+
+
+def _to_float(value):
+    return np.nan if value is None else float(value)
+
+def _to_value(value):
+    return None if np.isnan(value) else float(value)
+
+
+########################### Position Ring Buffer ##############################
+class PositionRingBuffer:
+    """
+    Fixed-capacity ring buffer of (timestamp, x, y, z, ...) position samples.
+
+    Each sample is written twice (at slot and slot + capacity) so the live
+    window is always one contiguous, time-sorted slice of the backing arrays.
+    Missing values (None) are stored as NaN and returned as None. n_fields is
+    the number of values after the timestamp (x, y, z and e.g. match confidence).
+    """
+
+    def __init__(self, capacity, n_fields=3):
+        self.capacity = int(capacity)
+        self.n_fields = n_fields
+        self._data = np.full((1 + n_fields, 2 * self.capacity), np.nan, dtype=np.float64)
+        self._write = 0          # Total number of samples ever written
+        self._count = 0          # Number of live samples
+        self.out_of_order = 0    # Samples rejected because they were older than the newest one
+
+    def __len__(self):
+        return self._count
+
+    def _window(self):
+        start = (self._write - self._count) % self.capacity
+        return self._data[:, start:start + self._count]
+
+    @property
+    def timestamps(self):
+        return self._window()[0]
+
+    def clear(self):
+        self._write = 0
+        self._count = 0
+
+    def append(self, sample):
+        """Append a (timestamp, x, y, z, ...) sample. Returns False if it is older than the newest sample."""
+        ts, *fields = sample
+        ts = float(ts)
+        if self._count and ts < self._data[0, (self._write - 1) % self.capacity]:
+            self.out_of_order += 1
+            return False
+        slot = self._write % self.capacity
+        values = (ts, *(_to_float(v) for v in fields))
+        self._data[:, slot] = values
+        self._data[:, slot + self.capacity] = values
+        self._write += 1
+        self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def discard_older_than(self, cutoff_ts):
+        """Drop all samples with timestamp < cutoff_ts. Returns the number dropped."""
+        n_old = int(np.searchsorted(self.timestamps, cutoff_ts, side="left"))
+        self._count -= n_old
+        return n_old
+
+    def nearest_index(self, query_ts):
+        """Vectorized nearest-neighbour lookup. Returns (indices, deltas_s) into the live window."""
+        ts = self.timestamps
+        query_ts = np.asarray(query_ts, dtype=np.float64)
+        right = np.clip(np.searchsorted(ts, query_ts), 1, len(ts) - 1) if len(ts) > 1 else np.zeros(query_ts.shape, dtype=np.intp)
+        left = np.maximum(right - 1, 0)
+        use_left = np.abs(query_ts - ts[left]) <= np.abs(ts[right] - query_ts)
+        idx = np.where(use_left, left, right)
+        return idx, np.abs(ts[idx] - query_ts)
+
+    def nearest(self, query_ts, window_ms=None):
+        """
+        Return the (timestamp, x, y, z, ...) sample closest to query_ts and its delta in ms.
+
+        Returns (None, delta_ms) if the closest sample is outside window_ms, and
+        (None, None) if the buffer is empty.
+        """
+        if self._count == 0:
+            return None, None
+        idx, delta = self.nearest_index(query_ts)
+        idx = int(idx)
+        delta_ms = float(delta) * 1000.0
+        if window_ms is not None and delta_ms > window_ms:
+            return None, delta_ms
+        return self.sample(idx), delta_ms
+
+    def newest_ts(self):
+        """Return the newest live timestamp, or None if the buffer is empty."""
+        if self._count == 0:
+            return None
+        return float(self._data[0, (self._write - 1) % self.capacity])
+
+    def interpolate(self, query_ts, mode="linear", max_gap_ms=None):
+        """
+        Interpolate the position at query_ts from the samples on either side of it.
+
+        mode is "linear" or "cubic" (cubic Hermite with finite-difference slopes,
+        i.e. a Catmull-Rom style spline through the neighbouring samples).
+        Returns ((query_ts, x, y, z, ...), err_ms), where err_ms is the distance to the
+        nearest real sample. Returns (None, None) if query_ts is not bracketed by
+        two samples, and (None, err_ms) if the bracketing gap exceeds max_gap_ms.
+        """
+        ts = self.timestamps
+        n = len(ts)
+        if n < 2 or query_ts < ts[0] or query_ts > ts[-1]:
+            return None, None
+        i1 = min(max(int(np.searchsorted(ts, query_ts, side="right")), 1), n - 1)
+        i0 = i1 - 1
+        t0, t1 = ts[i0], ts[i1]
+        h = t1 - t0
+        err_ms = float(min(query_ts - t0, t1 - query_ts)) * 1000.0
+        if max_gap_ms is not None and h * 1000.0 > max_gap_ms:
+            return None, err_ms
+        window = self._window()
+        p0, p1 = window[1:, i0], window[1:, i1]
+        if h <= 0:
+            values = p0
+        else:
+            s = (query_ts - t0) / h
+            if mode == "cubic":
+                secant = (p1 - p0) / h
+                m0 = (p1 - window[1:, i0 - 1]) / (t1 - ts[i0 - 1]) if i0 > 0 else secant
+                m1 = (window[1:, i1 + 1] - p0) / (ts[i1 + 1] - t0) if i1 < n - 1 else secant
+                m0 = np.where(np.isnan(m0), secant, m0)
+                m1 = np.where(np.isnan(m1), secant, m1)
+                s2, s3 = s * s, s * s * s
+                values = ((2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * h * m0 +
+                          (-2 * s3 + 3 * s2) * p1 + (s3 - s2) * h * m1)
+            else:
+                values = p0 + s * (p1 - p0)
+        return (float(query_ts), *(_to_value(v) for v in values)), err_ms
+
+    def sample(self, idx):
+        """Return the idx-th live sample (0 = oldest) as a (timestamp, x, y, z, ...) tuple."""
+        ts, *fields = self._window()[:, idx]
+        return (float(ts), *(_to_value(v) for v in fields))
+
+    def oldest(self, n=5):
+        """Return up to n of the oldest live samples (for debug output)."""
+        return [self.sample(i) for i in range(min(n, self._count))]
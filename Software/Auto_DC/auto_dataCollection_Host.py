@@ -5,6 +5,8 @@
 # a CSV file.
 
 # Note: Run this 'listener' program before starting the client program.
+# Several Pi clients (SMA rigs) can connect at the same time; each one runs in
+# its own asyncio session with its own cameras and CSV files (see RIGS).
 
 # To run the software, run the following commands to activate the virtual environment: 
 #  > cd "C:\Users\Owner\Desktop\SERC\STARFISH Project\Software\STARFISH"
@@ -17,18 +19,23 @@
 
 # === Import libraries ===
 import cv2
-import csv
 import os
-import socket
-import json
+import asyncio
 import time
-from datetime import datetime, timedelta, timezone
-from dateutil import parser
 from collections import deque
 import threading
 import sys
-import select
 import numpy as np
+from capture_pipeline import PositionPipeline
+from ball_detector import BallDetector, BallTracker
+from alignment import PositionRingBuffer
+from clock_sync import ClockSync
+from run_storage import CampaignWriter, RunWriter, storage_available
+from monitoring import StatusLog, PreviewWindow
+from telemetry import TelemetryServer
+from cooling_fit import CoolingFit
+from campaign import RunJournal, expand_sweep, load_sweep, single_setup_sweep, sweep_id
+from wire_protocol import AsyncMessageStream, SUPPORTED_PROTOCOLS, PROTOCOL_JSON, NUM_CHANNELS
 
 #TODO Check on joule heating vs current... and also expected current fluctuation (RE Griff/Kris)
 
@@ -42,6 +49,16 @@ Load    = 100          # grams
 LOG_DIR = r"C:\Users\Owner\Desktop\SERC\STARFISH_Project\Software\STARFISH\Thermo_Position_Data"
 FRAME_DIR = os.path.join(LOG_DIR, "frames")
 
+# Columnar campaign dataset (Parquet, needs pyarrow) written alongside the per-run CSVs
+CAMPAIGN_STORAGE = True
+CAMPAIGN_DIR = os.path.join(LOG_DIR, "campaign")
+CAMPAIGN_BATCH_ROWS = 500      # rows buffered in memory before a batch is written
+
+# Background file writer (keeps disk I/O off the acquisition loop)
+WRITER_QUEUE_SIZE     = 10000  # rows waiting to be written before new rows are dropped
+WRITER_FLUSH_INTERVAL = 1.0    # seconds between CSV flushes
+WRITER_FLUSH_ROWS     = 50     # flush after this many rows, whichever comes first
+
 # Set port and IP info (currently listening for any connecting ip)
 LISTEN_IP = "0.0.0.0"           # listens for anything trying to connect
 LISTEN_PORT = 5005
@@ -49,13 +66,28 @@ LISTEN_PORT = 5005
 # Define camera IDs in use
 CAMERA_IDS = [0] #[0, 1, 2, 3, 4]  # 0: top for X/Y, 1-4: for Z
 
+# Rig assignment for characterizing several SMA rigs in parallel. Each Pi (by IP
+# address) gets its own run, CSV files and cameras (first camera = top X/Y view).
+# Pis not listed here use CAMERA_IDS. Optional "volts", "current" and "load"
+# entries override the characterization parameters for that rig.
+RIGS = {
+    # "192.168.0.101": {"name": "rig1", "camera_ids": [0]},
+    # "192.168.0.102": {"name": "rig2", "camera_ids": [1]},
+}
+EXIT_WHEN_IDLE = True           # Exit once every connected rig has finished its runs
+
 # Alignment tolerance in milliseconds
 ALIGNMENT_WINDOW_MS  = 400     # ms, for matching position and temperature data
 
+# Alignment mode: "nearest" snaps to the closest position sample, "linear" or
+# "cubic" interpolate position at each thermocouple timestamp
+ALIGNMENT_MODE       = "nearest"
+MAX_INTERP_GAP_MS    = 1000    # ms, max gap between the position samples either side of a packet
+MAX_INTERP_WAIT_SEC  = 2.0     # seconds to wait for a later position sample before falling back to nearest
+
 # Buffer sizes
 THERMO_BUFFER_SIZE   = 100     # Pi packet buffer size
 POSITION_BUFFER_SIZE = 100     # Host data buffer size
-time_offset = 0.0              # Time offset between Pi and Host clocks
 
 # Cleanup interval and retention
 CLEANUP_INTERVAL     = 0.5     # seconds, how often to clean up old data
@@ -63,24 +95,70 @@ BUFFER_RETENTION_SEC = 1.0     # seconds, how long to keep unmatched data
 
 # Position sample rate
 POSITION_SAMPLE_RATE = 0.25    # seconds, how often to sample position data
+POSITION_WORKERS     = None    # worker threads per rig for position extraction (None = one per camera)
+
+# Ball tracking: search a window around the predicted ball position instead of
+# the whole frame (much cheaper, allows POSITION_SAMPLE_RATE near the camera frame rate)
+TRACKING_MODE        = True
+TRACK_SEARCH_MARGIN  = 40      # pixels of search window around the template, on each side
+TRACK_MIN_CONFIDENCE = 0.7     # template match value below which the full frame is searched
 
 # Thermocouple configuration for the Pi
 TC_CHANNELS          = [0]     # [0, 1, 2, 3], 4 max channels
 TC_TYPE = "J"                  # Thermocouple type: J, K, etc.
 SEND_INTERVAL        = 1.00    # seconds between temperature samples (1Hz Max for now)
+BATCH_SIZE           = 1       # samples per packet from the Pi (1 = send every sample on its own)
+BATCH_WINDOW_MS      = 0       # ms, flush a batch once it spans this long (0 = no time limit)
 
 # Set number of samples to collect, and interval between pulses
 NUM_RUNS             = 10
 INTER_RUN_DELAY      = 100     # Interval time between pulses in seconds
 LEAD_TIME            = 2.0     # seconds, lead-in before SMA pulse            
 
+# Campaign: a sweep of setups executed unattended (see campaign.py). None runs Volts/Current/Load
+# NUM_RUNS times. A JSON sweep file given on the command line overrides this, as does a rig's "sweep" entry.
+CAMPAIGN_SWEEP       = None    # e.g. {"volts": [5.0, 6.0], "current": 1.5, "load": [50, 100], "repeats": 5}
+CAMPAIGN_RESUME      = True    # Journal runs in LOG_DIR; a restarted host skips the runs already done
+CAMPAIGN_SETUP_COMMAND = None  # Shell command run for each new setup, e.g. "python set_psu.py {volts} {current}"
+CAMPAIGN_PAUSE_ON_LOAD_CHANGE = True   # Wait for the operator (Enter) when the load has to be changed by hand
+AUTO_START           = False   # Start as soon as a Pi connects instead of waiting for Enter
+
 # Temperature-based SMA control
 TARGET_TEMP_C        = 45.0    # Target temperature in Celsius for SMA activation
-END_TEMP_MARGIN      = 5.0     # Temperature margin for considering SMA relaxed
+END_TEMP_MARGIN      = 5.0     # Temperature margin above the pre-run ambient for considering SMA relaxed
 MAX_HEAT_TIME        = 120.0   # Maximum time to allow heating (seconds) for safety
 
+# End-of-run detection: a Newton cooling fit (see cooling_fit.py) predicts when the SMA is back
+# within END_TEMP_MARGIN of the pre-run ambient, and the run ends as soon as it is
+COOL_FIT_MIN_POINTS  = 5       # cooling samples before the prediction is trusted
+COOL_FIT_MIN_SPAN    = 3.0     # seconds of cooling before the prediction is trusted
+COOL_FIT_TOLERANCE   = 0.25    # C; past the predicted end, the run also ends if the reading is within END_TEMP_MARGIN
+                               # plus this (thermocouple noise) and agrees with the fit to within this
+COOL_SETTLE_WINDOW   = 10.0    # seconds; end the run if the temperature stays within COOL_SETTLE_DELTA over
+COOL_SETTLE_DELTA    = 0.3     # this window even if it is above tolerance (ambient drifted since the pre-run reading)
+
+# SMA heating controller on the Pi (see sma_control.py)
+SMA_CONTROL_MODE     = "bang_bang"   # "bang_bang": full power until TARGET_TEMP_C, "pid": follow SMA_PROFILE with PWM
+SMA_PROFILE          = [(0.0, TARGET_TEMP_C), (30.0, TARGET_TEMP_C)]   # (seconds after pulse start, setpoint C), heating ends after the last point
+SMA_PID_GAINS        = (0.1, 0.02, 0.0)   # kp (duty/C), ki (duty/C/s), kd (duty*s/C)
+SMA_FEED_FORWARD     = 0.0     # duty per C of setpoint above the pre-pulse temperature
+SMA_PWM_FREQ         = 50      # Hz
+SMA_MAX_TEMP_C       = 90.0    # Hard over-temperature cut-off in every mode
+CONTROL_INTERVAL     = 0.25    # seconds between thermocouple samples / control updates on the Pi (<= SEND_INTERVAL)
+
 # Error handling configuration
-MAX_CONSECUTIVE_ERRORS = 10 # Exit after this many consecutive errors
+MAX_CONSECUTIVE_ERRORS = 10 # Close a rig's session after this many consecutive errors
+
+# Wire protocol versions offered to the Pi (see wire_protocol.py), most preferred first
+PROTOCOL_VERSIONS    = SUPPORTED_PROTOCOLS
+HANDSHAKE_TIMEOUT    = 5.0     # seconds to wait for the Pi's protocol reply
+
+# Clock synchronization with the Pi (NTP-style timestamp exchanges, see clock_sync.py)
+SYNC_ROUNDS          = 8       # exchanges per sync burst (the lowest round trip one is kept)
+SYNC_ROUND_GAP       = 0.02    # seconds between exchanges in a burst
+SYNC_REPLY_WAIT      = 1.0     # seconds to wait for late replies after the last exchange
+SYNC_REFRESH_SEC     = 10.0    # seconds between sync bursts during a run (tracks clock drift)
+SYNC_HISTORY         = 20      # bursts kept for the offset/drift fit
 
 
 # TODO: Add support for multiple ball types - currently only supports one ball type
@@ -88,71 +166,73 @@ MAX_CONSECUTIVE_ERRORS = 10 # Exit after this many consecutive errors
 # TODO: Implement multiple ball detection logic here
 # For now, we use the ball type and margins loaded from calibration file
 
-# Debug mode. Set to False to suppress debug output
-DEBUG = True    
+# Run mode:
+#   "debug"    - per-frame detection prints and the camera preview windows
+#   "headless" - production runs: no GUI, only rate-limited status lines
+RUN_MODE = "debug"
+DEBUG = RUN_MODE == "debug"
+PREVIEW = RUN_MODE == "debug"   # Camera preview windows (shown from their own thread)
+PREVIEW_FPS = 10                # Max preview refresh rate per camera
+STATUS_LOG_INTERVAL = 5.0       # Seconds between repeated status/warning lines of the same kind
+
+# Live telemetry for the web dashboard (server-sent events, see telemetry.py)
+TELEMETRY_ENABLED = True
+TELEMETRY_HOST = "127.0.0.1"    # Use "0.0.0.0" to serve dashboards on other machines
+TELEMETRY_PORT = 5006
 
 #################################### SETUP ####################################
 os.makedirs(FRAME_DIR, exist_ok=True)
-error_count = 0             # Counter for consecutive errors
 
-# Initialize cameras using openCV
-cams = []
+# Initialize cameras using openCV (all cameras of all rigs)
+ALL_CAMERA_IDS = sorted(set(CAMERA_IDS).union(*(rig["camera_ids"] for rig in RIGS.values())))
+cams = {}
 print("[INFO] Initializing cameras...")
-for cam_id in CAMERA_IDS:
+for cam_id in ALL_CAMERA_IDS:
     cam = cv2.VideoCapture(cam_id)
     if cam.isOpened():
         print(f"[INFO] Camera {cam_id} opened successfully")
     else:
         print(f"[ERROR] Camera {cam_id} failed to open")
-    cams.append(cam)
+    cams[cam_id] = cam
 
 # File naming convention
-def get_csv_path(run_index):
-    v_str = f"{str(Volts).replace('.', 'p')}V"
-    a_str = f"{str(Current).replace('.', 'p')}A"
-    g_str = f"{int(Load)}G"
-    return os.path.join(LOG_DIR, f"{v_str}_{a_str}_{g_str}_run_{run_index + 1}.csv")
-
-# Define socket for communication with Pi
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-server.bind((LISTEN_IP, LISTEN_PORT))
-server.listen(1)
-print(f"[INFO] Listening for Raspberry Pi on {LISTEN_IP}:{LISTEN_PORT}")
-conn, addr = server.accept()
-print(f"[INFO] Connected to Raspberry Pi at {addr}", flush=True)
-
-# Send configuration to Pi
-config_packet = {
-    "send_interval": SEND_INTERVAL,
-    "channels": TC_CHANNELS,
-    "tc_type": TC_TYPE,
-    "num_runs": NUM_RUNS,
-    "run_time": INTER_RUN_DELAY,
-    "lead_time": LEAD_TIME,
-    "target_temp_c": TARGET_TEMP_C,
-    "max_heat_time": MAX_HEAT_TIME,
-    "end_temp_margin": END_TEMP_MARGIN
-}
-conn.sendall(json.dumps(config_packet).encode())
+def get_csv_path(run_index, volts=Volts, current=Current, load=Load, rig_name=None):
+    v_str = f"{str(volts).replace('.', 'p')}V"
+    a_str = f"{str(current).replace('.', 'p')}A"
+    g_str = f"{int(load)}G"
+    rig_str = f"{rig_name}_" if rig_name else ""
+    return os.path.join(LOG_DIR, f"{rig_str}{v_str}_{a_str}_{g_str}_run_{run_index + 1}.csv")
 
-def read_socket_line():
-    """Read a line from the socket with proper error handling."""
-    global error_count
-    try:
-        data = conn.recv(1024).decode().strip()
-        if data:  # Reset error count on successful read
-            error_count = 0
-        return data
-    except socket.timeout:
-        return None
-    except Exception as e:
-        error_count += 1
-        if error_count >= MAX_CONSECUTIVE_ERRORS:
-            print(f"[FATAL] Too many consecutive errors ({error_count}). Exiting program.")
-            cleanup_and_exit()
-        print(f"[ERROR] Socket read error: {e}")
-        return None
+# Sweep file from the command line: python auto_dataCollection_Host.py sweep.json
+if len(sys.argv) > 1 and sys.argv[1].endswith(".json"):
+    CAMPAIGN_SWEEP = load_sweep(sys.argv[1])
+    AUTO_START = True
+    print(f"[INFO] Loaded campaign sweep from {sys.argv[1]}: {CAMPAIGN_SWEEP}")
+
+# Configuration sent to every Pi on connection
+def build_config_packet(num_runs=NUM_RUNS):
+    return {
+        "send_interval": SEND_INTERVAL,
+        "channels": TC_CHANNELS,
+        "tc_type": TC_TYPE,
+        "num_runs": num_runs,
+        "run_time": INTER_RUN_DELAY,
+        "lead_time": LEAD_TIME,
+        "target_temp_c": TARGET_TEMP_C,
+        "max_heat_time": MAX_HEAT_TIME,
+        "end_temp_margin": END_TEMP_MARGIN,
+        "sample_interval": min(CONTROL_INTERVAL, SEND_INTERVAL),
+        "control_mode": SMA_CONTROL_MODE,
+        "sma_profile": SMA_PROFILE,
+        "pid_gains": SMA_PID_GAINS,
+        "feed_forward": SMA_FEED_FORWARD,
+        "pwm_freq": SMA_PWM_FREQ,
+        "max_temp_c": SMA_MAX_TEMP_C,
+        "batch_size": BATCH_SIZE,
+        "batch_window_ms": BATCH_WINDOW_MS,
+        "protocol_versions": PROTOCOL_VERSIONS,
+        "channel_slots": NUM_CHANNELS
+    }
 
 ############################# CAMERA PROCESSING ###############################
 # def detect_position(frame):
@@ -272,22 +352,11 @@ def load_templates(template_files):
     
     return templates
 
-# Template-based position detection
-def detect_position_with_templates(frame, templates):
-    best_val = -1
-    best_loc = None
-    best_temp = None
-    for temp in templates:
-        if frame.shape[0] < temp.shape[0] or frame.shape[1] < temp.shape[1]:
-            continue
-        res = cv2.matchTemplate(frame, temp, cv2.TM_CCOEFF_NORMED)
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-        if max_val > best_val:
-            best_val = max_val
-            best_loc = max_loc
-            best_temp = temp
-    if best_loc is not None and best_temp is not None:
-        h, w = best_temp.shape[:2]
+# Template-based position detection (coarse-to-fine, e.g. with ball_detector.matcher)
+def detect_position_with_templates(frame, matcher):
+    best_loc, best_val, best_shape = matcher.match(frame)
+    if best_loc is not None:
+        h, w = best_shape[:2]
         center = (best_loc[0] + w//2, best_loc[1] + h//2)
         return center, best_val
     return None, None
@@ -300,517 +369,833 @@ print(f"[DEBUG] Template files: {template_files}")
 templates = load_templates(template_files)
 print(f"[DEBUG] Number of templates loaded: {len(templates)}")
 
+# Detector with the HSV bounds, kernels and scratch buffers set up once for all frames
+ball_detector = BallDetector(templates, hsv_lower1, hsv_upper1, hsv_lower2, hsv_upper2)
+print(f"[INFO] Ball detector ready ({'single-pass' if ball_detector.single_pass else 'two-pass'} HSV threshold)")
+ball_trackers = {cam_id: BallTracker(ball_detector, TRACK_SEARCH_MARGIN, TRACK_MIN_CONFIDENCE)
+                 for cam_id in ALL_CAMERA_IDS}
+
 # TODO: Future enhancement - use camera_id from calibration file for multi-camera support
 # For now, CAMERA_IDS is still manually defined at the top of the script
 if camera_id is not None:
     print(f"[INFO] Calibration used camera ID: {camera_id}")
     print(f"[INFO] Host script using camera IDs: {CAMERA_IDS}")
 
-# Update capture_position to use template matching (identical logic to calibration script)
-def capture_position():
-    """Capture position data from all cameras using color mask + template matching (identical to calibration tool)."""
-    top_x, top_y = None, None
-    z_positions = []
-    for idx, cam in enumerate(cams):
-        ret, frame = cam.read()
-        if not ret:
-            z_positions.append(None)
-            continue
-        
-        # Step 1: Apply color filtering FIRST (identical to calibration script)
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        # Use calibrated HSV ranges from calibration file
-        global hsv_lower1, hsv_upper1, hsv_lower2, hsv_upper2
-        if hsv_lower1 is not None and hsv_upper1 is not None and hsv_lower2 is not None and hsv_upper2 is not None:
-            # Use the HSV ranges directly as loaded from calibration file
-            lower1 = np.array(hsv_lower1, dtype=np.uint8)
-            upper1 = np.array(hsv_upper1, dtype=np.uint8)
-            lower2 = np.array(hsv_lower2, dtype=np.uint8)
-            upper2 = np.array(hsv_upper2, dtype=np.uint8)
+# Rate-limited status lines, and the optional preview (HighGUI runs only in the preview thread)
+status_log = StatusLog(STATUS_LOG_INTERVAL)
+preview = PreviewWindow(PREVIEW_FPS) if PREVIEW else None
+telemetry = None    # TelemetryServer, started in main() when TELEMETRY_ENABLED
+
+# Template matching on a single camera frame (identical logic to calibration script)
+def locate_ball(idx, frame, frame_ts):
+    """Locate the ball in one camera frame using color mask + template matching. Returns (x_mm, y_mm, match_val)."""
+    window = None
+    if TRACKING_MODE:
+        best_rect, best_val, mask, blob_rects, window = ball_trackers[idx].detect(frame, frame_ts)
+    else:
+        best_rect, best_val, mask, blob_rects = ball_detector.detect(frame)
+
+    # Debug: Show mask, contour and template matching information
+    if DEBUG:
+        mask_pixels = cv2.countNonZero(mask)
+        total_pixels = mask.shape[0] * mask.shape[1]
+        mask_percent = (mask_pixels / total_pixels) * 100
+        area = f"tracking window {window}" if window is not None else "frame"
+        print(f"[DEBUG] Camera {idx}: HSV mask covers {mask_pixels} pixels ({mask_percent:.1f}% of {area})")
+        print(f"[DEBUG] Camera {idx}: Found {len(blob_rects)} contours")
+        for i, (x, y, w, h) in enumerate(blob_rects):
+            print(f"[DEBUG] Camera {idx}: Contour {i}: {w}x{h} at ({x},{y})")
+        if best_rect is not None:
+            print(f"[DEBUG] Camera {idx}: Best template match value: {best_val:.3f}")
         else:
-            print("[ERROR] HSV ranges not loaded from calibration file")
-            z_positions.append(None)
-            continue
-            
-        # Step 2: Create two HSV masks and combine them (identical to calibration script)
-        mask1 = cv2.inRange(hsv, lower1, upper1)
-        mask2 = cv2.inRange(hsv, lower2, upper2)
-        mask = cv2.bitwise_or(mask1, mask2)
-        
-        # Debug: Show HSV mask statistics
-        if DEBUG:
-            mask_pixels = cv2.countNonZero(mask)
-            total_pixels = mask.shape[0] * mask.shape[1]
-            mask_percent = (mask_pixels / total_pixels) * 100
-            print(f"[DEBUG] Camera {idx}: HSV mask covers {mask_pixels} pixels ({mask_percent:.1f}% of frame)")
-        
-        # Step 3: Morphological operations to clean up the mask (identical to calibration script)
-        kernel = np.ones((5,5), np.uint8)
-        mask = cv2.erode(mask, kernel, iterations=1)
-        mask = cv2.dilate(mask, kernel, iterations=2)
-        
-        # Step 4: Find contours (blobs = connected regions of pixels) (identical to calibration script)
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Debug: Show contour information
+            print(f"[DEBUG] Camera {idx}: No template match found (best_val: {best_val})")
+
+    # Convert to mm (identical to calibration script)
+    center = None
+    if best_rect is not None:
+        # Sub-pixel center (the match corner is refined on the correlation peak)
+        center = ((best_rect[0][0] + best_rect[1][0]) / 2,
+                  (best_rect[0][1] + best_rect[1][1]) / 2)
         if DEBUG:
-            print(f"[DEBUG] Camera {idx}: Found {len(contours)} contours")
-            for i, cnt in enumerate(contours):
-                x, y, w, h = cv2.boundingRect(cnt)
-                print(f"[DEBUG] Camera {idx}: Contour {i}: {w}x{h} at ({x},{y})")
-        
-        # Step 5: Template matching ONLY on color-filtered regions (identical to calibration script)
-        best_val = -1
-        best_loc = None
-        best_temp = None
-        best_rect = None
-        valid_contours = 0
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            if w < 10 or h < 10:
-                continue  # Ignore tiny blobs
-            valid_contours += 1
-            roi = frame[y:y+h, x:x+w]
-            for temp in templates:
-                if roi.shape[0] < temp.shape[0] or roi.shape[1] < temp.shape[1]:
-                    continue  # Skip if ROI is smaller than template
-                res = cv2.matchTemplate(roi, temp, cv2.TM_CCOEFF_NORMED)
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
-                if max_val > best_val:
-                    best_val = max_val
-                    best_loc = (x + max_loc[0], y + max_loc[1])
-                    best_temp = temp
-                    best_rect = (best_loc, (best_loc[0] + temp.shape[1], best_loc[1] + temp.shape[0]))
-        
-        # Debug: Show template matching results
+            print(f"[DEBUG] Camera {idx}: Template+mask match at pixel=({center[0]:.2f}, {center[1]:.2f}), match_val={best_val:.2f}")
+        # Convert to mm using calibrated pixels_per_mm_ball
+        x_mm = center[0] / pixels_per_mm_ball
+        y_mm = center[1] / pixels_per_mm_ball
+        match_val = float(best_val)
+    else:
+        x_mm, y_mm, match_val = None, None, None
         if DEBUG:
-            print(f"[DEBUG] Camera {idx}: {valid_contours} valid contours processed for template matching")
-            if best_rect is not None:
-                print(f"[DEBUG] Camera {idx}: Best template match value: {best_val:.3f}")
-            else:
-                print(f"[DEBUG] Camera {idx}: No template match found (best_val: {best_val})")
-        
-        # Step 6: Draw detection and convert to mm (identical to calibration script)
-        debug_frame = frame.copy() if DEBUG else None
-        if best_rect is not None:
-            # Draw rectangle and circle for debug
-            if DEBUG:
-                cv2.rectangle(debug_frame, best_rect[0], best_rect[1], (0,255,0), 2)
-                center = (best_rect[0][0] + (best_rect[1][0] - best_rect[0][0])//2,
-                          best_rect[0][1] + (best_rect[1][1] - best_rect[0][1])//2)
-                cv2.circle(debug_frame, center, 5, (0,0,255), -1)
-                print(f"[DEBUG] Camera {idx}: Template+mask match at pixel={center}, match_val={best_val:.2f}")
-            # Convert to mm using calibrated pixels_per_mm_ball
-            x_mm = (best_rect[0][0] + (best_rect[1][0] - best_rect[0][0])//2) / pixels_per_mm_ball
-            y_mm = (best_rect[0][1] + (best_rect[1][1] - best_rect[0][1])//2) / pixels_per_mm_ball
+            print(f"[DEBUG] Camera {idx}: No template+mask match found.")
         else:
-            x_mm, y_mm = None, None
-            if DEBUG:
-                print(f"[DEBUG] Camera {idx}: No template+mask match found.")
-        
-        if DEBUG:
-            cv2.imshow(f"Camera {idx} Debug", debug_frame)
-            cv2.imshow(f"Camera {idx} Mask", mask)
-            cv2.waitKey(1)
-        
+            status_log.log("no ball match", level="WARN", tag=f"Camera {idx}: ", best_val=best_val)
+
+    # The preview copies the frame and mask (a detector scratch buffer) only when it is due to redraw
+    if preview is not None:
+        preview.submit(idx, frame, mask, best_rect, center, window)
+
+    return x_mm, y_mm, match_val
+
+def combine_camera_positions(capture_ts, results):
+    """Combine per-camera (x_mm, y_mm, match_val) results into one (timestamp, x, y, z, match_conf) position sample."""
+    top_x, top_y, top_conf = None, None, None
+    z_positions = []
+    for idx, result in enumerate(results):
+        x_mm, y_mm, match_val = result if result is not None else (None, None, None)
         if idx == 0:
-            top_x, top_y = x_mm, y_mm
+            top_x, top_y, top_conf = x_mm, y_mm, match_val
         else:
             z_positions.append(y_mm if y_mm is not None else None)
     
     z_avg = round(sum(z for z in z_positions if z is not None) / max(len([z for z in z_positions if z is not None]), 1), 2)
-    from datetime import timezone
-    return datetime.now(timezone.utc).isoformat(), top_x, top_y, z_avg
+    return capture_ts, top_x, top_y, z_avg, top_conf   # Confidence of the top (X/Y) camera match
 
 
-############################# DATA IMPORT FROM Pi #############################
-def recv_temp_packet():
-    """Receive and decode thermocouple data."""
-    try:
-        raw = read_socket_line()
-        if raw is None:
-            return None, None
-        pkt = json.loads(raw)
-        timestamp = pkt["timestamp"]
-        temps = pkt.get("temperatures_C", {})
-        temps["sma_active"] = pkt.get("sma_active", "")
-        ts = parser.isoparse(timestamp)
-       
-        # Adjust Pi timestamp using calculated offset
-        ts = ts - timedelta(seconds=time_offset)  # Use time_offset instead of rtt_offset
-        return ts, temps
-    except Exception as e:
-        if not isinstance(e, socket.timeout):
-            print(f"[ERROR] Failed to decode packet: {e}")
-        return None, None
+################################# RIG SESSIONS ################################
+cameras_in_use = set()      # Camera IDs owned by a connected rig
+finished_campaigns = set()  # (rig, sweep id) of campaigns completed since the host started
 
-################################ DATA COLLECTION ##############################
-thermo_buffer   = deque(maxlen=THERMO_BUFFER_SIZE)
-position_buffer = deque(maxlen=POSITION_BUFFER_SIZE)
+class RigSession:
+    """Run state machine for one connected Pi: its cameras, buffers, and CSV output."""
 
-def run_data_collection(run_index):
-    global thermo_buffer, position_buffer, time_offset
-    
-    print(f"\n[DEBUG] Starting run {run_index + 1}")
-    
-    # Initialize buffers for this run
-    thermo_buffer.clear()
-    position_buffer.clear()
-    time_offset = 0.0
-    
-    print(f"[DEBUG] Initial buffer states: thermo={len(thermo_buffer)}, position={len(position_buffer)}")
-    
-    # Set socket timeout for the entire run
-    conn.settimeout(0.1)  # 100ms timeout for the entire run
-    
-    try:
-        # 1. Wait for 'ready' from Pi
-        print(f"[INFO] Waiting for 'ready' from Pi before starting run {run_index + 1}...")
-        while True:
+    def __init__(self, stream, addr, rig):
+        self.stream = stream
+        self.addr = addr
+        self.name = rig.get("name")
+        self.tag = f"[{self.name or addr[0]}] "
+        self.camera_ids = list(rig.get("camera_ids", CAMERA_IDS))
+        self.volts = rig.get("volts", Volts)
+        self.current = rig.get("current", Current)
+        self.load = rig.get("load", Load)
+        self.sweep = rig.get("sweep", CAMPAIGN_SWEEP) or single_setup_sweep(self.volts, self.current, self.load, NUM_RUNS)
+        self.steps = expand_sweep(self.sweep)
+        self.campaign_key = (self.name or addr[0], sweep_id(self.sweep))
+        self.journal = None                # Opened by open_campaign() once the connection is accepted
+        self.row_writer = None
+        self.last_ambient = None           # Pre-run ambient of the last run (fallback when a run has no pre-pulse readings)
+        self.cooling_event = asyncio.Event()   # Set when the SMA turns off (the next setup is prepared meanwhile)
+        self.state = "connected"
+        self.run_number = None
+        self.error_count = 0               # Counter for consecutive errors
+        self.clock = ClockSync(SYNC_HISTORY)   # Pi clock offset and drift, kept across runs
+        self.clock_sync_supported = False  # Pi answers "sync_req" exchanges
+        self.sync_task = None
+        self.thermo_buffer = deque(maxlen=THERMO_BUFFER_SIZE)
+        self.position_buffer = PositionRingBuffer(POSITION_BUFFER_SIZE, n_fields=4)   # x, y, z, match_conf
+        self.pipeline = None
+
+    def open_campaign(self):
+        """
+        Open the campaign journal (salvaging interrupted runs) and start the row writer.
+        Only called for accepted connections: recovery truncates and renames run CSVs,
+        which must never happen under a live session of the same rig.
+        """
+        if CAMPAIGN_RESUME:
+            journal_path = os.path.join(LOG_DIR, f"campaign_journal_{self.campaign_key[0]}_{self.campaign_key[1]}.jsonl")
+            self.journal = RunJournal(journal_path)
+            for key, partial, rows in self.journal.recover_interrupted():
+                print(f"[WARN] {self.tag}Run {key} was interrupted. Kept {rows} checkpointed rows in {partial}; repeating the run.")
+            done = len(self.steps) - len(self.journal.remaining(self.steps))
+            if done:
+                print(f"[INFO] {self.tag}Resuming campaign: {done} of {len(self.steps)} runs already done")
+            self.steps = self.journal.remaining(self.steps)
+        campaign = None
+        if CAMPAIGN_STORAGE:
+            if storage_available():
+                campaign = CampaignWriter(CAMPAIGN_DIR, self.name, CAMPAIGN_BATCH_ROWS)
+            else:
+                print(f"[WARN] {self.tag}pyarrow is not installed. Campaign storage disabled (CSV only).")
+        self.row_writer = RunWriter(campaign, WRITER_QUEUE_SIZE, WRITER_FLUSH_INTERVAL, WRITER_FLUSH_ROWS,
+                                    name=f"writer-{self.campaign_key[0]}",
+                                    checkpoint=self.journal.checkpoint if self.journal is not None else None)
+        self.row_writer.start()
+
+    def set_state(self, state):
+        self.state = state
+        if DEBUG:
+            print(f"[DEBUG] {self.tag}State -> {state}")
+        self.publish("state", state=state, volts=self.volts, current=self.current, load=self.load)
+
+    def publish(self, event, **data):
+        """Send a live telemetry event for this rig to the dashboard."""
+        if telemetry is not None:
+            telemetry.publish(event, {"rig": self.name or self.addr[0], "run": self.run_number, **data})
+
+    ########################## Connection and Handshake #######################
+    async def handshake(self):
+        """Send the configuration to the Pi and negotiate the wire protocol version."""
+        await self.stream.send_json(build_config_packet(len(self.steps)))
+        reply = await self.stream.recv_message(timeout=HANDSHAKE_TIMEOUT)
+        # Pi clients without negotiation stay on protocol 1
+        if isinstance(reply, dict) and "protocol_version" in reply:
+            self.stream.set_version(reply["protocol_version"], reply.get("channel_slots", NUM_CHANNELS))
+            self.clock_sync_supported = reply.get("clock_sync", False)
+        else:
+            self.stream.set_version(PROTOCOL_JSON)
+        print(f"[INFO] {self.tag}Using wire protocol version {self.stream.version}")
+        if not self.clock_sync_supported:
+            print(f"[WARN] {self.tag}Pi does not support clock sync exchanges. Using a single pre-match offset per run.")
+        self.set_state("configured")
+
+    async def read_message(self, timeout=0.1):
+        """Read the next message from the Pi (str for commands, dict for samples) with proper error handling."""
+        try:
+            msg = await self.stream.recv_message(timeout=timeout)
+            if msg is not None:  # Reset error count on successful read
+                self.error_count = 0
+            if isinstance(msg, str) and msg.startswith("sync_resp:"):
+                # Clock sync replies are consumed here, wherever the session is reading
+                self.clock.handle_response(msg, time.time())
+                return None
+            return msg
+        except Exception as e:
+            self.error_count += 1
+            if self.error_count >= MAX_CONSECUTIVE_ERRORS:
+                print(f"[FATAL] {self.tag}Too many consecutive errors ({self.error_count}). Closing session.")
+                raise ConnectionResetError(f"Too many consecutive errors: {e}")
+            print(f"[ERROR] {self.tag}Socket read error: {e}")
+            await asyncio.sleep(0.1)
+            return None
+
+    ################################ Cameras ##################################
+    def start_cameras(self):
+        """Start one grabber thread per assigned camera, position extraction on a worker pool."""
+        rig_cams = [cams[cam_id] for cam_id in self.camera_ids]
+        self.pipeline = PositionPipeline(rig_cams,
+                                         lambda idx, frame, frame_ts: locate_ball(self.camera_ids[idx], frame, frame_ts),
+                                         combine_camera_positions,
+                                         sample_interval=POSITION_SAMPLE_RATE,
+                                         max_workers=POSITION_WORKERS)
+        self.pipeline.start()
+        print(f"[INFO] {self.tag}Using camera IDs: {self.camera_ids}")
+
+    async def capture_position(self, timeout=2.0):
+        """Return the first position sample captured after this call (not a stale one from before the move)."""
+        requested = time.time()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.pipeline.latest_sample, timeout, requested)
+
+    ############################## CSV Output #################################
+    def open_csv(self, run_index):
+        csv_path = get_csv_path(run_index, self.volts, self.current, self.load, self.name)
+        fieldnames = ['time_ms', 'x_mm', 'y_mm', 'temp_ch0', 'temp_ch1', 'temp_ch2', 'temp_ch3', 'sma_active', 'align_err_ms', 'match_conf']
+        self.row_writer.open_run(csv_path, fieldnames, run_index, self.volts, self.current, self.load)
+        self.run_number = run_index + 1
+        print(f"[INFO] {self.tag}Starting run {run_index + 1} with CSV file: {csv_path}")
+        return csv_path
+
+    def write_row(self, row):
+        """Queue one aligned row for the run's CSV file and the campaign dataset."""
+        if not self.row_writer.write(row):
+            status_log.log("writer queue full, dropped row", level="WARN", tag=self.tag,
+                           dropped=self.row_writer.dropped_rows)
+        self.publish("sample", **row)
+
+    async def close_csv(self, run_index):
+        """Wait until the writer has flushed, fsync'ed and closed this run's files."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.row_writer.close_run)
+        print(f"[INFO] {self.tag}Closed CSV file for run {run_index + 1} (writer: {self.row_writer.stats()})")
+
+    ############################## Clock Sync #################################
+    async def send_sync_burst(self):
+        """Send SYNC_ROUNDS timestamp exchanges, then refit the clock offset and drift.
+
+        Replies are picked up by read_message(), so a burst can run while the
+        data collection loop is reading samples.
+        """
+        for _ in range(SYNC_ROUNDS):
+            await self.stream.send_text(self.clock.new_request())
+            await asyncio.sleep(SYNC_ROUND_GAP)
+        await asyncio.sleep(SYNC_REPLY_WAIT)
+        if not self.clock.finish_burst():
+            print(f"[WARN] {self.tag}No clock sync replies from Pi. Keeping previous offset.")
+        elif DEBUG:
+            print(f"[DEBUG] {self.tag}Clock sync: offset={self.clock.offset_at(time.time())*1000:.2f} ms, "
+                  f"drift={self.clock.drift*1e6:.1f} ppm, rtt={self.clock.delay*1000:.2f} ms")
+
+    async def sync_clock(self):
+        """Run one sync burst while reading the Pi's replies (nothing else is being read)."""
+        burst = asyncio.create_task(self.send_sync_burst())
+        while not burst.done():
+            await self.read_message(timeout=0.05)
+        await burst
+
+    def start_sync_refresh(self):
+        """Start a background sync burst unless one is already running."""
+        if self.clock_sync_supported and (self.sync_task is None or self.sync_task.done()):
+            self.sync_task = asyncio.create_task(self.send_sync_burst())
+
+    async def stop_sync_refresh(self):
+        if self.sync_task is not None and not self.sync_task.done():
+            self.sync_task.cancel()
             try:
-                raw = read_socket_line()
-                if raw is None:
-                    continue
-                msg = raw.strip()
-                print(f"[DEBUG] Received message during handshake: '{msg}'")
-                if msg == 'ready':
-                    break
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"[ERROR] Error during handshake: {e}")
-                return
+                await self.sync_task
+            except asyncio.CancelledError:
+                pass
+        self.sync_task = None
+
+    ############################## DATA COLLECTION ############################
+    async def run_data_collection(self, run_index):
+        """Collect one run. Returns True if the run finished (relaxation or run timeout)."""
+        thermo_buffer = self.thermo_buffer
+        position_buffer = self.position_buffer
+
+        print(f"\n[DEBUG] {self.tag}Starting run {run_index + 1}")
+
+        # Initialize buffers for this run
+        thermo_buffer.clear()
+        position_buffer.clear()
+
+        print(f"[DEBUG] {self.tag}Initial buffer states: thermo={len(thermo_buffer)}, position={len(position_buffer)}")
 
-        print("[INFO] Received 'ready' from Pi. Proceeding with pre-match sync.")
-        
-        # 2. Pre-match sync
-        print("[INFO] Sending 'sync' to Pi and capturing pre-match position sample...")
-        conn.sendall(b"sync\n")
-        
-        # Capture position sample
-        position_sample = capture_position()
-        if position_sample is None:
-            print("[ERROR] Failed to capture pre-match position sample")
-            return
-        print("[INFO] Pre-match position sample captured")
-        
-        # Get sync timestamp from Pi
         try:
-            raw = read_socket_line()
-            if raw is None:
-                print("[ERROR] No sync response from Pi")
+            # 1. Wait for 'ready' from Pi
+            self.set_state("waiting_ready")
+            print(f"[INFO] {self.tag}Waiting for 'ready' from Pi before starting run {run_index + 1}...")
+            while True:
+                try:
+                    msg = await self.read_message()
+                    if msg is None:
+                        continue
+                    print(f"[DEBUG] {self.tag}Received message during handshake: '{msg}'")
+                    if msg == 'ready':
+                        break
+                except Exception as e:
+                    print(f"[ERROR] {self.tag}Error during handshake: {e}")
+                    return
+
+            print(f"[INFO] {self.tag}Received 'ready' from Pi. Proceeding with pre-match sync.")
+
+            # 2. Pre-match sync
+            self.set_state("syncing")
+            if self.clock_sync_supported:
+                print(f"[INFO] {self.tag}Running clock sync burst ({SYNC_ROUNDS} exchanges)...")
+                await self.sync_clock()
+            print(f"[INFO] {self.tag}Sending 'sync' to Pi and capturing pre-match position sample...")
+            await self.stream.send_text("sync")
+
+            # Capture position sample
+            position_sample = await self.capture_position()
+            if position_sample is None:
+                print(f"[ERROR] {self.tag}Failed to capture pre-match position sample")
                 return
-            msg = raw.strip()
-            print(f"[DEBUG] Raw sync message from Pi: '{msg}'")
-            
-            if not msg.startswith('sync_ts:'):
-                print(f"[ERROR] Invalid sync message format: {msg}")
+            print(f"[INFO] {self.tag}Pre-match position sample captured")
+
+            # Get sync timestamp from Pi (ends the Pi's pre-match phase)
+            try:
+                msg = None
+                sync_deadline = time.time() + 2.0
+                while msg is None and time.time() < sync_deadline:
+                    msg = await self.read_message()
+                if msg is None:
+                    print(f"[ERROR] {self.tag}No sync response from Pi")
+                    return
+                print(f"[DEBUG] {self.tag}Raw sync message from Pi: '{msg}'")
+
+                if not isinstance(msg, str) or not msg.startswith('sync_ts:'):
+                    print(f"[ERROR] {self.tag}Invalid sync message format: {msg}")
+                    return
+
+                pi_ts = float(msg.split(':')[1])
+                host_ts = time.time()
+                if not self.clock.synced or not self.clock_sync_supported:
+                    # Fallback: one-way offset from the legacy sync reply
+                    self.clock.set_offset(pi_ts - host_ts)
+
+                time_offset = self.clock.offset_at(host_ts)
+                if self.clock.delay is not None:
+                    print(f"[INFO] {self.tag}Measured RTT: {self.clock.delay*1000:.1f} ms")
+                print(f"[INFO] {self.tag}Calculated time offset (Pi - Host): {time_offset*1000:.1f} ms, drift: {self.clock.drift*1e6:.1f} ppm")
+
+                if abs(time_offset) > 0.1:  # 100ms threshold
+                    print(f"[WARN] {self.tag}Pi clock is more than 100ms off the host clock. Pi timestamps are corrected, but check NTP on the Pi.")
+
+            except Exception as e:
+                print(f"[ERROR] {self.tag}Failed to process sync response: {e}")
                 return
-                
-            pi_ts = float(msg.split(':')[1])
-            host_ts = time.time()
-           
-            # Convert position_sample[0] (ISO string) to float timestamp
-            host_pos_ts = parser.isoparse(position_sample[0]).timestamp()
-            rtt = (host_ts - host_pos_ts) * 1000  # Convert to ms
-            time_offset = pi_ts - host_ts
-            
-            print(f"[INFO] Measured RTT: {rtt:.1f} ms")
-            print(f"[INFO] Calculated time offset (Pi - Host): {time_offset*1000:.1f} ms")
-            
-            if abs(time_offset) > 0.1:  # 100ms threshold
-                print("[WARN] Pre-match offset is greater than 100ms. Check network latency or system load.")
-                
-        except Exception as e:
-            print(f"[ERROR] Failed to process sync response: {e}")
-            return
-
-        # 3. Lead-in time
-        print("[INFO] Waiting for lead-in time (2.0 seconds) to synchronize with Pi...")
-        time.sleep(2.0)
-        print("[INFO] Lead-in complete. Sending 'trigger' to Pi and starting main data collection loop.")
-        conn.sendall(b"trigger\n")
-        
-        # 4. Main data collection loop
-        matches = 0
-        sma_start_time = None
-        run_start_time = time.time()
-        heating_phase_active = False
-        relaxation_detected = False
-        ambient_temp = None
-        last_temp = None
-        initial_ambient_reported = False
-
-        # Helper to convert position_buffer timestamp to float
-        def get_pos_ts(pos):
-            return parser.isoparse(pos[0]).timestamp()
-
-        while True:
-            # Exit if relaxation is detected
-            if relaxation_detected:
-                print(f"[INFO] SMA relaxation detected. Ending run.")
-                break
 
-            # Overall safety timeout based on the inter-run delay
-            if time.time() - run_start_time > (INTER_RUN_DELAY + MAX_HEAT_TIME + 10): # Add buffer for safety
-                print("[WARN] Run exceeded max time. Ending run for safety.")
-                break
+            # 3. Lead-in time
+            self.set_state("lead_in")
+            print(f"[INFO] {self.tag}Waiting for lead-in time (2.0 seconds) to synchronize with Pi...")
+            await asyncio.sleep(2.0)
+            print(f"[INFO] {self.tag}Lead-in complete. Sending 'trigger' to Pi and starting main data collection loop.")
+            await self.stream.send_text("trigger")
 
-            # a. Capture position data
-            position_sample = capture_position()
-            if position_sample is not None:
-                position_buffer.append(position_sample)
-            
-            # b. Receive thermocouple packet with timeout
-            try:
-                raw = read_socket_line()
-                if raw is None:
-                    # No temperature data received - this is normal, just continue
-                    continue
-                    
-                msg = raw.strip()
-                
-                # Check for SMA pulse start (accept both 'sma_start:' and 'pulse_start_ts:')
-                if msg.startswith('sma_start:') or msg.startswith('pulse_start_ts:'):
-                    try:
-                        sma_start_time = float(msg.split(':')[1])
-                        print(f"[INFO] SMA pulse start received from Pi, t=0 set at {sma_start_time}")
-                    except Exception as e:
-                        print(f"[ERROR] Failed to parse SMA pulse start time: {e}")
-                    continue
-                    
-                # Parse temperature data as JSON packet
+            # 4. Main data collection loop
+            self.set_state("collecting")
+            matches = 0
+            sma_start_time = None
+            run_start_time = time.time()
+            heating_phase_active = False
+            relaxation_detected = False
+            ambient_temp = None
+            ambient_readings = []       # ch0 readings before the pulse (true pre-run ambient)
+            cooling_started = False
+            cooling_start_ts = None
+            cooling_fit = None          # Only with a known ambient (never the post-pulse reading)
+            predicted_end = None
+            recent_cooling = deque()    # (pi_ts, temp) of the last COOL_SETTLE_WINDOW seconds of cooling
+            pending_packets = deque()   # (thermo_ts, data, arrival_time) waiting for a later position sample
+            next_sync_time = run_start_time + SYNC_REFRESH_SEC
+
+            def write_row(thermo_ts, data, position, align_err_ms):
+                """Write one aligned thermo/position row to the CSV."""
+                nonlocal matches
+                matches += 1
+                if sma_start_time is None:
+                    if DEBUG:
+                        print(f"[DEBUG] {self.tag}Skipping CSV write: sma_start_time is None (thermo_ts={thermo_ts})")
+                    return
+                time_ms = (thermo_ts - sma_start_time) * 1000
+                if DEBUG:
+                    print(f"[DEBUG] {self.tag}Writing row to CSV: time_ms={time_ms}, x={position[1]}, y={position[2]}, conf={position[4]}, temps={[data['temperatures_C'].get(f'ch{i}') for i in range(4)]}, sma_active={data['sma_active']}, align_err_ms={align_err_ms:.1f}")
+                self.write_row({
+                    'time_ms': time_ms,
+                    'x_mm': position[1],
+                    'y_mm': position[2],
+                    'temp_ch0': data['temperatures_C'].get('ch0'),
+                    'temp_ch1': data['temperatures_C'].get('ch1'),
+                    'temp_ch2': data['temperatures_C'].get('ch2'),
+                    'temp_ch3': data['temperatures_C'].get('ch3'),
+                    'sma_active': data['sma_active'],
+                    'align_err_ms': round(align_err_ms, 1),
+                    'match_conf': round(position[4], 3) if position[4] is not None else None
+                })
+
+            def match_nearest(thermo_ts, data):
+                """Snap a packet to the closest position sample within ALIGNMENT_WINDOW_MS."""
+                if len(position_buffer) == 0:
+                    if DEBUG:
+                        print(f"[DEBUG] {self.tag}No position data available for thermo ts: {thermo_ts:.3f}")
+                    return
+                closest_pos, delta = position_buffer.nearest(thermo_ts, ALIGNMENT_WINDOW_MS)
+                if DEBUG:
+                    print(f"[DEBUG] {self.tag}Thermo ts: {thermo_ts:.3f}, Closest position delta: {delta:.1f} ms")
+                if closest_pos is not None:
+                    write_row(thermo_ts, data, closest_pos, delta)
+                elif DEBUG:
+                    print(f"[DEBUG] {self.tag}Position/thermo mismatch: delta={delta:.1f}ms > {ALIGNMENT_WINDOW_MS}ms")
+
+            def resolve_pending(force=False):
+                """Interpolate position for packets that now have a position sample on either side."""
+                now = time.time()
+                newest_ts = position_buffer.newest_ts()
+                while pending_packets:
+                    thermo_ts, data, arrival_time = pending_packets[0]
+                    bracketed = newest_ts is not None and newest_ts >= thermo_ts
+                    if not bracketed and not force and now - arrival_time < MAX_INTERP_WAIT_SEC:
+                        break   # Wait for the camera pipeline to catch up
+                    pending_packets.popleft()
+                    position, align_err = position_buffer.interpolate(thermo_ts, ALIGNMENT_MODE, MAX_INTERP_GAP_MS)
+                    if position is not None:
+                        write_row(thermo_ts, data, position, align_err)
+                    else:
+                        # Not bracketed (e.g. camera dropout): fall back to the nearest sample
+                        match_nearest(thermo_ts, data)
+
+            while True:
+                # Exit if relaxation is detected
+                if relaxation_detected:
+                    print(f"[INFO] {self.tag}SMA relaxation detected. Ending run.")
+                    # Let the Pi finish its run now rather than at its fixed run time
+                    await self.stream.send_text("end run")
+                    break
+
+                # Overall safety timeout based on the inter-run delay
+                if time.time() - run_start_time > (INTER_RUN_DELAY + MAX_HEAT_TIME + 10): # Add buffer for safety
+                    print(f"[WARN] {self.tag}Run exceeded max time. Ending run for safety.")
+                    break
+
+                # Refresh the clock offset/drift estimate during long runs
+                if time.time() >= next_sync_time:
+                    self.start_sync_refresh()
+                    next_sync_time = time.time() + SYNC_REFRESH_SEC
+
+                # a. Collect finished position samples from the capture pipeline
+                for position_sample in self.pipeline.drain():
+                    position_buffer.append(position_sample)
+                if pending_packets:
+                    resolve_pending()
+
+                # b. Receive thermocouple packet with timeout
                 try:
-                    data = json.loads(msg)
-                    if "timestamp" in data and "temperatures_C" in data:
-                        # Report initial ambient temperature at start of trial
-                        if not initial_ambient_reported and not data.get('sma_active', False):
-                            initial_temp = data['temperatures_C'].get('ch0')
-                            if initial_temp is not None:
-                                print(f"[INFO] Initial ambient temperature: {initial_temp:.2f}°C")
-                                initial_ambient_reported = True
-                        
-                        # Detect SMA state changes and relaxation
-                        if "sma_active" in data:
-                            current_sma_state = data['sma_active']
-                            if not heating_phase_active and current_sma_state:
-                                heating_phase_active = True
-                                print("[INFO] Host detected SMA pulse start.")
-                            if heating_phase_active and not current_sma_state:
-                                print("[INFO] Host detected SMA pulse end. Monitoring for relaxation...")
-                        
-                        # Check for relaxation (temperature returned to ambient range)
-                        if heating_phase_active and not data.get('sma_active', False):
+                    msg = await self.read_message()
+                    if msg is None:
+                        # No temperature data received - this is normal, just continue
+                        continue
+
+                    # Check for SMA pulse start (accept both 'sma_start:' and 'pulse_start_ts:')
+                    if isinstance(msg, str) and (msg.startswith('sma_start:') or msg.startswith('pulse_start_ts:')):
+                        try:
+                            sma_start_time = self.clock.pi_to_host(float(msg.split(':')[1]))
+                            print(f"[INFO] {self.tag}SMA pulse start received from Pi, t=0 set at {sma_start_time}")
+                        except Exception as e:
+                            print(f"[ERROR] {self.tag}Failed to parse SMA pulse start time: {e}")
+                        continue
+
+                    # Temperature data packet (decoded by the wire protocol)
+                    if isinstance(msg, dict):
+                        data = msg
+                        if "timestamp" in data and "temperatures_C" in data:
                             current_temp = data['temperatures_C'].get('ch0')
-                            if current_temp is not None:
-                                if ambient_temp is None:
-                                    # Capture ambient temp from first reading after SMA turns off
-                                    ambient_temp = current_temp
-                                    print(f"[INFO] Captured ambient temperature: {ambient_temp:.2f}°C")
-                                elif last_temp is not None:
-                                    # Check if temperature has stabilized near ambient
-                                    temp_diff = abs(current_temp - ambient_temp)
-                                    if temp_diff <= END_TEMP_MARGIN:
+                            # Pre-run ambient: readings before the SMA pulse starts
+                            if not heating_phase_active and not data.get('sma_active', False) and current_temp is not None:
+                                if not ambient_readings:
+                                    print(f"[INFO] {self.tag}Initial ambient temperature: {current_temp:.2f}°C")
+                                ambient_readings.append(current_temp)
+
+                            # Detect SMA state changes and relaxation
+                            if "sma_active" in data:
+                                current_sma_state = data['sma_active']
+                                if not heating_phase_active and current_sma_state:
+                                    heating_phase_active = True
+                                    self.set_state("heating")
+                                    print(f"[INFO] {self.tag}Host detected SMA pulse start.")
+                                if heating_phase_active and not current_sma_state and not cooling_started:
+                                    cooling_started = True
+                                    cooling_start_ts = data['timestamp']
+                                    self.cooling_event.set()
+                                    self.set_state("cooling")
+                                    if ambient_readings:
+                                        ambient_temp = float(np.median(ambient_readings))
+                                        self.last_ambient = ambient_temp
+                                    elif self.last_ambient is not None:
+                                        ambient_temp = self.last_ambient
+                                        print(f"[WARN] {self.tag}No pre-pulse readings. Using the previous run's ambient ({ambient_temp:.2f}°C).")
+                                    if ambient_temp is not None:
+                                        cooling_fit = CoolingFit(ambient_temp, END_TEMP_MARGIN,
+                                                                 COOL_FIT_MIN_POINTS, COOL_FIT_MIN_SPAN)
+                                        print(f"[INFO] {self.tag}Host detected SMA pulse end. Monitoring for relaxation to {ambient_temp}°C ambient...")
+                                    else:
+                                        print(f"[WARN] {self.tag}Host detected SMA pulse end, but no ambient is known. "
+                                              f"Ending the run once the temperature settles (or at the timeout).")
+
+                            # Check for relaxation (temperature back within END_TEMP_MARGIN of the pre-run ambient)
+                            if cooling_started and not data.get('sma_active', False) and current_temp is not None:
+                                temp_diff = None
+                                if cooling_fit is not None:
+                                    cooling_fit.add(data['timestamp'], current_temp)
+                                    temp_diff = current_temp - ambient_temp
+                                    if cooling_fit.ready:
+                                        predicted_end = cooling_fit.predicted_end()
+                                        status_log.log("cooling", tag=self.tag, temp=current_temp, ambient=ambient_temp,
+                                                       tau_s=cooling_fit.time_constant(),
+                                                       eta_s=predicted_end - data['timestamp'])
+                                        self.publish("cooling", ambient=ambient_temp, tau_s=cooling_fit.time_constant(),
+                                                     eta_s=predicted_end - data['timestamp'])
+                                    if cooling_fit.n >= 2 and temp_diff <= END_TEMP_MARGIN:
                                         relaxation_detected = True
-                                        print(f"[INFO] Relaxation detected: temp={current_temp:.2f}°C, ambient={ambient_temp:.2f}°C, diff={temp_diff:.2f}°C")
-                                last_temp = current_temp
-                        
-                        thermo_ts = data['timestamp']
-                        thermo_buffer.append((thermo_ts, data))
-                        
-                        # Find closest position sample
-                        if position_buffer:
-                            closest_pos = min(position_buffer, key=lambda x: abs(get_pos_ts(x) - thermo_ts))
-                            delta = abs(get_pos_ts(closest_pos) - thermo_ts) * 1000  # Convert to ms
-                            print(f"[DEBUG] Thermo ts: {thermo_ts:.3f}, Closest position ts: {get_pos_ts(closest_pos):.3f}, Delta: {delta:.1f} ms")
-                            if delta <= ALIGNMENT_WINDOW_MS:
-                                matches += 1
-                                # Write to CSV
-                                if sma_start_time is not None:
-                                    time_ms = (thermo_ts - sma_start_time) * 1000
-                                    if DEBUG:
-                                        print(f"[DEBUG] Writing row to CSV: time_ms={time_ms}, x={closest_pos[1]}, y={closest_pos[2]}, temps={[data['temperatures_C'].get(f'ch{i}') for i in range(4)]}, sma_active={data['sma_active']}")
-                                    writer.writerow({
-                                        'time_ms': time_ms,
-                                        'x_mm': closest_pos[1],
-                                        'y_mm': closest_pos[2],
-                                        'temp_ch0': data['temperatures_C'].get('ch0'),
-                                        'temp_ch1': data['temperatures_C'].get('ch1'),
-                                        'temp_ch2': data['temperatures_C'].get('ch2'),
-                                        'temp_ch3': data['temperatures_C'].get('ch3'),
-                                        'sma_active': data['sma_active']
-                                    })
-                                    csv_file.flush()
-                                else:
-                                    if DEBUG:
-                                        print(f"[DEBUG] Skipping CSV write: sma_start_time is None (thermo_ts={thermo_ts})")
+                                        print(f"[INFO] {self.tag}Relaxation detected: temp={current_temp:.2f}°C, ambient={ambient_temp:.2f}°C, diff={temp_diff:.2f}°C")
+                                    elif (predicted_end is not None and data['timestamp'] >= predicted_end
+                                          and temp_diff <= END_TEMP_MARGIN + COOL_FIT_TOLERANCE
+                                          and abs(current_temp - cooling_fit.temperature_at(data['timestamp'])) <= COOL_FIT_TOLERANCE):
+                                        # Fit reached tolerance, and the reading is there too up to thermocouple noise
+                                        relaxation_detected = True
+                                        print(f"[INFO] {self.tag}Relaxation predicted by cooling fit: temp={current_temp:.2f}°C, "
+                                              f"fit={cooling_fit.temperature_at(data['timestamp']):.2f}°C, ambient={ambient_temp:.2f}°C, "
+                                              f"tau={cooling_fit.time_constant():.1f}s")
+                                if not relaxation_detected:
+                                    recent_cooling.append((data['timestamp'], current_temp))
+                                    while data['timestamp'] - recent_cooling[0][0] > COOL_SETTLE_WINDOW:
+                                        recent_cooling.popleft()
+                                    window_temps = [t for _, t in recent_cooling]
+                                    if (data['timestamp'] - cooling_start_ts >= COOL_SETTLE_WINDOW
+                                            and max(window_temps) - min(window_temps) <= COOL_SETTLE_DELTA):
+                                        relaxation_detected = True
+                                        above = f"{temp_diff:.2f}°C above the pre-run ambient" if temp_diff is not None else f"at {current_temp:.2f}°C"
+                                        print(f"[WARN] {self.tag}Temperature settled {above} "
+                                              f"(within {COOL_SETTLE_DELTA}°C for {COOL_SETTLE_WINDOW:.0f}s). Ending run.")
+
+                            thermo_ts = self.clock.pi_to_host(data['timestamp'])   # Pi clock -> host clock
+                            thermo_buffer.append((thermo_ts, data))
+
+                            # Align with position data
+                            if ALIGNMENT_MODE == "nearest":
+                                match_nearest(thermo_ts, data)
                             else:
-                                if DEBUG:
-                                    print(f"[DEBUG] Position/thermo mismatch: delta={delta:.1f}ms > {ALIGNMENT_WINDOW_MS}ms")
-                        else:
-                            if DEBUG:
-                                print(f"[DEBUG] No position data available for thermo ts: {thermo_ts:.3f}")
-                    # else: not a temperature packet, ignore
-                    
-                except json.JSONDecodeError:
-                    # Ignore non JSON packet messages for data collection
-                    pass
-            except socket.timeout:
-                continue
+                                pending_packets.append((thermo_ts, data, time.time()))
+                                resolve_pending()
+                        # else: not a temperature packet, ignore
+                    # else: other control messages are ignored during data collection
+                except Exception as e:
+                    print(f"[ERROR] {self.tag}Error in main loop: {e}")
+                    break
+
+                # c. Cleanup old data
+                current_time = time.time()
+                while thermo_buffer and current_time - thermo_buffer[0][0] > BUFFER_RETENTION_SEC:
+                    thermo_buffer.popleft()
+                cutoff_ts = current_time - BUFFER_RETENTION_SEC
+                if pending_packets:
+                    # Keep the samples that pending packets will be interpolated from
+                    cutoff_ts = min(cutoff_ts, pending_packets[0][0] - BUFFER_RETENTION_SEC)
+                position_buffer.discard_older_than(cutoff_ts)
+
+                status_log.log("status", tag=self.tag, run=run_index + 1, rows=matches,
+                               thermo=len(thermo_buffer), position=len(position_buffer),
+                               pending=len(pending_packets), writer_queue=self.row_writer.queue_depth(),
+                               writer_lag_ms=round(self.row_writer.lag_sec * 1000),
+                               dropped=self.row_writer.dropped_rows)
+
+            # Align any packets still waiting for a later position sample
+            resolve_pending(force=True)
+
+            print(f"[INFO] {self.tag}Run {run_index + 1} completed. Total matches: {matches}")
+            if matches == 0:
+                print(f"[WARN] {self.tag}No matches found! Check timestamp alignment and template matching.")
+            if DEBUG:
+                print(f"[DEBUG] {self.tag}Final buffer states: thermo={len(thermo_buffer)}, position={len(position_buffer)}")
+                # Print first few timestamps for manual inspection
+                print(f"[DEBUG] {self.tag}First 5 thermo timestamps:", [t[0] for t in list(thermo_buffer)[:5]])
+                print(f"[DEBUG] {self.tag}First 5 position timestamps:", [p[0] for p in position_buffer.oldest(5)])
+                print(f"[DEBUG] {self.tag}Buffer contents - Thermo: {list(thermo_buffer)}... Position: {position_buffer.oldest(len(position_buffer))}...")
+            return True
+
+        finally:
+            await self.stop_sync_refresh()
+            # Clear any remaining buffers
+            thermo_buffer.clear()
+            position_buffer.clear()
+
+    async def reset_pi(self):
+        """Send reset command to Pi and wait for acknowledgment."""
+        self.set_state("resetting")
+        try:
+            await self.stream.send_text("reset")
+            print(f"[INFO] {self.tag}Sent reset command to Pi")
+
+            # Wait for acknowledgment with timeout
+            msg = await self.read_message(timeout=5.0)
+            if msg is None:
+                print(f"[WARN] {self.tag}No response from Pi after reset command")
+            elif msg == "reset_ack":
+                print(f"[INFO] {self.tag}Pi acknowledged reset")
+            else:
+                print(f"[WARN] {self.tag}Unexpected response from Pi after reset: {msg}")
+
+        except Exception as e:
+            print(f"[WARN] {self.tag}Failed to reset Pi: {e}")
+
+    ################################ Run Loop #################################
+    async def prepare_setup(self, step, previous):
+        """Get the rig ready for `step` (runs while the previous run is cooling down). Returns False on failure."""
+        if previous is not None:
+            await self.cooling_event.wait()
+        if previous is not None and step.setup == previous.setup:
+            return True
+        print(f"[INFO] {self.tag}Next setup: {step.volts} V, {step.current} A, {step.load} g")
+        if CAMPAIGN_SETUP_COMMAND:
+            command = CAMPAIGN_SETUP_COMMAND.format(volts=step.volts, current=step.current, load=step.load,
+                                                    rig=self.name or self.addr[0])
+            proc = await asyncio.create_subprocess_shell(command)
+            if await proc.wait() != 0:
+                print(f"[ERROR] {self.tag}Setup command failed (exit code {proc.returncode}): {command}")
+                return False
+        if CAMPAIGN_PAUSE_ON_LOAD_CHANGE and previous is not None and step.load != previous.load:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, input, f"[READY] {self.tag}Change the load to {step.load} g, then press Enter...\n")
+        return True
+
+    async def run(self):
+        print(f"[INFO] {self.tag}Campaign: {len(self.steps)} runs to go")
+        prepared = asyncio.create_task(self.prepare_setup(self.steps[0], None)) if self.steps else None
+        for i, step in enumerate(self.steps):
+            if manual_exit_requested():
+                break
+            if not await prepared:
+                break
+            self.volts, self.current, self.load = step.setup
+            run_index = step.repeat
+            next_step = self.steps[i + 1] if i + 1 < len(self.steps) else None
+
+            # Set up CSV file for this run
+            csv_path = self.open_csv(run_index)
+            if self.journal is not None:
+                self.journal.start_run(step, csv_path)
+            self.cooling_event.clear()
+            # Prepare the next setup while this run cools down
+            if next_step is not None:
+                prepared = asyncio.create_task(self.prepare_setup(next_step, step))
+
+            completed = False
+            try:
+                # Send start command to Pi
+                self.set_state("starting")
+                await self.stream.send_text("start dc")
+                print(f"[INFO] {self.tag}Sent 'start dc' command for run {run_index + 1}")
+
+                # Run data collection for this run
+                completed = await self.run_data_collection(run_index)
+
+            except (ConnectionResetError, BrokenPipeError) as e:
+                print(f"[ERROR] {self.tag}Connection lost during run {run_index + 1}: {e}")
+                break
             except Exception as e:
-                print(f"[ERROR] Error in main loop: {e}")
+                print(f"[ERROR] {self.tag}Unexpected error during run {run_index + 1}: {e}")
                 break
-                
-            # c. Cleanup old data
-            current_time = time.time()
-            while thermo_buffer and current_time - thermo_buffer[0][0] > BUFFER_RETENTION_SEC:
-                thermo_buffer.popleft()
-            while position_buffer and current_time - get_pos_ts(position_buffer[0]) > BUFFER_RETENTION_SEC:
-                position_buffer.popleft()
-                
-            if len(thermo_buffer) > 0 or len(position_buffer) > 0:
-                print(f"[INFO] Buffer cleanup: thermo={len(thermo_buffer)}, position={len(position_buffer)}")
-                
-        print(f"[INFO] Run {run_index + 1} completed. Total matches: {matches}")
-        print(f"[DEBUG] Final buffer states: thermo={len(thermo_buffer)}, position={len(position_buffer)}")
-        
-        # Print first few timestamps for manual inspection
-        print("[DEBUG] First 5 thermo timestamps:", [t[0] for t in list(thermo_buffer)[:5]])
-        print("[DEBUG] First 5 position timestamps:", [p[0] for p in list(position_buffer)[:5]])
-        if matches == 0:
-            print("[WARN] No matches found! Check timestamp alignment and template matching.")
-        print(f"[DEBUG] Buffer contents - Thermo: {list(thermo_buffer)}... Position: {list(position_buffer)}...")
-        
-    except KeyboardInterrupt:
-        print("\n[INFO] Data collection interrupted by user.")
-    finally:
-        conn.settimeout(None)  # Reset timeout to blocking mode
-       
-        # Clear any remaining buffers
-        thermo_buffer.clear()
-        position_buffer.clear()
+            finally:
+                # The next setup can't be prepared without a finished run
+                self.cooling_event.set()
+                if not completed and next_step is not None:
+                    prepared.cancel()
+                # Close CSV file for this run
+                await self.close_csv(run_index)
+
+            if not completed:
+                break
+            if self.journal is not None:
+                self.journal.mark_done(step, rig=self.name or self.addr[0], csv=csv_path)
+
+            # Only send reset if there are more runs to go
+            if next_step is not None:
+                print(f"[INFO] {self.tag}Preparing for next run...")
+                await self.reset_pi()
+
+                # Add delay between runs
+                print(f"[INFO] {self.tag}Waiting 2 seconds before next run...")
+                await asyncio.sleep(2)
+        else:
+            if self.journal is not None:
+                self.journal.finish()
+            finished_campaigns.add(self.campaign_key)
+            print(f"[INFO] {self.tag}Campaign complete.")
+        if prepared is not None and not prepared.done():
+            prepared.cancel()
+        self.set_state("done")
+
+    async def close(self):
+        """Stop the Pi, release this rig's cameras and close the connection."""
+        try:
+            await self.stream.send_text("stop")
+            print(f"[INFO] {self.tag}Sent 'stop' command to Pi.")
+        except Exception as e:
+            print(f"[WARN] {self.tag}Could not send 'stop' command: {e}")
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            if TRACKING_MODE:
+                for cam_id in self.camera_ids:
+                    tracker = ball_trackers[cam_id]
+                    print(f"[INFO] {self.tag}Camera {cam_id} tracking: {tracker.window_hits} window hits, {tracker.full_searches} full-frame searches")
+        if self.row_writer is not None:
+            # Joins the writer thread (it may still be fsync'ing): keep the event loop free meanwhile
+            await asyncio.get_running_loop().run_in_executor(None, self.row_writer.stop)
+        await self.stream.close()
+        self.set_state("closed")
 
 
 ################################# MAIN LOOP ###################################
 # Kill Switch, enter this command in console: open("stop.txt", "w").close()
-def check_for_manual_exit():
+def manual_exit_requested():
     try:
         if os.path.exists("stop.txt"):
-            print("[STOP] Detected stop file. Exiting.")
-            os._exit(0)
+            print("[STOP] Detected stop file. Stopping all rigs.")
+            return True
     except:
         pass
+    return False
 
+sessions = {}               # Connected rigs, keyed by Pi address
+start_event = None          # Set once the operator is ready to begin data collection
+idle_event = None           # Set when the last session finishes (EXIT_WHEN_IDLE)
 
-# Wait for input before starting data collection
-input("[READY] Press Enter to begin data collection...")
+async def handle_pi(reader, writer):
+    """Run one Pi client: handshake, wait for the operator, then run all runs."""
+    addr = writer.get_extra_info("peername")
+    rig = RIGS.get(addr[0], {})
+    session = RigSession(AsyncMessageStream(reader, writer), addr, rig)
+    print(f"[INFO] {session.tag}Connected to Raspberry Pi at {addr}", flush=True)
 
-try:
-    for run_index in range(NUM_RUNS):
-        check_for_manual_exit()
-        
-        # Set up CSV file for this run
-        csv_path = get_csv_path(run_index)
-        csv_file = open(csv_path, 'w', newline='')
-        fieldnames = ['time_ms', 'x_mm', 'y_mm', 'temp_ch0', 'temp_ch1', 'temp_ch2', 'temp_ch3', 'sma_active']
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        print(f"[INFO] Starting run {run_index + 1} with CSV file: {csv_path}")
-        
+    # Accept or reject before touching the journal: recovery would truncate the CSV of a live session
+    if any(other.campaign_key[0] == session.campaign_key[0] for other in sessions.values()):
+        print(f"[ERROR] {session.tag}This rig already has a session (still closing?). Closing connection.")
+        await session.stream.close()
+        return
+    busy = cameras_in_use.intersection(session.camera_ids)
+    if busy:
+        print(f"[ERROR] {session.tag}Cameras {sorted(busy)} are already used by another rig. Add this Pi to RIGS. Closing connection.")
+        await session.stream.close()
+        return
+    if session.campaign_key in finished_campaigns:
+        # A Pi reconnecting after the campaign ended: configure it for zero runs and stop it
+        print(f"[INFO] {session.tag}Campaign already complete. Stopping the Pi instead of starting it again.")
+        session.steps = []
         try:
-            # Send start command to Pi
-            conn.sendall(b"start dc\n")
-            print(f"[INFO] Sent 'start dc' command for run {run_index + 1}")
-            
-            # Run data collection for this run
-            run_data_collection(run_index)
-            
-        except (ConnectionResetError, BrokenPipeError) as e:
-            print(f"[ERROR] Connection lost during run {run_index + 1}: {e}")
-            break
+            await session.handshake()
+            await session.stream.send_text("stop")
         except Exception as e:
-            print(f"[ERROR] Unexpected error during run {run_index + 1}: {e}")
-            break
-        finally:
-            # Close CSV file for this run
-            csv_file.close()
-            print(f"[INFO] Closed CSV file for run {run_index + 1}")
+            print(f"[WARN] {session.tag}Could not stop the Pi: {e}")
+        await session.stream.close()
+        return
+    session.open_campaign()
+    cameras_in_use.update(session.camera_ids)
+    sessions[addr] = session
 
-        # Only send reset if there are more runs to go
-        if run_index < NUM_RUNS - 1:
-            print(f"[INFO] Preparing for next run...")
-            try:
-                # Send reset command to Pi and wait for acknowledgment
-                conn.sendall(b"reset\n")
-                print("[INFO] Sent reset command to Pi")
-                
-                # Wait for acknowledgment with timeout
-                rlist, _, _ = select.select([conn], [], [], 5.0)
-                if rlist:
-                    raw = read_socket_line()
-                    if raw and raw.strip() == "reset_ack":
-                        print("[INFO] Pi acknowledged reset")
-                    else:
-                        print(f"[WARN] Unexpected response from Pi after reset: {raw}")
-                else:
-                    print("[WARN] No response from Pi after reset command")
-                    
-            except Exception as e:
-                print(f"[WARN] Failed to reset Pi: {e}")
-            
-            # Add delay between runs
-            print("[INFO] Waiting 2 seconds before next run...")
-            time.sleep(2)
+    try:
+        await session.handshake()
+        session.start_cameras()
+        if not start_event.is_set():
+            print(f"[INFO] {session.tag}Ready. Waiting for operator to start data collection...")
+        await start_event.wait()
+        await session.run()
+    except (ConnectionResetError, BrokenPipeError) as e:
+        print(f"[ERROR] {session.tag}Connection lost: {e}")
+    except Exception as e:
+        print(f"[ERROR] {session.tag}Unexpected error: {e}")
+    finally:
+        await session.close()
+        cameras_in_use.difference_update(session.camera_ids)
+        sessions.pop(addr, None)
+        if EXIT_WHEN_IDLE and start_event.is_set() and not sessions:
+            idle_event.set()
+
+async def main():
+    global start_event, idle_event, telemetry
+    start_event = asyncio.Event()
+    idle_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    server = await asyncio.start_server(handle_pi, LISTEN_IP, LISTEN_PORT)
+    print(f"[INFO] Listening for Raspberry Pi clients on {LISTEN_IP}:{LISTEN_PORT}")
+    if preview is not None:
+        preview.start()
+    if TELEMETRY_ENABLED:
+        telemetry = TelemetryServer(TELEMETRY_HOST, TELEMETRY_PORT)
+        try:
+            await telemetry.start()
+        except OSError as e:
+            print(f"[WARN] Live telemetry disabled (cannot listen on {TELEMETRY_HOST}:{TELEMETRY_PORT}): {e}")
+            telemetry = None
 
+    # Wait for input before starting data collection (in a thread so Pis can connect meanwhile)
+    if AUTO_START:
+        print("[INFO] Unattended campaign: starting as soon as a Pi connects.")
+        start_event.set()
+    def wait_for_operator():
+        input("[READY] Press Enter to begin data collection...\n")
+        loop.call_soon_threadsafe(start_event.set)
+    if not AUTO_START:
+        threading.Thread(target=wait_for_operator, daemon=True).start()
+
+    try:
+        async with server:
+            await idle_event.wait()
+            print("[INFO] All rigs finished.")
+    finally:
+        if preview is not None:
+            preview.stop()
+        if telemetry is not None:
+            await telemetry.close()
+
+try:
+    asyncio.run(main())
 except KeyboardInterrupt:
     print("\n[INFO] Data collection interrupted by user.")
 except Exception as e:
     print(f"[ERROR] Unexpected error: {e}")
 finally:
-    try:
-        conn.sendall(b"stop\n")
-        print("[INFO] Sent 'stop' command to Pi.")
-    except Exception as e:
-        print(f"[WARN] Could not send 'stop' command: {e}")
     print("[INFO] Cleaning up...")
-    for cam in cams:
+    if preview is not None:
+        preview.stop()
+    for cam in cams.values():
         cam.release()
-    cv2.destroyAllWindows()
-    try:
-        conn.close()
-    except:
-        pass
-    try:
-        server.close()
-    except:
-        pass
     print("[INFO] Cleanup complete.")
-
-# Clean up resources and exit the program.
-def cleanup_and_exit():
-
-    print("[INFO] Cleaning up resources before exit...")
-    try:
-        conn.sendall(b"stop")
-        print("[INFO] Sent 'stop' command to Pi.")
-    except Exception as e:
-        print(f"[WARN] Could not send 'stop' command: {e}")
-    
-    for cam in cams:
-        cam.release()
-    cv2.destroyAllWindows()
-    
-    try:
-        conn.close()
-    except:
-        pass
-    try:
-        server.close()
-    except:
-        pass
-    print("[INFO] Cleanup complete. Exiting.")
-    os._exit(1)
-
-if DEBUG:
-    cv2.destroyAllWindows()
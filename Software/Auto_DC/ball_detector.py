@@ -0,0 +1,305 @@
+# """
+# (PC) Host Ball Detector
+# Colour mask + template matching ball detection (same steps as the
+# calibration script), set up once from the calibration data and reused for
+# every frame.
+#
+# The HSV bounds and morphology kernel are built once, and
+# the HSV, mask and scratch images are preallocated per worker thread and
+# frame size, so no full-frame buffers are allocated per frame.
+#
+# Red wraps around hue 0/180, which is why the calibration has two HSV ranges.
+# Converting the BGR frame as if it were RGB swaps red and blue: S and V are
+# unchanged and hue becomes (120 - H) mod 180, so both red ranges land in one
+# contiguous band around 120 and a single inRange pass replaces two inRange
+# passes and a bitwise_or (pixels exactly on a range edge can differ by the
+# +-1 hue rounding). Ranges that don't form a red wraparound use two passes.
+#
+# Template matching runs coarse-to-fine (TemplateMatcher): the search image is
+# reduced with an image pyramid once, every template is scored against the
+# coarsest level using its precomputed reduced copy, and only the best few
+# candidates are refined level by level in a small neighbourhood at full
+# resolution. Adding templates only adds cheap coarse-level work. The final
+# match position is refined to sub-pixel precision by fitting a parabola
+# through the correlation peak and its neighbours in x and in y.
+#
+# BallTracker adds a tracking mode per camera: the ball moves only a few mm
+# between frames, so it is searched in a small window around the position
+# predicted from the last two detections (constant velocity), and the full
+# frame is searched only when the window match is not confident enough.
+# """
+
+# === Import libraries ===
+import threading
+import cv2
+import numpy as np
+
+
+def parabolic_peak(res, loc):
+    """Sub-pixel (x, y) of the maximum at loc in a correlation map, from a parabola fit per axis."""
+    x, y = loc
+    offsets = [0.0, 0.0]
+    for axis, (before, peak, after) in enumerate([
+            (res[y, x - 1], res[y, x], res[y, x + 1]) if 0 < x < res.shape[1] - 1 else (0, 0, 0),
+            (res[y - 1, x], res[y, x], res[y + 1, x]) if 0 < y < res.shape[0] - 1 else (0, 0, 0)]):
+        curvature = before - 2 * peak + after
+        if curvature < 0:   # Only a real maximum has negative curvature
+            offsets[axis] = min(max(0.5 * float(before - after) / float(curvature), -0.5), 0.5)
+    return x + offsets[0], y + offsets[1]
+
+
+class TemplateMatcher:
+    """Coarse-to-fine TM_CCOEFF_NORMED matching of several templates with precomputed template pyramids."""
+
+    def __init__(self, templates, max_levels=2, min_template_px=8, refine_top=2, refine_radius=2, subpixel=True):
+        self.templates = templates
+        self.subpixel = subpixel
+        self.refine_top = refine_top
+        self.refine_radius = refine_radius
+        # pyramids[i][level] = template i reduced `level` times (only while it stays >= min_template_px)
+        self.pyramids = []
+        for temp in templates:
+            pyramid = [temp]
+            while (len(pyramid) <= max_levels and
+                   min(pyramid[-1].shape[:2]) // 2 >= min_template_px):
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+            self.pyramids.append(pyramid)
+        self.levels = min((len(p) - 1 for p in self.pyramids), default=0)
+
+    def _match_level(self, image, temp, subpixel=False):
+        if image.shape[0] < temp.shape[0] or image.shape[1] < temp.shape[1]:
+            return None, -1
+        res = cv2.matchTemplate(image, temp, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(res)
+        if subpixel:
+            return parabolic_peak(res, max_loc), max_val
+        return max_loc, max_val
+
+    def match(self, image):
+        """
+        Find the best matching template in image.
+
+        Returns (loc, match_val, template_shape): loc is the (x, y) top-left
+        corner of the best match at full resolution (float, sub-pixel if
+        enabled), or (None, -1, None).
+        """
+        usable = [i for i, p in enumerate(self.pyramids)
+                  if p[0].shape[0] <= image.shape[0] and p[0].shape[1] <= image.shape[1]]
+        if not usable:
+            return None, -1, None   # Image is smaller than every template
+
+        # Use as many pyramid levels as the image allows (the coarse image must hold the coarse templates)
+        levels = self.levels
+        image_pyramid = [image]
+        while len(image_pyramid) <= levels:
+            image_pyramid.append(cv2.pyrDown(image_pyramid[-1]))
+        while levels > 0 and any(image_pyramid[levels].shape[0] < self.pyramids[i][levels].shape[0] or
+                                 image_pyramid[levels].shape[1] < self.pyramids[i][levels].shape[1] for i in usable):
+            levels -= 1
+
+        # Score every template on the coarsest level
+        candidates = []
+        for i in usable:
+            loc, val = self._match_level(image_pyramid[levels], self.pyramids[i][levels],
+                                         subpixel=self.subpixel and levels == 0)
+            if loc is not None:
+                candidates.append((val, i, loc))
+        if levels == 0:
+            if not candidates:
+                return None, -1, None
+            val, i, loc = max(candidates)
+            return loc, val, self.templates[i].shape
+
+        # Refine the best candidates level by level in a small neighbourhood
+        best = (None, -1, None)
+        r = self.refine_radius
+        for _, i, loc in sorted(candidates, reverse=True)[:self.refine_top]:
+            val = -1
+            for level in range(levels - 1, -1, -1):
+                img = image_pyramid[level]
+                temp = self.pyramids[i][level]
+                th, tw = temp.shape[:2]
+                x0 = min(max(loc[0] * 2 - r, 0), img.shape[1] - tw)
+                y0 = min(max(loc[1] * 2 - r, 0), img.shape[0] - th)
+                x1 = min(loc[0] * 2 + r + tw, img.shape[1])
+                y1 = min(loc[1] * 2 + r + th, img.shape[0])
+                sub_loc, val = self._match_level(img[y0:y1, x0:x1], temp, subpixel=self.subpixel and level == 0)
+                loc = (x0 + sub_loc[0], y0 + sub_loc[1])
+            if val > best[1]:
+                best = (loc, val, self.templates[i].shape)
+        return best
+
+
+class BallDetector:
+    """Finds the ball in BGR frames. Safe to share between worker threads (scratch buffers are per thread)."""
+
+    def __init__(self, templates, hsv_lower1, hsv_upper1, hsv_lower2, hsv_upper2, min_blob_px=10, kernel_size=5):
+        self.templates = templates
+        self.matcher = TemplateMatcher(templates)
+        self.min_blob_px = min_blob_px
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+        self.lower1 = np.array(hsv_lower1, dtype=np.uint8)
+        self.upper1 = np.array(hsv_upper1, dtype=np.uint8)
+        self.lower2 = np.array(hsv_lower2, dtype=np.uint8)
+        self.upper2 = np.array(hsv_upper2, dtype=np.uint8)
+        # Single pass if the ranges are [0, h1] and [h2, 179] with the same S/V limits
+        self.single_pass = (self.lower1[0] == 0 and self.upper2[0] == 179 and
+                            self.upper1[0] <= 120 and self.lower2[0] >= 121 and
+                            np.array_equal(self.lower1[1:], self.lower2[1:]) and
+                            np.array_equal(self.upper1[1:], self.upper2[1:]))
+        if self.single_pass:
+            # Hue band of both ranges in the red/blue swapped image
+            self.swapped_lower = np.array([120 - int(self.upper1[0]), *self.lower1[1:]], dtype=np.uint8)
+            self.swapped_upper = np.array([300 - int(self.lower2[0]), *self.upper1[1:]], dtype=np.uint8)
+        # Largest template size (w, h), used to size tracking windows
+        self.template_size = (max((t.shape[1] for t in templates), default=0),
+                              max((t.shape[0] for t in templates), default=0))
+        self._local = threading.local()
+
+    def _buffers(self, shape):
+        """Scratch images for this thread and image size (full frames and tracking windows)."""
+        cache = getattr(self._local, "buffers", None)
+        if cache is None:
+            cache = self._local.buffers = {}
+        buffers = cache.get(shape)
+        if buffers is None:
+            h, w = shape[:2]
+            buffers = cache[shape] = {
+                "hsv": np.empty((h, w, 3), np.uint8),
+                "mask": np.empty((h, w), np.uint8),
+                "scratch": np.empty((h, w), np.uint8),
+            }
+        return buffers
+
+    def threshold(self, frame):
+        """
+        Return the cleaned-up colour mask of a BGR frame.
+
+        The mask is a per-thread buffer that is overwritten by the next call on
+        the same thread; copy it if it has to be kept.
+        """
+        b = self._buffers(frame.shape)
+        if self.single_pass:
+            cv2.cvtColor(frame, cv2.COLOR_RGB2HSV, dst=b["hsv"])   # Red/blue swapped on purpose
+            cv2.inRange(b["hsv"], self.swapped_lower, self.swapped_upper, dst=b["mask"])
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=b["hsv"])
+            cv2.inRange(b["hsv"], self.lower1, self.upper1, dst=b["mask"])
+            cv2.inRange(b["hsv"], self.lower2, self.upper2, dst=b["scratch"])
+            cv2.bitwise_or(b["mask"], b["scratch"], dst=b["mask"])
+        # Morphological operations to clean up the mask
+        cv2.erode(b["mask"], self.kernel, dst=b["scratch"], iterations=1)
+        cv2.dilate(b["scratch"], self.kernel, dst=b["mask"], iterations=2)
+        return b["mask"]
+
+    def detect(self, frame):
+        """
+        Locate the ball in a BGR frame.
+
+        Returns (rect, match_val, mask, blob_rects): rect is ((x0, y0), (x1, y1))
+        of the best template match in pixels (None if nothing matched),
+        blob_rects are the bounding boxes of all colour blobs.
+        """
+        mask = self.threshold(frame)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        blob_rects = [cv2.boundingRect(cnt) for cnt in contours]
+
+        # Template matching only on the colour-filtered regions
+        best_val = -1
+        best_rect = None
+        for x, y, w, h in blob_rects:
+            if w < self.min_blob_px or h < self.min_blob_px:
+                continue  # Ignore tiny blobs
+            roi = frame[y:y+h, x:x+w]
+            loc, val, temp_shape = self.matcher.match(roi)   # Skips templates larger than the ROI
+            if loc is not None and val > best_val:
+                best_val = val
+                loc = (x + loc[0], y + loc[1])
+                best_rect = (loc, (loc[0] + temp_shape[1], loc[1] + temp_shape[0]))
+        return best_rect, best_val, mask, blob_rects
+
+
+class BallTracker:
+    """
+    Tracks the ball in one camera's frames.
+
+    Searches a fixed-size window around the position predicted from the last
+    two detections and falls back to a full-frame search when the window
+    match is below min_confidence (or there is no track yet).
+    """
+
+    def __init__(self, detector, search_margin=40, min_confidence=0.7):
+        self.detector = detector
+        self.min_confidence = min_confidence
+        tw, th = detector.template_size
+        self.window_size = (tw + 2 * search_margin, th + 2 * search_margin)
+        self._lock = threading.Lock()
+        self._last = None            # (ts, cx, cy) of the last detection
+        self._velocity = (0.0, 0.0)  # pixels per second
+        self.window_hits = 0         # Frames resolved inside the tracking window
+        self.full_searches = 0       # Frames that needed a full-frame search
+
+    def reset(self):
+        with self._lock:
+            self._last = None
+            self._velocity = (0.0, 0.0)
+
+    def _window(self, frame_shape, ts):
+        """Top-left corner of the search window around the predicted position, or None."""
+        if self._last is None:
+            return None
+        fh, fw = frame_shape[:2]
+        ww, wh = self.window_size
+        if ww >= fw or wh >= fh:
+            return None
+        t, cx, cy = self._last
+        dt = max(ts - t, 0.0)
+        px = cx + self._velocity[0] * dt
+        py = cy + self._velocity[1] * dt
+        # Shift (not shrink) the window at the frame edges so its size stays fixed
+        x0 = min(max(int(round(px - ww / 2)), 0), fw - ww)
+        y0 = min(max(int(round(py - wh / 2)), 0), fh - wh)
+        return x0, y0
+
+    def _update(self, rect, ts):
+        cx = (rect[0][0] + rect[1][0]) / 2
+        cy = (rect[0][1] + rect[1][1]) / 2
+        if self._last is not None and ts > self._last[0]:
+            t, lx, ly = self._last
+            self._velocity = ((cx - lx) / (ts - t), (cy - ly) / (ts - t))
+        else:
+            self._velocity = (0.0, 0.0)
+        self._last = (ts, cx, cy)
+
+    def detect(self, frame, ts):
+        """
+        Same as BallDetector.detect(), plus the search window used.
+
+        Returns (rect, match_val, mask, blob_rects, window): rect and blob_rects
+        are in full-frame pixels, mask covers only the window, and window is
+        ((x0, y0), (x1, y1)) or None for a full-frame search.
+        """
+        with self._lock:
+            if self._last is not None and ts < self._last[0]:
+                # Older than the current track (out-of-order worker): don't move the track
+                return self.detector.detect(frame) + (None,)
+            corner = self._window(frame.shape, ts)
+            if corner is not None:
+                x0, y0 = corner
+                ww, wh = self.window_size
+                rect, val, mask, blobs = self.detector.detect(frame[y0:y0+wh, x0:x0+ww])
+                if rect is not None and val >= self.min_confidence:
+                    self.window_hits += 1
+                    rect = ((rect[0][0] + x0, rect[0][1] + y0), (rect[1][0] + x0, rect[1][1] + y0))
+                    blobs = [(x + x0, y + y0, w, h) for x, y, w, h in blobs]
+                    self._update(rect, ts)
+                    return rect, val, mask, blobs, ((x0, y0), (x0 + ww, y0 + wh))
+
+            # No track or low confidence: search the whole frame
+            self.full_searches += 1
+            rect, val, mask, blobs = self.detector.detect(frame)
+            if rect is not None:
+                self._update(rect, ts)
+            else:
+                self._last = None
+            return rect, val, mask, blobs, None
@@ -0,0 +1,165 @@
+# """
+# (PC) Host Campaign Runner
+# Parameter sweeps (volts x current x load grid with N repeats) executed as
+# one unattended campaign, with resumable progress.
+#
+# A sweep definition (CAMPAIGN_SWEEP in the host script, or a JSON file given
+# on the command line) looks like:
+#   {"volts": [5.0, 6.0], "current": [1.0, 1.5], "load": [50, 100],
+#    "repeats": 5, "order": ["load", "volts", "current"]}
+# Scalars are allowed for single values. "order" lists the axes from the
+# outermost (changed least often) to the innermost; by default the load, which
+# has to be changed by hand, is the outermost axis.
+#
+# Each rig keeps an append-only journal (one fsync'ed JSON line per event:
+# run start, row checkpoints, run done), so a restarted host skips completed
+# runs, salvages the checkpointed rows of an interrupted one and continues
+# with the next run. The journal is renamed to *.complete once every run of
+# the sweep is done, so starting the same sweep again begins a new campaign.
+# """
+
+# === Import libraries ===
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+SWEEP_AXES = ("volts", "current", "load")
+DEFAULT_ORDER = ["load", "volts", "current"]
+
+
+class CampaignStep(namedtuple("CampaignStep", ["volts", "current", "load", "repeat"])):
+    """One run of the campaign. `repeat` is the run index within its setup."""
+
+    @property
+    def setup(self):
+        return (self.volts, self.current, self.load)
+
+    @property
+    def key(self):
+        return f"{float(self.volts)}V_{float(self.current)}A_{int(self.load)}G_run{self.repeat + 1}"
+
+
+def load_sweep(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def single_setup_sweep(volts, current, load, repeats):
+    """The sweep equivalent of the classic single-setup configuration."""
+    return {"volts": volts, "current": current, "load": load, "repeats": repeats}
+
+
+def expand_sweep(sweep):
+    """List the CampaignSteps of a sweep definition in execution order."""
+    values = {}
+    for axis in SWEEP_AXES:
+        if axis not in sweep:
+            raise ValueError(f"sweep definition is missing '{axis}'")
+        value = sweep[axis]
+        values[axis] = list(value) if isinstance(value, (list, tuple)) else [value]
+    order = list(sweep.get("order", DEFAULT_ORDER))
+    if sorted(order) != sorted(SWEEP_AXES):
+        raise ValueError(f"sweep 'order' must list each of {SWEEP_AXES} once")
+    repeats = int(sweep.get("repeats", 1))
+
+    steps = []
+    for combo in itertools.product(*(values[axis] for axis in order)):
+        setup = dict(zip(order, combo))
+        for repeat in range(repeats):
+            steps.append(CampaignStep(setup["volts"], setup["current"], setup["load"], repeat))
+    return steps
+
+
+def sweep_id(sweep):
+    """Short stable hash of a sweep definition (names its journal file)."""
+    canonical = json.dumps(sweep, sort_keys=True)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:10]
+
+
+class RunJournal:
+    """
+    Append-only, fsync'ed journal of one rig's campaign: run starts, row
+    checkpoints (rows and byte offset of the run's CSV after each flush) and
+    completed runs. Safe to call from the writer thread and the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        self.interrupted = {}      # key -> {"csv": path, "rows": n, "offset": bytes} of runs started but not done
+        self._lock = threading.Lock()
+        self._torn = False         # Last line was cut short by a crash (terminate it before appending)
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        csv_keys = {}
+        with open(self.path) as f:
+            for line in f:
+                self._torn = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # Torn last line from a crash
+                event, key = entry.get("event"), entry.get("key")
+                if event == "start":
+                    csv_keys[entry["csv"]] = key
+                    self.interrupted[key] = {"csv": entry["csv"], "rows": 0, "offset": 0}
+                elif event == "checkpoint" and csv_keys.get(entry["csv"]) in self.interrupted:
+                    self.interrupted[csv_keys[entry["csv"]]].update(rows=entry["rows"], offset=entry["offset"])
+                elif event in ("done", "recovered"):
+                    self.interrupted.pop(key, None)
+                    if event == "done":
+                        self.completed.add(key)
+
+    def _append(self, entry):
+        with self._lock:
+            with open(self.path, "a") as f:
+                if self._torn:
+                    f.write("\n")
+                    self._torn = False
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def remaining(self, steps):
+        return [step for step in steps if step.key not in self.completed]
+
+    def start_run(self, step, csv_path):
+        self._append({"event": "start", "key": step.key, "csv": csv_path, "time": time.time()})
+
+    def checkpoint(self, csv_path, rows, offset):
+        """Record that the first `rows` rows (`offset` bytes) of csv_path are on disk."""
+        self._append({"event": "checkpoint", "csv": csv_path, "rows": rows, "offset": offset})
+
+    def mark_done(self, step, **info):
+        self._append({"event": "done", "key": step.key, **step._asdict(), "time": time.time(), **info})
+        self.completed.add(step.key)
+
+    def recover_interrupted(self):
+        """
+        Keep the checkpointed rows of runs that were cut short by a crash as
+        <csv>.partial (truncated to the last checkpoint, so no torn rows); the
+        runs themselves are repeated. Returns the (key, partial_path, rows) recovered.
+        """
+        recovered = []
+        for key, run in list(self.interrupted.items()):
+            partial = None
+            if os.path.exists(run["csv"]):
+                partial = run["csv"] + ".partial"
+                with open(run["csv"], "r+b") as f:
+                    f.truncate(min(run["offset"], os.path.getsize(run["csv"])))
+                os.replace(run["csv"], partial)
+            self._append({"event": "recovered", "key": key, "partial": partial, "rows": run["rows"]})
+            self.interrupted.pop(key)
+            recovered.append((key, partial, run["rows"]))
+        return recovered
+
+    def finish(self):
+        """Retire the journal once the campaign is complete."""
+        if os.path.exists(self.path):
+            os.replace(self.path, self.path + ".complete")
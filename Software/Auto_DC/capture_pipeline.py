@@ -0,0 +1,197 @@
+# """
+# (PC) Host Camera Capture Pipeline
+# Threaded camera capture for the automated data collection host.
+#
+# Each camera gets its own grabber thread that keeps reading frames and
+# stores only the newest one (with the time it was captured). A scheduler
+# thread takes the latest frame from every camera at a fixed rate and hands
+# them to a worker pool for position extraction. Finished position samples
+# are put on a queue, so the host's main loop only has to drain that queue
+# and is never blocked by camera I/O or image processing.
+# """
+
+# === Import libraries ===
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+########################## Per-Camera Frame Grabber ###########################
+class CameraGrabber(threading.Thread):
+    """Reads one camera continuously and keeps the latest frame in a slot."""
+
+    def __init__(self, cam_idx, cam, retry_delay=0.01):
+        super().__init__(name=f"grabber-cam{cam_idx}", daemon=True)
+        self.cam_idx = cam_idx
+        self.cam = cam
+        self.retry_delay = retry_delay
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._frame = None
+        self._frame_ts = None
+        self._frame_seq = 0
+        self.failed_reads = 0
+
+    def run(self):
+        while not self._stop_event.is_set():
+            ret, frame = self.cam.read()
+            frame_ts = time.time()   # Capture timestamp (host clock)
+            if not ret:
+                self.failed_reads += 1
+                time.sleep(self.retry_delay)
+                continue
+            with self._cond:
+                self._frame = frame
+                self._frame_ts = frame_ts
+                self._frame_seq += 1
+                self._cond.notify_all()
+
+    def latest(self):
+        """Return (seq, capture_ts, frame) for the newest frame, or (0, None, None)."""
+        with self._cond:
+            return self._frame_seq, self._frame_ts, self._frame
+
+    def stop(self):
+        self._stop_event.set()
+
+
+########################## Position Extraction Pipeline #######################
+class PositionPipeline:
+    """
+    Schedules position extraction on a worker pool and publishes finished samples.
+
+    process_frame(cam_idx, frame, frame_ts) runs on a worker thread and returns
+    the per-camera result. combine(capture_ts, results) turns the list of
+    per-camera results (None for cameras without a frame) into one position
+    sample, which is then available from drain() / latest_sample().
+    """
+
+    def __init__(self, cams, process_frame, combine, sample_interval=0.25,
+                 max_workers=None, max_pending=None, queue_size=1000):
+        self.grabbers = [CameraGrabber(idx, cam) for idx, cam in enumerate(cams)]
+        self.process_frame = process_frame
+        self.combine = combine
+        self.sample_interval = sample_interval
+        self.max_workers = max_workers or max(len(cams), 1)
+        self.max_pending = max_pending or self.max_workers
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                        thread_name_prefix="position-worker")
+        self._samples = queue.Queue(maxsize=queue_size)
+        self._latest_lock = threading.Lock()
+        self._latest_sample = None
+        self._latest_ts = None    # Capture time (host clock) of the latest sample
+        self._stop_event = threading.Event()
+        self._scheduler = threading.Thread(target=self._schedule_loop,
+                                           name="position-scheduler", daemon=True)
+        self.dropped_sets = 0     # Frame sets skipped because workers were busy
+        self.dropped_samples = 0  # Finished samples dropped because nobody drained them
+        self.worker_errors = 0
+
+    def start(self):
+        for grabber in self.grabbers:
+            grabber.start()
+        self._scheduler.start()
+        print(f"[INFO] Capture pipeline started: {len(self.grabbers)} camera(s), "
+              f"{self.max_workers} worker(s), interval={self.sample_interval}s")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._scheduler.is_alive():
+            self._scheduler.join(timeout=2.0)
+        for grabber in self.grabbers:
+            grabber.stop()
+        for grabber in self.grabbers:
+            if grabber.is_alive():
+                grabber.join(timeout=2.0)
+        self._pool.shutdown(wait=True)
+        print(f"[INFO] Capture pipeline stopped (dropped frame sets: {self.dropped_sets}, "
+              f"dropped samples: {self.dropped_samples}, worker errors: {self.worker_errors})")
+
+    def _run_job(self, cam_idx, frame, frame_ts):
+        try:
+            return self.process_frame(cam_idx, frame, frame_ts)
+        except Exception as e:
+            self.worker_errors += 1
+            print(f"[ERROR] Position extraction failed for camera {cam_idx}: {e}")
+            return None
+
+    def _publish(self, capture_ts, sample):
+        with self._latest_lock:
+            self._latest_sample = sample
+            self._latest_ts = capture_ts
+        try:
+            self._samples.put_nowait(sample)
+        except queue.Full:
+            # Keep the newest samples: discard the oldest one and retry
+            try:
+                self._samples.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped_samples += 1
+            self._samples.put_nowait(sample)
+
+    def _schedule_loop(self):
+        last_seqs = [0] * len(self.grabbers)
+        in_flight = deque()   # (capture_ts, [future or None per camera]), oldest first
+        next_tick = time.monotonic()
+
+        while not self._stop_event.is_set():
+            # Publish finished frame sets in capture order
+            while in_flight and all(f is None or f.done() for f in in_flight[0][1]):
+                capture_ts, futures = in_flight.popleft()
+                results = [f.result() if f is not None else None for f in futures]
+                sample = self.combine(capture_ts, results)
+                if sample is not None:
+                    self._publish(capture_ts, sample)
+
+            now = time.monotonic()
+            if now < next_tick:
+                self._stop_event.wait(min(next_tick - now, 0.005))
+                continue
+            next_tick += self.sample_interval
+            if next_tick < now:
+                next_tick = now + self.sample_interval   # Fell behind, don't burst
+
+            if len(in_flight) >= self.max_pending:
+                self.dropped_sets += 1
+                continue
+
+            # Submit the newest frame of every camera that has a new frame
+            futures = []
+            frame_times = []
+            for i, grabber in enumerate(self.grabbers):
+                seq, frame_ts, frame = grabber.latest()
+                if frame is None or seq == last_seqs[i]:
+                    futures.append(None)
+                    continue
+                last_seqs[i] = seq
+                frame_times.append(frame_ts)
+                futures.append(self._pool.submit(self._run_job, i, frame, frame_ts))
+            if frame_times:
+                in_flight.append((sum(frame_times) / len(frame_times), futures))
+
+    def drain(self):
+        """Return all finished position samples since the last call (oldest first)."""
+        samples = []
+        while True:
+            try:
+                samples.append(self._samples.get_nowait())
+            except queue.Empty:
+                return samples
+
+    def latest_sample(self, timeout=None, after=None):
+        """
+        Return the newest finished sample, waiting up to timeout seconds for one.
+        With after (host time.time()), only a sample captured later than that counts.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._latest_lock:
+                if self._latest_sample is not None and (after is None or self._latest_ts > after):
+                    return self._latest_sample
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(0.01)
+
@@ -0,0 +1,95 @@
+# """
+# (PC) Host Clock Synchronization
+# NTP-style estimation of the Pi clock offset and drift relative to the host.
+#
+# The host sends "sync_req:<seq>" at host time t0. The Pi stamps the time it
+# read the request (t1) and the time it answered (t2) and replies
+# "sync_resp:<seq>:<t1>:<t2>", which the host receives at t3. For each exchange:
+#   offset = ((t1 - t0) + (t2 - t3)) / 2      (Pi clock - host clock)
+#   delay  = (t3 - t0) - (t2 - t1)            (network round trip)
+# Exchanges are sent in bursts; the minimum-delay exchange of each burst is
+# kept (it has the least queueing asymmetry), and a straight line fitted
+# through the kept points gives the offset and its linear drift over time.
+# """
+
+# === Import libraries ===
+import time
+from collections import deque
+import numpy as np
+
+MIN_DRIFT_SPAN_SEC = 30.0      # Don't estimate drift from points closer together than this
+
+
+class ClockSync:
+    """Estimates the Pi clock offset and linear drift from timestamp exchanges."""
+
+    def __init__(self, history=20):
+        self._seq = 0
+        self._pending = {}                  # seq -> t0 (host send time)
+        self._burst = []                    # (host_mid, offset, delay) of the current burst
+        self._points = deque(maxlen=history)   # best exchange of each burst
+        self.offset = 0.0                   # Pi - host (seconds) at ref_time
+        self.drift = 0.0                    # Offset change in seconds per second
+        self.ref_time = 0.0
+        self.delay = None                   # Round trip of the latest best exchange (seconds)
+        self.synced = False
+
+    def new_request(self):
+        """Register an outgoing request. Returns the message to send to the Pi."""
+        self._seq += 1
+        self._pending[self._seq] = time.time()
+        return f"sync_req:{self._seq}"
+
+    def handle_response(self, msg, t3):
+        """Record a "sync_resp:<seq>:<t1>:<t2>" reply received at host time t3."""
+        try:
+            _, seq, t1, t2 = msg.split(":")
+            seq, t1, t2 = int(seq), float(t1), float(t2)
+        except ValueError:
+            print(f"[WARN] Ignoring malformed clock sync reply: {msg}")
+            return
+        t0 = self._pending.pop(seq, None)
+        if t0 is None:
+            return      # Late reply to a finished burst
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        delay = (t3 - t0) - (t2 - t1)
+        self._burst.append(((t0 + t3) / 2, offset, delay))
+
+    def finish_burst(self):
+        """Keep the minimum-delay exchange of the burst and refit offset and drift."""
+        self._pending.clear()
+        if not self._burst:
+            return False
+        best = min(self._burst, key=lambda p: p[2])
+        self._burst = []
+        self._points.append(best)
+        self.delay = best[2]
+        self._fit()
+        return True
+
+    def set_offset(self, offset):
+        """Use a single fixed offset (Pi clients without clock sync support)."""
+        self.offset = offset
+        self.drift = 0.0
+        self.ref_time = time.time()
+        self.synced = True
+
+    def _fit(self):
+        times = np.array([p[0] for p in self._points])
+        offsets = np.array([p[1] for p in self._points])
+        self.ref_time = float(times.mean())
+        if len(times) >= 2 and times.max() - times.min() >= MIN_DRIFT_SPAN_SEC:
+            self.drift, self.offset = (float(v) for v in np.polyfit(times - self.ref_time, offsets, 1))
+        else:
+            self.ref_time = float(times[-1])
+            self.offset = float(offsets[-1])
+            self.drift = 0.0
+        self.synced = True
+
+    def offset_at(self, host_ts):
+        """Estimated Pi - host offset (seconds) at the given host time."""
+        return self.offset + self.drift * (host_ts - self.ref_time)
+
+    def pi_to_host(self, pi_ts):
+        """Convert a Pi timestamp to host time."""
+        return pi_ts - self.offset_at(pi_ts - self.offset)
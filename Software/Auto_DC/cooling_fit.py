@@ -0,0 +1,80 @@
+# """
+# (PC) Host Cooling Curve Fit
+# Online Newton-cooling fit used to end a run as soon as the SMA is back
+# within tolerance of the ambient temperature measured before the pulse.
+#
+# After the SMA turns off the wire cools as
+#   T(t) = T_amb + (T_0 - T_amb) * exp(-k * t)
+# With T_amb known (pre-run ambient), ln(T - T_amb) is linear in t, so the fit
+# is a weighted linear least squares kept as running sums (O(1) per sample).
+# Weights (T - T_amb)^2 undo the noise amplification of the log near ambient.
+# The fitted curve gives the time at which T - T_amb drops to the tolerance.
+# """
+
+# === Import libraries ===
+import math
+
+
+class CoolingFit:
+    """Fits ln(T - ambient) = ln(dT0) - k * t over the samples added so far."""
+
+    def __init__(self, ambient, tolerance, min_points=5, min_span=3.0, noise_floor=0.2):
+        self.ambient = ambient
+        self.tolerance = tolerance
+        self.min_points = min_points      # samples needed before the fit is trusted
+        self.min_span = min_span          # seconds of cooling needed before the fit is trusted
+        self.noise_floor = noise_floor    # C above ambient below which samples carry no slope information
+        self.t_start = None
+        self.t_last = None
+        self.n = 0
+        self._sw = self._st = self._sy = self._stt = self._sty = 0.0
+        self.k = None                     # Cooling rate (1/s)
+        self.delta0 = None                # Fitted T - ambient at t_start
+
+    def add(self, t, temp):
+        """Add one (timestamp, temperature) sample of the cooling phase."""
+        if self.t_start is None:
+            self.t_start = t
+        self.t_last = t
+        excess = temp - self.ambient
+        if excess <= self.noise_floor:
+            return
+        x = t - self.t_start
+        y = math.log(excess)
+        w = excess * excess
+        self.n += 1
+        self._sw += w
+        self._st += w * x
+        self._sy += w * y
+        self._stt += w * x * x
+        self._sty += w * x * y
+        self._solve()
+
+    def _solve(self):
+        denom = self._sw * self._stt - self._st * self._st
+        if self.n < 2 or denom <= 0:
+            return
+        slope = (self._sw * self._sty - self._st * self._sy) / denom
+        intercept = (self._sy - slope * self._st) / self._sw
+        self.k = -slope
+        self.delta0 = math.exp(intercept)
+
+    @property
+    def ready(self):
+        """True once the fit has enough cooling data and describes a cooling curve."""
+        return (self.n >= self.min_points and self.k is not None and self.k > 0
+                and self.t_last - self.t_start >= self.min_span)
+
+    def temperature_at(self, t):
+        return self.ambient + self.delta0 * math.exp(-self.k * (t - self.t_start))
+
+    def predicted_end(self):
+        """Timestamp at which the fitted curve is within tolerance of ambient (None if not ready)."""
+        if not self.ready:
+            return None
+        if self.delta0 <= self.tolerance:
+            return self.t_start
+        return self.t_start + math.log(self.delta0 / self.tolerance) / self.k
+
+    def time_constant(self):
+        return 1.0 / self.k if self.k else None
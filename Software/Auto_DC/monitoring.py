@@ -0,0 +1,106 @@
+# """
+# (PC) Host Monitoring
+# Status logging and camera preview that stay off the acquisition path.
+#
+# StatusLog prints structured "key=value" status lines, at most once per
+# interval for each kind of message (the number of suppressed repeats is
+# reported with the next line), so console speed never limits acquisition.
+#
+# PreviewWindow owns all HighGUI calls in its own thread. Position workers
+# submit frames with their detection results; a frame is only copied when
+# the camera's preview is due (PREVIEW_FPS cap), and drawing, imshow and
+# waitKey happen in the preview thread.
+# """
+
+# === Import libraries ===
+import threading
+import time
+import cv2
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+class StatusLog:
+    """Rate-limited, structured status lines: "[LEVEL] tag event: key=value ..."."""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = {}          # key -> time of the last printed line
+        self._suppressed = {}    # key -> lines skipped since then
+
+    def log(self, event, level="INFO", tag="", key=None, **fields):
+        """Print a status line unless the same key was printed less than interval seconds ago."""
+        key = key or (tag + event)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        text = " ".join(f"{name}={_format_value(value)}" for name, value in fields.items())
+        more = f" (+{suppressed} suppressed)" if suppressed else ""
+        print(f"[{level}] {tag}{event}: {text}{more}")
+        return True
+
+
+class PreviewWindow(threading.Thread):
+    """Shows the latest frame, mask and detection of each camera at a capped frame rate."""
+
+    def __init__(self, fps=10):
+        super().__init__(name="preview", daemon=True)
+        self.period = 1.0 / fps
+        self._lock = threading.Lock()
+        self._views = {}          # cam_id -> (frame, mask, rect, center, window)
+        self._next_due = {}       # cam_id -> earliest time a new frame is accepted
+        self._stop_event = threading.Event()
+        self._disabled = False
+
+    def wants_frame(self, cam_id):
+        """True if a new frame of this camera would be shown (so workers can skip copying otherwise)."""
+        return not self._disabled and time.monotonic() >= self._next_due.get(cam_id, 0.0)
+
+    def submit(self, cam_id, frame, mask, rect=None, center=None, window=None):
+        """Hand a frame to the preview (copied here, only when due)."""
+        if not self.wants_frame(cam_id):
+            return
+        with self._lock:
+            self._next_due[cam_id] = time.monotonic() + self.period
+            self._views[cam_id] = (frame.copy(), mask.copy(), rect, center, window)
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        def px(point):
+            return (int(round(point[0])), int(round(point[1])))
+
+        while not self._stop_event.is_set():
+            with self._lock:
+                views = list(self._views.items())
+                self._views.clear()
+            try:
+                for cam_id, (frame, mask, rect, center, window) in views:
+                    if window is not None:
+                        cv2.rectangle(frame, window[0], window[1], (255,0,0), 1)
+                    if rect is not None:
+                        cv2.rectangle(frame, px(rect[0]), px(rect[1]), (0,255,0), 2)
+                        cv2.circle(frame, px(center), 5, (0,0,255), -1)
+                    cv2.imshow(f"Camera {cam_id} Debug", frame)
+                    cv2.imshow(f"Camera {cam_id} Mask", mask)
+                cv2.waitKey(1)
+            except cv2.error as e:
+                # e.g. OpenCV built without GUI support: acquisition carries on without the preview
+                print(f"[WARN] Preview disabled: {e}")
+                self._disabled = True
+                return
+            self._stop_event.wait(self.period)
+        cv2.destroyAllWindows()
@@ -16,13 +16,11 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.interpolate import griddata
 from collections import defaultdict
+from run_storage import load_campaign, storage_available
 
 # Path to data directory
 DATA_DIR = r"C:\Users\Owner\Desktop\SERC\STARFISH_Project\Software\STARFISH\Thermo_Position_Data"
-
-# Find all run CSV files
-csv_files = sorted(glob.glob(os.path.join(DATA_DIR, "*V_*A_*G_run_*.csv")))
-print(f"[DEBUG] Found {len(csv_files)} CSV files")
+CAMPAIGN_DIR = os.path.join(DATA_DIR, "campaign")   # Parquet dataset written by the host (if pyarrow is installed)
 
 def format_setup_title(prefix):
     """Format setup parameters for readable titles (replace 'p' with '.')"""
@@ -32,11 +30,30 @@ def format_setup_title(prefix):
     formatted = formatted.replace('_', ', ')
     return formatted
 
+def setup_prefix(rig, volts, current, load):
+    """Same setup naming as the host's CSV files, e.g. 'rig1_6p0V_1p5A_100G'."""
+    rig_str = f"{rig}_" if rig else ""
+    return f"{rig_str}{str(volts).replace('.', 'p')}V_{str(current).replace('.', 'p')}A_{int(load)}G"
+
+# Group runs by setup: prefix -> list of (source name, DataFrame), in run order
 groups = defaultdict(list)
-for path in csv_files:
-    fname = os.path.basename(path)
-    prefix = fname.split("_run_")[0]
-    groups[prefix].append(path)
+if storage_available() and os.path.isdir(CAMPAIGN_DIR):
+    # One read for the whole campaign, then split by setup and run
+    campaign = load_campaign(CAMPAIGN_DIR)
+    print(f"[DEBUG] Loaded {len(campaign)} rows from campaign dataset {CAMPAIGN_DIR}")
+    for col in ["volts", "current", "load", "run"]:
+        campaign[col] = pd.to_numeric(campaign[col].astype(str))
+    campaign["rig"] = campaign["rig"].fillna("")
+    for (rig, volts, current, load, run), df in campaign.groupby(["rig", "volts", "current", "load", "run"], sort=True):
+        groups[setup_prefix(rig, volts, current, load)].append((f"run {run}", df.sort_values("time_ms").reset_index(drop=True)))
+else:
+    # Find all run CSV files
+    csv_files = sorted(glob.glob(os.path.join(DATA_DIR, "*V_*A_*G_run_*.csv")))
+    print(f"[DEBUG] Found {len(csv_files)} CSV files")
+    for path in csv_files:
+        fname = os.path.basename(path)
+        prefix = fname.split("_run_")[0]
+        groups[prefix].append((path, pd.read_csv(path)))
 
 print(f"[DEBUG] Grouped into {len(groups)} setups")
 
@@ -48,8 +65,7 @@ for prefix, files in groups.items():
     all_sma = []
     all_titles = []
     
-    for run_idx, csv_path in enumerate(files, 1):
-        df = pd.read_csv(csv_path)
+    for run_idx, (csv_path, df) in enumerate(files, 1):
         print(f"[DEBUG] File {run_idx}: {len(df)} rows")
         required_cols = ["x_mm", "y_mm", "temp_ch0", "sma_active"]
         if not all(col in df.columns for col in required_cols):
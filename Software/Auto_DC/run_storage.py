@@ -0,0 +1,263 @@
+# """
+# (PC) Host Campaign Storage
+# Columnar (Parquet) storage of aligned rows for a whole characterization
+# campaign, written alongside the per-run CSV files.
+#
+# Rows are buffered in memory and written in batches to a single Hive-style
+# partitioned dataset:
+#   <CAMPAIGN_DIR>/volts=6.0/current=1.5/load=100/run=1/part-[<rig>-]00000.parquet
+# so analysis can load every run (or a filtered subset) in one read instead of
+# re-parsing each CSV. Requires pyarrow; without it the host keeps writing CSV only.
+#
+# RunWriter does all of the file output (CSV and campaign) on a background
+# thread fed by a bounded queue, so a slow disk never stalls acquisition: rows
+# are dropped (and counted) if the queue is full instead of blocking the host.
+# """
+
+# === Import libraries ===
+import csv
+import os
+import queue
+import threading
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARTITION_COLUMNS = ["volts", "current", "load", "run"]
+
+
+def storage_available():
+    return pa is not None
+
+
+def row_schema():
+    """Schema of the stored rows (partition columns are encoded in the directory names)."""
+    return pa.schema([
+        ("time_ms", pa.float64()),
+        ("x_mm", pa.float64()),
+        ("y_mm", pa.float64()),
+        ("temp_ch0", pa.float64()),
+        ("temp_ch1", pa.float64()),
+        ("temp_ch2", pa.float64()),
+        ("temp_ch3", pa.float64()),
+        ("sma_active", pa.bool_()),
+        ("align_err_ms", pa.float64()),
+        ("match_conf", pa.float64()),
+        ("rig", pa.string()),
+    ])
+
+
+class CampaignWriter:
+    """Buffers aligned rows of one rig and appends them to the campaign dataset in batches."""
+
+    def __init__(self, root, rig_name=None, batch_rows=500):
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed")
+        self.root = root
+        self.rig = rig_name or ""
+        self._prefix = f"part-{self.rig}-" if self.rig else "part-"
+        self.batch_rows = batch_rows
+        self.schema = row_schema()
+        self._columns = {name: [] for name in self.schema.names}
+        self._run_dir = None
+        self._part = 0
+        self.rows_written = 0
+
+    def start_run(self, run_index, volts, current, load):
+        """Direct the following rows to the partition of this run."""
+        self.end_run()
+        self._run_dir = os.path.join(self.root, f"volts={float(volts)}", f"current={float(current)}",
+                                     f"load={int(load)}", f"run={run_index + 1}")
+        os.makedirs(self._run_dir, exist_ok=True)
+        # A repeated run replaces this rig's earlier data, like its CSV file
+        for fname in os.listdir(self._run_dir):
+            if fname.startswith(self._prefix) and fname[len(self._prefix):-len(".parquet")].isdigit():
+                os.remove(os.path.join(self._run_dir, fname))
+        self._part = 0
+
+    def write_row(self, row):
+        """Buffer one row (same keys as the CSV row). Writes a batch once batch_rows are buffered."""
+        for name, values in self._columns.items():
+            values.append(self.rig if name == "rig" else row.get(name))
+        if len(self._columns["time_ms"]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows of the current run as one Parquet file."""
+        n_rows = len(self._columns["time_ms"])
+        if n_rows == 0 or self._run_dir is None:
+            return
+        table = pa.table(self._columns, schema=self.schema)
+        path = os.path.join(self._run_dir, f"{self._prefix}{self._part:05d}.parquet")
+        pq.write_table(table, path)
+        self._part += 1
+        self.rows_written += n_rows
+        for values in self._columns.values():
+            values.clear()
+
+    def end_run(self):
+        self.flush()
+        self._run_dir = None
+
+
+def load_campaign(root, columns=None, filters=None):
+    """
+    Load the campaign dataset as a pandas DataFrame with volts/current/load/run columns.
+
+    filters uses the pyarrow syntax, e.g. [("volts", "=", 6.0), ("run", "<=", 5)].
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    table = pq.read_table(root, columns=columns, filters=filters, partitioning="hive")
+    return table.to_pandas()
+
+
+############################ Background Row Writer ############################
+class RunWriter(threading.Thread):
+    """
+    Writes the rows of each run to its CSV file (and the campaign dataset) on a background thread.
+
+    The CSV is flushed every flush_rows rows or flush_interval seconds and
+    fsync'ed when the run is closed. Nothing called from the event loop
+    blocks on a stalled disk: at most queue_size rows are queued (write()
+    drops and counts the rest in dropped_rows), while open/close/stop
+    messages always fit. After each flush, and after the final fsync, the
+    optional checkpoint callback records how much of the CSV is on disk.
+    """
+
+    def __init__(self, campaign=None, queue_size=10000, flush_interval=1.0, flush_rows=50, name="run-writer",
+                 checkpoint=None):
+        super().__init__(name=name, daemon=True)
+        self.campaign = campaign
+        self.checkpoint = checkpoint    # checkpoint(csv_path, rows, offset), called after each CSV flush
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.queue_size = queue_size
+        # Unbounded, so control messages keep their order with the rows without blocking;
+        # the row count is bounded in write()
+        self._queue = queue.Queue()
+        self._queued_rows = 0
+        self._rows_lock = threading.Lock()
+        self._csv_file = None
+        self._csv_path = None
+        self._writer = None
+        self._run_rows = 0
+        self._unflushed = 0
+        self._last_flush = time.time()
+        self.rows_written = 0
+        self.dropped_rows = 0
+        self.write_errors = 0
+        self.lag_sec = 0.0          # Queue-to-disk delay of the last written row
+        self.max_lag_sec = 0.0
+
+    # --- Called from the host's event loop ---
+    def open_run(self, csv_path, fieldnames, run_index, volts, current, load):
+        self._queue.put_nowait(("open", csv_path, fieldnames, run_index, volts, current, load))
+
+    def write(self, row):
+        """Queue one row. Returns False if it was dropped because the writer is behind."""
+        with self._rows_lock:
+            if self._queued_rows >= self.queue_size:
+                self.dropped_rows += 1
+                return False
+            self._queued_rows += 1
+        self._queue.put_nowait(("row", row, time.time()))
+        return True
+
+    def close_run(self, timeout=None):
+        """Flush, fsync and close the current run's files. Blocks until the writer has done so."""
+        done = threading.Event()
+        self._queue.put_nowait(("close", done))
+        return done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        self._queue.put_nowait(("stop",))
+        self.join(timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return (f"rows={self.rows_written}, dropped={self.dropped_rows}, errors={self.write_errors}, "
+                f"queued={self.queue_depth()}, max lag={self.max_lag_sec*1000:.0f} ms")
+
+    # --- Writer thread ---
+    def run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._guard(self._flush)
+                continue
+            kind = item[0]
+            if kind == "row":
+                with self._rows_lock:
+                    self._queued_rows -= 1
+                self._guard(self._write_row, item[1], item[2])
+            elif kind == "open":
+                self._guard(self._open, *item[1:])
+            elif kind == "close":
+                self._guard(self._close)
+                item[1].set()
+            elif kind == "stop":
+                self._guard(self._close)
+                break
+
+    def _guard(self, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            self.write_errors += 1
+            print(f"[ERROR] Run writer: {func.__name__.strip('_')} failed: {e}")
+
+    def _open(self, csv_path, fieldnames, run_index, volts, current, load):
+        self._close()
+        self._csv_file = open(csv_path, 'w', newline='')
+        self._csv_path = csv_path
+        self._run_rows = 0
+        self._writer = csv.DictWriter(self._csv_file, fieldnames=fieldnames)
+        self._writer.writeheader()
+        if self.campaign is not None:
+            self.campaign.start_run(run_index, volts, current, load)
+
+    def _write_row(self, row, queued_at):
+        if self._writer is None:
+            return
+        self._writer.writerow(row)
+        if self.campaign is not None:
+            self.campaign.write_row(row)
+        self.rows_written += 1
+        self._run_rows += 1
+        self._unflushed += 1
+        self.lag_sec = time.time() - queued_at
+        self.max_lag_sec = max(self.max_lag_sec, self.lag_sec)
+        if self._unflushed >= self.flush_rows or time.time() - self._last_flush >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        if self._csv_file is not None and self._unflushed:
+            self._csv_file.flush()
+            if self.checkpoint is not None:
+                os.fsync(self._csv_file.fileno())   # The checkpoint promises these rows survive a crash
+                self.checkpoint(self._csv_path, self._run_rows, self._csv_file.tell())
+        self._unflushed = 0
+        self._last_flush = time.time()
+
+    def _close(self):
+        if self._csv_file is not None:
+            try:
+                self._csv_file.flush()
+                os.fsync(self._csv_file.fileno())
+                if self.checkpoint is not None and self._unflushed:
+                    self.checkpoint(self._csv_path, self._run_rows, self._csv_file.tell())
+                self._unflushed = 0
+            finally:
+                self._csv_file.close()
+                self._csv_file = None
+                self._writer = None
+        if self.campaign is not None:
+            self.campaign.end_run()
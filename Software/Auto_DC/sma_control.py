@@ -0,0 +1,204 @@
+# """
+# (Pi) SMA Heating Controller
+# Closed-loop temperature control of the SMA actuator with PWM on SMA_GPIO_PIN.
+#
+# The controller runs in its own thread and consumes every sample of the
+# thermocouple sampler ring (tc_sampler.py), so it updates at the sampler
+# rate, independently of (and faster than) the telemetry sent to the host.
+#
+# Control modes (chosen by the host's config packet):
+#   "bang_bang" - full power until the target temperature is reached (the
+#                 original behaviour)
+#   "pid"       - follow a setpoint profile [(t_sec, temp_C), ...] relative
+#                 to the pulse start with a PID law plus an optional feed-
+#                 forward term; heating ends after the last profile point
+# In every mode heating is cut at max_heat_time, above max_temp_c, when the
+# main channel can't be read, or when the sampler stops publishing.
+# """
+
+# === Import libraries ===
+import threading
+import time
+import RPi.GPIO as GPIO
+
+CONTROL_MODES = ("bang_bang", "pid")
+
+
+class PID:
+    """PID law with derivative on measurement and clamped (anti-windup) integral. Output is a 0..1 duty."""
+
+    def __init__(self, kp, ki=0.0, kd=0.0, out_min=0.0, out_max=1.0):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.out_min, self.out_max = out_min, out_max
+        self.reset()
+
+    def reset(self):
+        self._integral = 0.0
+        self._last_value = None
+        self._last_time = None
+
+    def update(self, setpoint, value, now, bias=0.0):
+        error = setpoint - value
+        dt = now - self._last_time if self._last_time is not None else 0.0
+        derivative = (value - self._last_value) / dt if dt > 0 else 0.0
+        self._last_value, self._last_time = value, now
+
+        unclamped = bias + self.kp * error + self._integral - self.kd * derivative
+        # Only integrate while the output isn't saturated in the direction of the error
+        if dt > 0 and not ((unclamped >= self.out_max and error > 0) or (unclamped <= self.out_min and error < 0)):
+            self._integral += self.ki * error * dt
+        output = bias + self.kp * error + self._integral - self.kd * derivative
+        return min(max(output, self.out_min), self.out_max)
+
+
+class TemperatureProfile:
+    """Piecewise linear setpoint over time since the pulse start."""
+
+    def __init__(self, points):
+        self.points = sorted((float(t), float(temp)) for t, temp in points)
+        if not self.points:
+            raise ValueError("empty temperature profile")
+
+    @property
+    def duration(self):
+        return self.points[-1][0]
+
+    def setpoint(self, t):
+        if t <= self.points[0][0]:
+            return self.points[0][1]
+        for (t0, v0), (t1, v1) in zip(self.points, self.points[1:]):
+            if t <= t1:
+                return v0 + (v1 - v0) * (t - t0) / (t1 - t0) if t1 > t0 else v1
+        return self.points[-1][1]
+
+
+class SMAController(threading.Thread):
+    """Drives the SMA PWM output from the sampler ring once begin() is called."""
+
+    def __init__(self, pin, ring, channel, mode="bang_bang", target_temp_c=70.0, max_heat_time=90.0,
+                 max_temp_c=None, profile=None, gains=(0.1, 0.0, 0.0), feed_forward=0.0,
+                 pwm_freq=50, stall_timeout=2.0, debug=False):
+        super().__init__(name="sma-control", daemon=True)
+        if mode not in CONTROL_MODES:
+            raise ValueError(f"unknown SMA control mode: {mode}")
+        self.pin = pin
+        self.ring = ring
+        self.channel_key = f"ch{channel}"
+        self.mode = mode
+        self.target_temp_c = target_temp_c
+        self.max_heat_time = max_heat_time
+        self.max_temp_c = max_temp_c
+        self.profile = TemperatureProfile(profile or [(0.0, target_temp_c)])
+        self.pid = PID(*gains)
+        self.feed_forward = feed_forward     # duty per C of setpoint above the pre-pulse temperature
+        self.stall_timeout = stall_timeout
+        self.debug = debug
+
+        self.active = False            # True while heating (reported to the host as sma_active)
+        self.on_time = None            # time.time() heating started / ended, to tag samples taken before a transition
+        self.off_time = None
+        self.finished = False
+        self.stop_reason = ""
+        self.duty = 0.0
+        self.last_temp = None
+        self.max_error = 0.0           # Largest |setpoint - temp| while holding a PID profile
+        self._start_time = None
+        self._ambient = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._pwm = GPIO.PWM(pin, pwm_freq)
+        self._pwm.start(0)
+
+    def begin(self, start_time):
+        """Start heating; profile times are relative to start_time (time.time())."""
+        with self._lock:
+            latest = self.ring.latest()
+            self._ambient = latest[2].get(self.channel_key) if latest else None
+            self._start_time = start_time
+            self.pid.reset()
+            self.active = True
+            self.on_time, self.off_time = start_time, None
+            self._set_duty(1.0 if self.mode == "bang_bang" else self._pid_duty(self._ambient, start_time))
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self._off("stopped")
+        if self._pwm is not None:
+            self._pwm.stop()
+            self._pwm = None      # Frees the pin for the next run's controller
+        GPIO.output(self.pin, GPIO.LOW)
+
+    def active_at(self, timestamp):
+        """Whether heating was on at `timestamp` (time.time(), e.g. a sampler tick)."""
+        with self._lock:
+            if self.on_time is None or timestamp < self.on_time:
+                return False
+            return self.off_time is None or timestamp < self.off_time
+
+    def _set_duty(self, duty):
+        self.duty = duty
+        if self._pwm is not None:
+            self._pwm.ChangeDutyCycle(duty * 100)
+
+    def _off(self, reason):
+        with self._lock:
+            if self.active:
+                self.active = False
+                self.off_time = time.time()
+                self.finished = True
+                self.stop_reason = reason
+            self._set_duty(0.0)
+
+    def _pid_duty(self, temp, now):
+        if temp is None:
+            return 0.0
+        setpoint = self.profile.setpoint(now - self._start_time)
+        bias = self.feed_forward * (setpoint - self._ambient) if self._ambient is not None else 0.0
+        return self.pid.update(setpoint, temp, now, max(bias, 0.0))
+
+    def _control(self, temp, now):
+        """Apply one control step for a new main channel reading. Returns the reason heating ended, if it did."""
+        elapsed = now - self._start_time
+        if temp is None:
+            return "read_error"
+        if self.max_temp_c is not None and temp >= self.max_temp_c:
+            return "over_temp"
+        if elapsed >= self.max_heat_time:
+            return "max_heat_time"
+        if self.mode == "bang_bang":
+            return "target_temp" if temp >= self.target_temp_c else None
+        if elapsed >= self.profile.duration and self.profile.duration > 0:
+            return "profile_done"
+        if elapsed >= self.profile.points[0][0]:
+            self.max_error = max(self.max_error, abs(self.profile.setpoint(elapsed) - temp))
+        self._set_duty(self._pid_duty(temp, now))
+        return None
+
+    def run(self):
+        last_seq = 0
+        last_sample = time.monotonic()
+        while not self._stop_event.is_set():
+            samples = self.ring.wait_since(last_seq, 0.1)
+            if samples:
+                last_seq = samples[-1][0]
+                last_sample = time.monotonic()
+            with self._lock:
+                if not self.active:
+                    continue
+                if not samples:
+                    if time.monotonic() - last_sample > self.stall_timeout:
+                        reason = "sampler_stall"
+                    else:
+                        continue
+                else:
+                    # Only the newest reading matters for control
+                    self.last_temp = samples[-1][2].get(self.channel_key)
+                    reason = self._control(self.last_temp, time.time())
+            if reason:
+                self._off(reason)
+                print(f"[INFO] SMA pulse ended (reason: {reason}). Temp: {self.last_temp}C, "
+                      f"Time: {time.time() - self._start_time:.1f}s")
+            elif self.debug and samples:
+                print(f"[DEBUG] SMA control: temp={self.last_temp} C, duty={self.duty:.2f}")
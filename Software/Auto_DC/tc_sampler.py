@@ -0,0 +1,116 @@
+# """
+# (Pi) Thermocouple Sampler
+# Dedicated MCC 134 acquisition thread on a monotonic deadline scheduler.
+#
+# Every tick the sampler reads each configured channel exactly once and
+# publishes one sample (wall-clock timestamp + temperatures) into a shared
+# ring buffer. The SMA control logic and the telemetry sent to the host both
+# consume those samples, so channel 0 is no longer read twice per cycle.
+#
+# Ticks are scheduled on absolute time.monotonic() deadlines (start + n *
+# period), so variable read latency does not accumulate as drift. If a tick
+# is missed entirely (reads slower than the period), the schedule skips
+# ahead instead of bursting, and the skip is counted in `overruns`.
+#
+# Note: the MCC 134 refreshes its thermocouple readings about once per second,
+# so sampling faster than that repeats values; the period is a rate cap.
+# """
+
+# === Import libraries ===
+import threading
+import time
+from collections import deque
+
+
+class SampleRing:
+    """Thread-safe fixed-size ring of (seq, timestamp, temps) samples."""
+
+    def __init__(self, capacity=256):
+        self._samples = deque(maxlen=capacity)
+        self._lock = threading.Condition()
+        self._seq = 0
+
+    def publish(self, timestamp, temps):
+        with self._lock:
+            self._seq += 1
+            self._samples.append((self._seq, timestamp, temps))
+            self._lock.notify_all()
+
+    def since(self, seq):
+        """Samples published after sequence number `seq`, oldest first."""
+        with self._lock:
+            if not self._samples or self._samples[-1][0] <= seq:
+                return []
+            return [s for s in self._samples if s[0] > seq]
+
+    def wait_since(self, seq, timeout):
+        """Like since(), but waits up to `timeout` seconds for a new sample."""
+        with self._lock:
+            self._lock.wait_for(lambda: self._seq > seq, timeout)
+        return self.since(seq)
+
+    def latest(self):
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class ThermocoupleSampler(threading.Thread):
+    """Reads every channel once per tick and publishes the sample into `ring`."""
+
+    def __init__(self, hat, channels, period, ring=None, debug=False):
+        super().__init__(name="tc-sampler", daemon=True)
+        self.hat = hat
+        self.channels = list(channels)
+        self.period = period
+        self.ring = ring if ring is not None else SampleRing()
+        self.debug = debug
+        self.next_tick = time.monotonic()
+        self.ticks = 0
+        self.overruns = 0          # Ticks skipped because reading took longer than the period
+        self.read_errors = 0
+        self.max_jitter = 0.0      # Worst lateness of a tick start (seconds)
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def read_channels(self):
+        temps = {}
+        for ch in self.channels:
+            try:
+                temps[f"ch{ch}"] = round(self.hat.t_in_read(ch), 2)
+            except Exception as e:
+                temps[f"ch{ch}"] = None
+                self.read_errors += 1
+                if self.debug:
+                    print(f"[ERROR] Temp read failed for ch{ch}: {e}")
+        return temps
+
+    def run(self):
+        start = time.monotonic()
+        tick = 0
+        while not self._stop_event.is_set():
+            self.next_tick = start + tick * self.period
+            delay = self.next_tick - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            self.max_jitter = max(self.max_jitter, time.monotonic() - self.next_tick)
+            timestamp = time.time()
+            self.ring.publish(timestamp, self.read_channels())
+            self.ticks += 1
+            # Next deadline after now (skipping ticks that were missed entirely)
+            elapsed_ticks = int((time.monotonic() - start) / self.period) + 1
+            if elapsed_ticks > tick + 1:
+                self.overruns += elapsed_ticks - tick - 1
+            tick = max(tick + 1, elapsed_ticks)
+        self.next_tick = float("inf")
+
+    def stats(self):
+        return (f"ticks={self.ticks}, overruns={self.overruns}, read errors={self.read_errors}, "
+                f"max jitter={self.max_jitter*1000:.1f} ms")
@@ -0,0 +1,112 @@
+# """
+# (PC) Host Live Telemetry
+# Publishes matched samples and rig state to the web dashboard as
+# server-sent events (SSE) from a small HTTP server on the host's event loop.
+#
+#   GET /events  - text/event-stream; "sample" and "state" events with JSON data
+#   GET /latest  - JSON snapshot of the latest sample and state of every rig
+#
+# publish() never blocks acquisition: every client has a bounded queue and
+# events are dropped for clients that can't keep up. The dashboard
+# (Dashboard_app/web_ui/app.py) relays /events to the browser.
+# """
+
+# === Import libraries ===
+import asyncio
+import json
+
+KEEPALIVE_SEC = 15.0           # Comment line sent to idle clients so proxies keep the stream open
+
+
+class TelemetryServer:
+    """SSE publisher for live rig data. All methods run on the host's asyncio event loop."""
+
+    def __init__(self, host="127.0.0.1", port=5006, client_queue=500):
+        self.host = host
+        self.port = port
+        self.client_queue = client_queue
+        self.dropped_events = 0
+        self._clients = set()
+        self._latest = {}          # rig -> {"sample": {...}, "state": {...}}
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"[INFO] Live telemetry at http://{self.host}:{self.port}/events")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # wait_closed() also waits for open connections (Python 3.12.1+): end the /events streams first
+            for queue in list(self._clients):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, event, data):
+        """Send one event ("sample", "state", ...) with a JSON-serializable dict to every client."""
+        self._latest.setdefault(data.get("rig"), {})[event] = data
+        message = self._encode(event, data)
+        for queue in list(self._clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped_events += 1
+
+    @staticmethod
+    def _encode(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+    # --- HTTP ---
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5.0)
+            while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b"\r\n", b"\n", b""):
+                pass    # Headers are not needed
+            parts = request.decode(errors="replace").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path.startswith("/events"):
+                await self._stream_events(writer)
+            elif path.startswith("/latest"):
+                body = json.dumps(self._latest).encode()
+                writer.write(self._headers("200 OK", "application/json", len(body)) + body)
+                await writer.drain()
+            else:
+                writer.write(self._headers("404 Not Found", "text/plain", 0))
+                await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _headers(status, content_type, length=None):
+        lines = [f"HTTP/1.1 {status}", f"Content-Type: {content_type}", "Cache-Control: no-cache",
+                 "Access-Control-Allow-Origin: *", "Connection: close"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    async def _stream_events(self, writer):
+        queue = asyncio.Queue(maxsize=self.client_queue)
+        writer.write(self._headers("200 OK", "text/event-stream"))
+        # New clients start from the latest state of every rig
+        for rig_events in self._latest.values():
+            for event, data in rig_events.items():
+                writer.write(self._encode(event, data))
+        await writer.drain()
+        self._clients.add(queue)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break       # Server closing
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self._clients.discard(queue)
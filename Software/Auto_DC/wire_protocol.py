@@ -0,0 +1,284 @@
+# """
+# Pi <-> Host Wire Protocol
+# Shared by Pi_Client.py and auto_dataCollection_Host.py.
+#
+# Protocol 1 (legacy): newline-delimited text commands and JSON sample packets.
+# Protocol 2 (binary): length-prefixed frames. Every frame starts with a fixed
+# header (magic, protocol version, message type, payload length). Sample frames
+# carry one or more fixed-size sample records:
+#   run index (uint32), timestamp (float64), N channels (float32), flags (uint16)
+# Missing channel readings are sent as NaN.
+#
+# The version is negotiated in the initial config_packet handshake: the host
+# lists the versions it supports, the Pi answers with the one it picked. The Pi
+# uses MessageStream (blocking socket) and the host uses AsyncMessageStream
+# (asyncio); both reassemble messages from the TCP byte stream no matter how
+# recv() splits or merges them.
+# """
+
+# === Import libraries ===
+import asyncio
+import json
+import math
+import socket
+import struct
+from collections import deque
+
+################################ PROTOCOL CONSTANTS ###########################
+PROTOCOL_JSON   = 1            # Newline-delimited text / JSON (legacy)
+PROTOCOL_BINARY = 2            # Length-prefixed binary frames
+SUPPORTED_PROTOCOLS = [PROTOCOL_BINARY, PROTOCOL_JSON]   # Most preferred first
+
+NUM_CHANNELS = 4               # Channel slots per sample record (MCC 134 has 4)
+
+FRAME_MAGIC  = b"SF"
+FRAME_HEADER = struct.Struct("<2sBBI")   # magic, version, message type, payload length
+MAX_PAYLOAD  = 1 << 20         # Reject frames larger than 1 MB (corrupt stream)
+
+MSG_TEXT    = 1                # UTF-8 control message ("sync", "ready", "sync_ts:...", ...)
+MSG_SAMPLES = 2                # One or more sample records
+
+FLAG_SMA_ACTIVE = 0x0001
+
+RECV_SIZE = 4096
+
+
+class ProtocolError(ValueError):
+    """Raised when the byte stream cannot be decoded."""
+
+
+def sample_struct(n_channels=NUM_CHANNELS):
+    """Return the struct for one sample record with n_channels float32 channels."""
+    return struct.Struct(f"<Id{n_channels}fH")
+
+
+def choose_protocol(offered):
+    """Pick the most preferred protocol version that both sides support."""
+    for version in SUPPORTED_PROTOCOLS:
+        if version in offered:
+            return version
+    return PROTOCOL_JSON
+
+
+############################### Sample Records ################################
+def packet_to_record(packet, n_channels=NUM_CHANNELS):
+    """Convert a sample packet dict (as sent in protocol 1) to a record tuple."""
+    temps = packet.get("temperatures_C", {})
+    channels = []
+    for ch in range(n_channels):
+        value = temps.get(f"ch{ch}")
+        channels.append(math.nan if value is None else value)
+    flags = FLAG_SMA_ACTIVE if packet.get("sma_active") else 0
+    return (packet.get("run_index", 0), packet["timestamp"], *channels, flags)
+
+def record_to_packet(record):
+    """Convert a record tuple back to the sample packet dict used by the host."""
+    run_index, timestamp, *channels, flags = record
+    temps = {f"ch{ch}": round(value, 2) for ch, value in enumerate(channels) if not math.isnan(value)}
+    return {
+        "run_index": run_index,
+        "timestamp": timestamp,
+        "temperatures_C": temps,
+        "sma_active": bool(flags & FLAG_SMA_ACTIVE)
+    }
+
+def encode_frame(msg_type, payload):
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload too large: {len(payload)} bytes")
+    return FRAME_HEADER.pack(FRAME_MAGIC, PROTOCOL_BINARY, msg_type, len(payload)) + payload
+
+
+############################# Stream Reassemblers #############################
+class FrameDecoder:
+    """Incremental decoder for protocol 2 frames. feed() returns complete (type, payload) frames."""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data):
+        self._buf.extend(data)
+        frames = []
+        while len(self._buf) >= FRAME_HEADER.size:
+            magic, version, msg_type, length = FRAME_HEADER.unpack_from(self._buf)
+            if magic != FRAME_MAGIC or version != PROTOCOL_BINARY or length > MAX_PAYLOAD:
+                self._buf.clear()
+                raise ProtocolError(f"Bad frame header (magic={magic!r}, version={version}, length={length})")
+            end = FRAME_HEADER.size + length
+            if len(self._buf) < end:
+                break   # Wait for the rest of the frame
+            frames.append((msg_type, bytes(self._buf[FRAME_HEADER.size:end])))
+            del self._buf[:end]
+        return frames
+
+    def take_buffer(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+class LineDecoder:
+    """Incremental decoder for protocol 1. feed() returns complete, stripped, non-empty lines."""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data):
+        self._buf.extend(data)
+        lines = []
+        while True:
+            end = self._buf.find(b"\n")
+            if end < 0:
+                break
+            line = self._buf[:end].decode(errors="replace").strip()
+            del self._buf[:end + 1]
+            if line:
+                lines.append(line)
+        return lines
+
+    def take_buffer(self):
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+################################ Message Codec ################################
+class MessageCodec:
+    """
+    Encodes and decodes messages in the negotiated protocol (no I/O).
+
+    Decoded messages are either str (control text) or dict (sample packets and
+    JSON handshake messages).
+    """
+
+    def __init__(self, version=PROTOCOL_JSON, n_channels=NUM_CHANNELS):
+        self.version = version
+        self.n_channels = n_channels
+        self._record = sample_struct(n_channels)
+        self._decoder = FrameDecoder() if version == PROTOCOL_BINARY else LineDecoder()
+        self._pending = deque()
+
+    def set_version(self, version, n_channels=None):
+        """Switch protocol after the handshake, keeping any bytes already received."""
+        leftover = self._decoder.take_buffer()
+        self.version = version
+        if n_channels is not None:
+            self.n_channels = n_channels
+            self._record = sample_struct(n_channels)
+        self._decoder = FrameDecoder() if version == PROTOCOL_BINARY else LineDecoder()
+        if leftover:
+            self._pending.extend(self._decode(leftover))
+
+    # --- Encoding ---
+    def encode_text(self, text):
+        if self.version == PROTOCOL_BINARY:
+            return encode_frame(MSG_TEXT, text.encode())
+        return (text + "\n").encode()
+
+    def encode_json(self, obj):
+        """Encode a JSON handshake message (always a JSON line, sent before negotiation)."""
+        return (json.dumps(obj) + "\n").encode()
+
+    def encode_packets(self, packets):
+        """Encode one or more sample packet dicts into a single message."""
+        if self.version == PROTOCOL_BINARY:
+            payload = b"".join(self._record.pack(*packet_to_record(p, self.n_channels)) for p in packets)
+            return encode_frame(MSG_SAMPLES, payload)
+        return b"".join((json.dumps(p) + "\n").encode() for p in packets)
+
+    # --- Decoding ---
+    def _decode(self, data):
+        messages = []
+        if self.version == PROTOCOL_BINARY:
+            for msg_type, payload in self._decoder.feed(data):
+                if msg_type == MSG_TEXT:
+                    messages.append(payload.decode(errors="replace").strip())
+                elif msg_type == MSG_SAMPLES:
+                    if len(payload) % self._record.size:
+                        raise ProtocolError(f"Sample payload of {len(payload)} bytes is not a multiple of {self._record.size}")
+                    messages.extend(record_to_packet(r) for r in self._record.iter_unpack(payload))
+                else:
+                    raise ProtocolError(f"Unknown message type {msg_type}")
+        else:
+            for line in self._decoder.feed(data):
+                if line.startswith("{"):
+                    try:
+                        messages.append(json.loads(line))
+                        continue
+                    except json.JSONDecodeError:
+                        pass
+                messages.append(line)
+        return messages
+
+    def has_pending(self):
+        return bool(self._pending)
+
+
+################################ Message Streams ##############################
+class MessageStream(MessageCodec):
+    """Blocking socket wrapper. recv_message() returns None on socket timeout."""
+
+    def __init__(self, sock, version=PROTOCOL_JSON, n_channels=NUM_CHANNELS):
+        super().__init__(version, n_channels)
+        self.sock = sock
+
+    def send_text(self, text):
+        self.sock.sendall(self.encode_text(text))
+
+    def send_json(self, obj):
+        self.sock.sendall(self.encode_json(obj))
+
+    def send_packets(self, packets):
+        self.sock.sendall(self.encode_packets(packets))
+
+    def recv_message(self):
+        """Return the next message, or None if the socket timed out before one was complete."""
+        while not self._pending:
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except socket.timeout:
+                return None
+            if not data:
+                raise ConnectionResetError("Connection closed by peer")
+            self._pending.extend(self._decode(data))
+        return self._pending.popleft()
+
+
+class AsyncMessageStream(MessageCodec):
+    """asyncio (StreamReader/StreamWriter) wrapper used by the host server."""
+
+    def __init__(self, reader, writer, version=PROTOCOL_JSON, n_channels=NUM_CHANNELS):
+        super().__init__(version, n_channels)
+        self.reader = reader
+        self.writer = writer
+
+    async def _send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def send_text(self, text):
+        await self._send(self.encode_text(text))
+
+    async def send_json(self, obj):
+        await self._send(self.encode_json(obj))
+
+    async def send_packets(self, packets):
+        await self._send(self.encode_packets(packets))
+
+    async def recv_message(self, timeout=None):
+        """Return the next message, or None if nothing complete arrived within timeout seconds."""
+        while not self._pending:
+            try:
+                data = await asyncio.wait_for(self.reader.read(RECV_SIZE), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if not data:
+                raise ConnectionResetError("Connection closed by peer")
+            self._pending.extend(self._decode(data))
+        return self._pending.popleft()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
@@ -0,0 +1,153 @@
+import cv2
+import numpy as np
+import csv
+import json
+import time
+from datetime import datetime
+import os
+from camera_model import CameraModel
+from marker_detection import detect_markers
+from marker_tracker import MarkerTracker, ColumnMap
+from multicam import RIG_FILE, SyncedCapture, Triangulator, load_rig, open_camera, projection_matrix
+
+# Multi-camera 3D motion capture.
+# Run multicam_calibration.py first: it saves the pose of every camera
+# (multicam_calibration.npz). Each camera is grabbed, undistorted, searched for
+# markers and tracked in 2D on its own thread; the synchronized 2D tracks are
+# matched across views and triangulated (DLT) into 3D mm coordinates, which are
+# tracked in 3D to keep one persistent ID (and CSV column) per marker.
+# At least two cameras must see a marker; with many markers, use three or more
+# cameras so matches along epipolar lines are not ambiguous.
+
+RESOLUTION = (1920, 1080)
+max_markers = 8  # CSV columns (Marker_N_X/Y/Z_mm)
+distance_threshold = 20  # Max distance (px) between a marker's predicted and detected position in each view
+distance_threshold_mm = 15  # Max distance (mm) between a marker's predicted and triangulated position
+max_reprojection_px = 3.0  # Max reprojection error of a triangulated marker
+show_preview = True
+
+rig = load_rig(RIG_FILE)
+camera_ids = sorted(rig)
+if len(camera_ids) < 2:
+    print(f"Error: {RIG_FILE} has fewer than two cameras.")
+    exit()
+
+models = []
+for cam_id in camera_ids:
+    model = CameraModel(rig[cam_id]["calib"])
+    if model.calib_hash != rig[cam_id]["calib_hash"]:
+        print(f"Warning: intrinsics of camera {cam_id} changed since the rig calibration. Run multicam_calibration.py again.")
+    models.append(model)
+trackers_2d = [MarkerTracker(max_tracks=4 * max_markers, max_distance=distance_threshold) for _ in camera_ids]
+tracker = MarkerTracker(max_tracks=max_markers, max_distance=distance_threshold_mm, reid_distance=4 * distance_threshold_mm,
+                        process_noise=500.0, measurement_noise=1.0, dim=3)
+column_map = ColumnMap(max_markers)
+
+# Ensure data_output directory exists
+os.makedirs('data_output', exist_ok=True)
+
+# Create CSV file with headers
+csv_filename = os.path.join('data_output', f"marker_positions_3d_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+csv_file = open(csv_filename, 'w', newline='')
+csv_writer = csv.writer(csv_file)
+headers = ['Timestamp', 'Sync_Spread_ms']
+for i in range(max_markers):
+    headers.extend([f'Marker_{i}_X_mm', f'Marker_{i}_Y_mm', f'Marker_{i}_Z_mm'])
+csv_writer.writerow(headers)
+
+# Metadata next to the CSV: which marker IDs each Marker_N column held, and the rig
+metadata_filename = os.path.splitext(csv_filename)[0] + ".json"
+
+def write_metadata():
+    metadata = {"csv": os.path.basename(csv_filename),
+                "cameras": {str(cam_id): {"calib": rig[cam_id]["calib"], "rig_error_px": rig[cam_id]["error_px"]}
+                            for cam_id in camera_ids},
+                "tracker": {"max_distance_mm": tracker.max_distance, "max_misses": tracker.max_misses,
+                            "min_hits": tracker.min_hits, "reid_frames": tracker.reid_frames,
+                            "reid_distance_mm": tracker.reid_distance, "max_reprojection_px": max_reprojection_px},
+                "reidentified": tracker.reidentified,
+                "incomplete_frame_sets": capture.incomplete_sets,
+                **column_map.metadata()}
+    with open(metadata_filename, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    column_map.changed = False
+
+
+# Runs on each camera's worker thread
+def process_frame(index, frame, timestamp):
+    frame_height, frame_width = frame.shape[:2]
+    frame = models[index].undistort(frame)
+    circles, _ = detect_markers(frame)
+    tracks = trackers_2d[index].update(circles, timestamp)
+    ids = [track[0] for track in tracks]
+    points = models[index].normalize([(x, y) for _, x, y, _, _ in tracks], frame_width, frame_height)
+    preview = None
+    if show_preview:
+        for track_id, x, y, r, detected in tracks:
+            cv2.circle(frame, (int(x), int(y)), int(r) + 5, (0, 255, 0) if detected else (0, 255, 255), 2)
+        preview = cv2.resize(frame, (640, 360))
+    return points, ids, preview
+
+
+projections = [projection_matrix(rig[cam_id]["R"], rig[cam_id]["t"]) for cam_id in camera_ids]
+# Focal length (px) of each view, to express reprojection errors in pixels
+focal_px = [model.roi_matrix(*RESOLUTION)[0, 0] for model in models]
+triangulator = Triangulator(projections, focal_px, max_reprojection_px)
+
+caps = [open_camera(cam_id, RESOLUTION) for cam_id in camera_ids]
+capture = SyncedCapture(caps, process_frame)
+capture.start()
+print(f"3D capture running with cameras {camera_ids}. Press 'q' in the preview window (or Ctrl+C) to stop.")
+
+frame_sets = 0
+status_time = time.time()
+try:
+    while True:
+        timestamps, results = capture.next_set()
+        seen = [ts for ts in timestamps if ts is not None]
+        if not seen:
+            continue
+        set_time = sum(seen) / len(seen)
+        spread_ms = (max(seen) - min(seen)) * 1000  # Grab time difference between the cameras
+
+        views = [r[0] if r is not None else np.zeros((0, 2)) for r in results]
+        ids = [r[1] if r is not None else [] for r in results]
+        markers = triangulator.match(views, ids)
+        tracks = tracker.update([(X[0], X[1], X[2], len(members)) for X, members, _ in markers], set_time)
+        column_map.release(tracker.dropped)
+
+        # Prepare row data for CSV
+        csv_row = [datetime.fromtimestamp(set_time).strftime('%Y-%m-%d %H:%M:%S.%f'), round(spread_ms, 1)]
+        marker_positions = {i: None for i in range(max_markers)}
+        for track_id, x, y, z, n_views, detected in tracks:
+            marker_num = column_map.column(track_id, set_time)
+            if marker_num is not None:
+                marker_positions[marker_num] = (round(x, 2), round(y, 2), round(z, 2))
+        for i in range(max_markers):
+            csv_row.extend(marker_positions[i] if marker_positions[i] is not None else ['', '', ''])
+        csv_writer.writerow(csv_row)
+        if column_map.changed:
+            write_metadata()
+
+        frame_sets += 1
+        if time.time() - status_time >= 5.0:
+            print(f"{frame_sets / (time.time() - status_time):.1f} frame sets/s, {len(tracks)} markers, "
+                  f"sync spread {spread_ms:.1f} ms, incomplete sets {capture.incomplete_sets}")
+            frame_sets = 0
+            status_time = time.time()
+
+        if show_preview:
+            previews = [r[2] if r is not None and r[2] is not None else np.zeros((360, 640, 3), np.uint8) for r in results]
+            cv2.imshow('Multi-Camera Tracking', np.hstack(previews))
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+except KeyboardInterrupt:
+    pass
+
+capture.stop()
+for cap in caps:
+    cap.release()
+cv2.destroyAllWindows()
+csv_file.close()  # Close the CSV file
+write_metadata()
+print(f"Marker positions have been saved to {csv_filename} (marker ID columns: {metadata_filename})")
@@ -1,59 +1,150 @@
 import cv2
 import numpy as np
 import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Camera (intrinsics) calibration from checkerboard images.
+# Corners are detected in a process pool (one image per process) and refined
+# with cornerSubPix. Each image's corners are cached in CORNER_CACHE, keyed by
+# the hash of the file and the board, so only new or changed images are
+# detected on the next run. After calibrating, images whose reprojection error
+# is far above the others are dropped and the camera is calibrated again.
+# For the multi-camera mocap, calibrate each camera with its own images and
+# rename the output to camera_calibration_cam<ID>.npz.
+
+IMAGE_DIR = "calibration_images"
+OUTPUT_FILE = "camera_calibration.npz"
+CORNER_CACHE = "calibration_corner_cache.json"
 
 # Define checkerboard dimensions
 CHECKERBOARD = (7, 7)  # Adjust based on your calibration board
 square_size = 25.4  # Size of a square in mm (change accordingly)
 
+# Bad frames: an image is dropped when its reprojection error is above
+# MAX_ERROR_RATIO x the median error (and above MIN_DROP_ERROR_PX)
+MAX_ERROR_RATIO = 2.0
+MIN_DROP_ERROR_PX = 0.5
+MIN_IMAGES = 5  # Never drop below this many images
+
 # Prepare object points
 objp = np.zeros((CHECKERBOARD[0] * CHECKERBOARD[1], 3), np.float32)
 objp[:, :2] = np.mgrid[0:CHECKERBOARD[0], 0:CHECKERBOARD[1]].T.reshape(-1, 2) * square_size
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
 
-# Arrays to store object points and image points
-objpoints = []  # 3D points
-imgpoints = []  # 2D points
-
-# Load all checkerboard images
-images = glob.glob("calibration_images/*.*")  # Gets all image files
-print("All image files:", images)
 
+def cache_key(fname):
+    with open(fname, "rb") as f:
+        file_hash = hashlib.sha1(f.read()).hexdigest()
+    return f"{file_hash}_{CHECKERBOARD[0]}x{CHECKERBOARD[1]}"
 
 
-for fname in images:
+# Runs in the worker processes
+def find_corners(fname):
     img = cv2.imread(fname)
     if img is None:
-        print(f"Failed to load {fname}")
-        continue
-
+        return {"loaded": False}
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
     ret, corners = cv2.findChessboardCorners(gray, CHECKERBOARD, None)
-    
+    result = {"loaded": True, "size": list(gray.shape[::-1]), "corners": None}
     if ret:
-        print(f"Checkerboard detected in {fname}")
-        objpoints.append(objp)
-        imgpoints.append(corners)
-    else:
-        print(f"Failed to detect checkerboard in {fname}")
-
-
-cv2.destroyAllWindows()
-
-if len(objpoints) == 0 or len(imgpoints) == 0:
-    print("No valid checkerboard images found! Exiting.")
-    exit()
-
-ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
-    objpoints, imgpoints, gray.shape[::-1], None, None
-)
-
-
-# Calibrate camera
-ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
-
-# Save calibration results
-np.savez("camera_calibration.npz", camera_matrix=camera_matrix, dist_coeffs=dist_coeffs)
-
-print("Camera Matrix:\n", camera_matrix)
-print("Distortion Coefficients:\n", dist_coeffs)
+        # Refinement window up to 11 px, but well inside one square (boards far away or at a steep angle)
+        grid = corners.reshape(CHECKERBOARD[1], CHECKERBOARD[0], 2)
+        spacing = min(np.linalg.norm(np.diff(grid, axis=0), axis=2).min(),
+                      np.linalg.norm(np.diff(grid, axis=1), axis=2).min())
+        win = int(np.clip(0.4 * spacing, 2, 11))
+        corners = cv2.cornerSubPix(gray, corners, (win, win), (-1, -1), criteria)
+        result["corners"] = corners.reshape(-1, 2).tolist()
+    return result
+
+
+def load_cache():
+    if not os.path.exists(CORNER_CACHE):
+        return {}
+    try:
+        with open(CORNER_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {CORNER_CACHE} ({e}), detecting all images again")
+        return {}
+
+
+def save_cache(cache):
+    tmp_path = CORNER_CACHE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, CORNER_CACHE)
+
+
+def calibrate(imgpoints, image_size):
+    ret, camera_matrix, dist_coeffs, rvecs, tvecs, _, _, per_view_errors = cv2.calibrateCameraExtended(
+        [objp] * len(imgpoints), imgpoints, image_size, None, None)
+    return ret, camera_matrix, dist_coeffs, per_view_errors.reshape(-1)
+
+
+if __name__ == "__main__":
+    # Load all checkerboard images
+    images = sorted(glob.glob(os.path.join(IMAGE_DIR, "*.*")))  # Gets all image files
+    print(f"{len(images)} image files in {IMAGE_DIR}")
+
+    cache = load_cache()
+    keys = {fname: cache_key(fname) for fname in images}
+    to_detect = [fname for fname in images if keys[fname] not in cache]
+    print(f"{len(images) - len(to_detect)} images cached, detecting corners in {len(to_detect)}")
+    if to_detect:
+        with ProcessPoolExecutor() as pool:
+            for fname, result in zip(to_detect, pool.map(find_corners, to_detect)):
+                if not result["loaded"]:
+                    print(f"Failed to load {fname}")
+                    continue
+                cache[keys[fname]] = result
+        save_cache(cache)
+
+    # Collect the detections (all images must have the same size)
+    names, imgpoints, image_size = [], [], None
+    for fname in images:
+        result = cache.get(keys[fname])
+        if result is None:
+            continue
+        if result["corners"] is None:
+            print(f"Failed to detect checkerboard in {fname}")
+            continue
+        size = tuple(result["size"])
+        if image_size is None:
+            image_size = size
+        elif size != image_size:
+            print(f"Skipping {fname}: size {size} differs from {image_size}")
+            continue
+        names.append(fname)
+        imgpoints.append(np.array(result["corners"], np.float32).reshape(-1, 1, 2))
+
+    if len(imgpoints) == 0:
+        print("No valid checkerboard images found! Exiting.")
+        exit()
+    print(f"Checkerboard detected in {len(imgpoints)} images")
+
+    # Calibrate camera, dropping bad frames until every image is consistent with the others
+    dropped = {}
+    while True:
+        ret, camera_matrix, dist_coeffs, errors = calibrate(imgpoints, image_size)
+        threshold = max(MAX_ERROR_RATIO * np.median(errors), MIN_DROP_ERROR_PX)
+        worst = int(np.argmax(errors))
+        if errors[worst] <= threshold or len(imgpoints) <= MIN_IMAGES:
+            break
+        dropped[names[worst]] = float(errors[worst])
+        print(f"Dropping {names[worst]}: reprojection error {errors[worst]:.3f} px (threshold {threshold:.3f} px)")
+        del names[worst], imgpoints[worst]
+
+    print("Per-image reprojection error (px):")
+    for fname, error in sorted(zip(names, errors), key=lambda item: -item[1]):
+        print(f"  {fname}: {error:.3f}")
+    print(f"RMS reprojection error: {ret:.3f} px over {len(names)} images ({len(dropped)} dropped)")
+
+    # Save calibration results
+    np.savez(OUTPUT_FILE, camera_matrix=camera_matrix, dist_coeffs=dist_coeffs,
+             rms_error=ret, image_files=np.array(names), image_errors=errors)
+
+    print("Camera Matrix:\n", camera_matrix)
+    print("Distortion Coefficients:\n", dist_coeffs)
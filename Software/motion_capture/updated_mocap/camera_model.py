@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+import hashlib
+import os
+import threading
+
+# Shared lens model for the mocap scripts.
+# The undistortion is precomputed once as fixed-point remap maps (instead of
+# cv2.getOptimalNewCameraMatrix + cv2.undistort on every frame) and only the
+# cropped region of interest is undistorted. Maps are cached on disk, keyed by
+# the calibration hash, the frame resolution and the crop.
+
+CACHE_DIR = "remap_cache"
+
+
+class CameraModel:
+    def __init__(self, calib_path="camera_calibration.npz", crop=None, alpha=1, cache_dir=CACHE_DIR):
+        # crop = (v_start, v_adj, h_start, h_adj): pixels removed from the top, bottom, left and right
+        calib_data = np.load(calib_path)
+        self.camera_matrix = calib_data["camera_matrix"]
+        self.dist_coeffs = calib_data["dist_coeffs"]
+        self.crop = tuple(crop) if crop is not None else (0, 0, 0, 0)
+        self.alpha = alpha
+        self.cache_dir = cache_dir
+        self.calib_hash = hashlib.sha1(self.camera_matrix.tobytes() + self.dist_coeffs.tobytes()).hexdigest()[:12]
+        self.maps = {}  # (width, height) -> (map1, map2)
+        self.roi_matrices = {}  # (width, height) -> camera matrix of the undistorted, cropped image
+
+    def roi(self, width, height):
+        """Crop rectangle (x0, y0, x1, y1) in full-frame pixels."""
+        v_start, v_adj, h_start, h_adj = self.crop
+        return h_start, v_start, width - h_adj, height - v_adj
+
+    def _cache_path(self, width, height):
+        crop = "_".join(str(v) for v in self.crop)
+        return os.path.join(self.cache_dir, f"remap_{self.calib_hash}_{width}x{height}_crop{crop}_a{self.alpha}.npz")
+
+    def roi_matrix(self, width, height):
+        """Camera matrix of the undistorted, cropped image."""
+        if (width, height) in self.roi_matrices:
+            return self.roi_matrices[(width, height)]
+        new_camera_matrix, _ = cv2.getOptimalNewCameraMatrix(self.camera_matrix, self.dist_coeffs,
+                                                             (width, height), self.alpha, (width, height))
+        # Shifting the principal point by the crop origin gives the maps of the ROI only
+        x0, y0, _, _ = self.roi(width, height)
+        roi_matrix = new_camera_matrix.copy()
+        roi_matrix[0, 2] -= x0
+        roi_matrix[1, 2] -= y0
+        self.roi_matrices[(width, height)] = roi_matrix
+        return roi_matrix
+
+    def normalize(self, points, width, height):
+        """Pixel coordinates in the undistorted, cropped image -> normalized camera coordinates (x/z, y/z)."""
+        K = self.roi_matrix(width, height)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        return (points - K[:2, 2]) / (K[0, 0], K[1, 1])
+
+    def _build_maps(self, width, height):
+        x0, y0, x1, y1 = self.roi(width, height)
+        return cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None, self.roi_matrix(width, height),
+                                           (x1 - x0, y1 - y0), cv2.CV_16SC2)
+
+    def maps_for(self, width, height):
+        """Remap maps for a frame size, loaded from the disk cache or built (and cached) once."""
+        if (width, height) in self.maps:
+            return self.maps[(width, height)]
+        x0, y0, x1, y1 = self.roi(width, height)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"Crop {self.crop} leaves no image at {width}x{height}")
+        path = self._cache_path(width, height)
+        maps = None
+        if os.path.exists(path):
+            try:
+                cached = np.load(path)
+                maps = (cached["map1"], cached["map2"])
+            except Exception as e:
+                print(f"Could not read cached undistortion maps {path}: {e}")
+        if maps is None:
+            maps = self._build_maps(width, height)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp.npz"  # Cameras may build the same maps at once
+            np.savez(tmp_path, map1=maps[0], map2=maps[1])
+            os.replace(tmp_path, path)
+            print(f"Saved undistortion maps to {path}")
+        self.maps[(width, height)] = maps
+        return maps
+
+    def undistort(self, frame):
+        """Undistorted, cropped frame (same result as cv2.undistort followed by the crop)."""
+        frame_height, frame_width = frame.shape[:2]
+        map1, map2 = self.maps_for(frame_width, frame_height)
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+# Marker detection shared by the 2D and multi-camera mocap scripts
+
+# Function to detect SOLID circular markers
+def detect_markers(frame, min_radius=5, max_radius=25):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    # Apply CLAHE for better contrast
+    clahe = cv2.createCLAHE(clipLimit=1, tileGridSize=(8, 8))
+    enhanced_gray = clahe.apply(gray)
+
+    # Apply Median Blur to reduce noise while keeping edges
+    blurred = cv2.medianBlur(enhanced_gray, 5)
+
+    # Canny Edge Detection
+    edges = cv2.Canny(blurred, 200, 255) # Lower and upper thresholds
+
+    # **Use Otsu's Thresholding Instead of Adaptive Thresholding**
+    _, binary = cv2.threshold(edges, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # binary = cv2.bitwise_not(binary)
+
+    #dilation to close gaps
+    kernel = np.ones((3,3), np.uint8)
+    kernel1 = np.ones((4,4), np.uint8)
+    kernel2 = np.ones((2,2), np.uint8)
+    binary = cv2.dilate(binary,kernel1,iterations=2) # DEFAULT: 2
+    binary = cv2.erode(binary,kernel2,iterations=3) # DEFAULT: 3
+    # binary = cv2.dilate(binary,kernel1,iterations=1) # Not in original
+    # binary = cv2.erode(binary,kernel2,iterations=4) # Not in original
+    # binary = cv2.dilate(binary,kernel1,iterations=1) # Not in original
+    # binary = cv2.erode(binary,kernel2,iterations=1) # Not in original
+
+
+
+    # **Find contours instead of using HoughCircles**
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    detected_circles = []
+    for cnt in contours:
+        perimeter = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.02 * perimeter, True)
+
+        # Compute circularity (roundness measure)
+        area = cv2.contourArea(cnt)
+        if perimeter == 0:
+            continue
+        circularity = 4 * np.pi * (area / (perimeter ** 2))  # Close to 1 for perfect circles
+
+        # Filter out non-circular and small/large objects
+        if .7 < circularity < 1.2 and area > 40:  # Reverted to original values
+            (x, y), radius = cv2.minEnclosingCircle(cnt)
+            radius = int(radius)
+            if min_radius <= radius <= max_radius:
+                detected_circles.append((int(x), int(y), radius))
+
+    return detected_circles, binary
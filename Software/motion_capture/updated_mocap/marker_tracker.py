@@ -0,0 +1,233 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment  # Optimal assignment (optional)
+except ImportError:
+    linear_sum_assignment = None
+
+# Batched detection-association tracker for the mocap markers.
+# Every frame the circles from detect_markers() are matched to the existing
+# tracks on a vectorized distance matrix (Hungarian assignment when scipy is
+# installed, greedy nearest-pair otherwise). Each track carries a constant
+# velocity Kalman filter; all filters are stepped together as arrays, and the
+# prediction bridges frames where a marker is not detected. The cost per frame
+# is a few array operations, so it stays flat as the marker count grows
+# (unlike one CSRT tracker per marker).
+#
+# Identity: a track gets a persistent ID once it has been detected in
+# min_hits frames (single-frame noise never gets one). A track that is not
+# detected for max_misses frames is "lost" but kept for reid_frames more frames;
+# a new detection near its predicted position re-identifies it under the same
+# ID instead of starting a new marker. IDs are never reused within a run.
+# ColumnMap keeps each ID in the same CSV column and records the mapping.
+#
+# The same tracker follows the triangulated 3D markers (dim=3, units mm) in
+# the multi-camera mocap.
+
+
+def assign(cost, gate):
+    """Pairs (row, col) of a cost matrix with cost below the gate (scalar or one per row)."""
+    if not cost.size:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    allowed = cost < np.reshape(gate, (-1, 1))
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(np.where(allowed, cost, 1e6))
+    else:
+        # Greedy: accept the cheapest remaining pairs first
+        order = np.argsort(cost, axis=None)
+        rows, cols = np.unravel_index(order, cost.shape)
+        used_rows, used_cols, keep = set(), set(), []
+        for k, (r, c) in enumerate(zip(rows, cols)):
+            if allowed[r, c] and r not in used_rows and c not in used_cols:
+                used_rows.add(r)
+                used_cols.add(c)
+                keep.append(k)
+        rows, cols = rows[keep], cols[keep]
+    valid = allowed[rows, cols]
+    return rows[valid], cols[valid]
+
+
+class MarkerTracker:
+    def __init__(self, max_tracks=8, max_distance=20, max_misses=10, max_coast=3, min_hits=3,
+                 reid_frames=300, reid_distance=60, process_noise=50.0, measurement_noise=2.0, dim=2):
+        self.dim = dim                            # 2 (image px) or 3 (triangulated mm)
+        self.max_tracks = max_tracks              # New detections are ignored once this many tracks are visible
+        self.max_distance = max_distance          # px; detections further than this from a prediction start new tracks
+        self.max_misses = max_misses              # Frames without a detection before a track is lost
+        self.max_coast = max_coast                # Frames a track is reported from its prediction alone
+        self.min_hits = min_hits                  # Detections needed before a track gets an ID
+        self.reid_frames = reid_frames            # Frames a lost track can still be re-identified
+        self.reid_distance = reid_distance        # px; max distance from a lost track's prediction for re-identification
+        self.process_noise = process_noise        # px/s^2 (acceleration noise of the constant velocity model)
+        self.measurement_noise = measurement_noise  # px (detection noise)
+        self.next_id = 0
+        self.last_time = None
+        self.reidentified = 0                     # Lost tracks recovered under their old ID
+        self.dropped = []                         # IDs dropped for good in the last update
+        self.ids = np.zeros(0, dtype=int)         # -1 until the track is confirmed
+        self.state = np.zeros((0, 2 * dim))       # [x, y, vx, vy] (2D) or [x, y, z, vx, vy, vz] (3D) per track
+        self.cov = np.zeros((0, 2 * dim, 2 * dim))
+        # Observation model: only the position part of the state is measured
+        self.H = np.eye(dim, 2 * dim)
+        self.misses = np.zeros(0, dtype=int)
+        self.hits = np.zeros(0, dtype=int)
+        self.payload = np.zeros(0)                # Value carried with the last detection: circle radius (2D), number of views (3D)
+
+    def __len__(self):
+        return len(self.ids)
+
+    ############################## Kalman filter ##############################
+    def _predict(self, dt):
+        if not len(self) or dt <= 0:
+            return
+        d = self.dim
+        F = np.eye(2 * d)
+        F[:d, d:] = np.eye(d) * dt
+        # Discrete white-noise acceleration model
+        q = self.process_noise ** 2
+        Q = np.kron(np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]]) * q, np.eye(d))
+        self.state = self.state @ F.T
+        self.cov = F @ self.cov @ F.T + Q
+
+    def _correct(self, rows, measurements):
+        d = self.dim
+        R = np.eye(d) * self.measurement_noise ** 2
+        P = self.cov[rows]
+        S = P[:, :d, :d] + R
+        K = P[:, :, :d] @ np.linalg.inv(S)                      # (n, 2d, d)
+        innovation = measurements - self.state[rows, :d]
+        self.state[rows] += (K @ innovation[:, :, None])[:, :, 0]
+        self.cov[rows] = (np.eye(2 * d) - K @ self.H) @ P
+
+    ############################## Association ################################
+    @staticmethod
+    def _assign(predicted, detected, gate):
+        """Pairs (track row, detection row) closer than the gate (scalar or one per track)."""
+        if not len(predicted) or not len(detected):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        return assign(np.linalg.norm(predicted[:, None, :] - detected[None, :, :], axis=2), gate)
+
+    ############################## Track update ###############################
+    def update(self, circles, timestamp):
+        """Advance all tracks to `timestamp` (s) with the detections [(x, y, r), ...] ((x, y, z, n_views) in 3D) of this frame."""
+        dt = timestamp - self.last_time if self.last_time is not None else 0.0
+        self.last_time = timestamp
+        self._predict(dt)
+
+        d = self.dim
+        detected = np.array([c[:d] for c in circles], dtype=float).reshape(-1, d)
+        payloads = np.array([c[d] for c in circles], dtype=float)
+
+        # Visible tracks first, then lost tracks get a chance at the leftover detections
+        visible = np.flatnonzero(self.misses <= self.max_misses)
+        rows, cols = self._assign(self.state[visible, :d], detected, self.max_distance)
+        rows = visible[rows]
+        unmatched = np.setdiff1d(np.arange(len(detected)), cols)
+        lost = np.flatnonzero(self.misses > self.max_misses)
+        if len(lost) and len(unmatched):
+            # Gate grows with the prediction's uncertainty during the occlusion
+            sigma = np.sqrt(np.diagonal(self.cov[lost], axis1=1, axis2=2)[:, :d].max(axis=1))
+            gate = np.minimum(self.max_distance + 3 * sigma, self.reid_distance)
+            lost_rows, lost_cols = self._assign(self.state[lost, :d], detected[unmatched], gate)
+            self.reidentified += len(lost_rows)
+            rows = np.concatenate([rows, lost[lost_rows]])
+            cols = np.concatenate([cols, unmatched[lost_cols]])
+            unmatched = np.setdiff1d(unmatched, unmatched[lost_cols])
+
+        # Matched tracks: Kalman correction
+        self.misses += 1
+        if len(rows):
+            self._correct(rows, detected[cols])
+            self.misses[rows] = 0
+            self.hits[rows] += 1
+            self.payload[rows] = payloads[cols]
+
+        # Tracks that reached min_hits get the next persistent ID
+        confirmed = np.flatnonzero((self.ids < 0) & (self.hits >= self.min_hits))
+        self.ids[confirmed] = np.arange(self.next_id, self.next_id + len(confirmed))
+        self.next_id += len(confirmed)
+
+        # Newly lost tracks stop extrapolating their velocity (held at the last prediction)
+        self.state[self.misses == self.max_misses + 1, d:] = 0.0
+
+        # Unconfirmed tracks are dropped at the first miss, confirmed ones after the re-identification window
+        keep = np.where(self.ids < 0, self.misses == 0, self.misses <= self.max_misses + self.reid_frames)
+        self.dropped = [int(i) for i in self.ids[~keep] if i >= 0]
+        if not keep.all():
+            self._select(keep)
+
+        # Unmatched detections start new tracks
+        free = self.max_tracks - np.count_nonzero(self.misses <= self.max_misses)
+        if free > 0 and len(unmatched):
+            self._add(detected[unmatched[:free]], payloads[unmatched[:free]])
+
+        return self.tracks()
+
+    def _select(self, mask):
+        self.ids = self.ids[mask]
+        self.state = self.state[mask]
+        self.cov = self.cov[mask]
+        self.misses = self.misses[mask]
+        self.hits = self.hits[mask]
+        self.payload = self.payload[mask]
+
+    def _add(self, positions, payloads):
+        n, d = len(positions), self.dim
+        state = np.zeros((n, 2 * d))
+        state[:, :d] = positions
+        cov = np.tile(np.diag([self.measurement_noise ** 2] * d + [(self.max_distance * 10.0) ** 2] * d), (n, 1, 1))
+        self.ids = np.concatenate([self.ids, np.full(n, -1, dtype=int)])
+        self.state = np.concatenate([self.state, state])
+        self.cov = np.concatenate([self.cov, cov])
+        self.misses = np.concatenate([self.misses, np.zeros(n, dtype=int)])
+        self.hits = np.concatenate([self.hits, np.ones(n, dtype=int)])
+        self.payload = np.concatenate([self.payload, payloads])
+
+    def tracks(self):
+        """Reported tracks [(id, x, y, r, detected), ...] ((id, x, y, z, n_views, detected) in 3D); coasting tracks are reported from their prediction."""
+        shown = np.flatnonzero((self.ids >= 0) & (self.misses <= self.max_coast))
+        return [(int(self.ids[k]), *(float(v) for v in self.state[k, :self.dim]),
+                 float(self.payload[k]), bool(self.misses[k] == 0)) for k in shown]
+
+
+class ColumnMap:
+    """Keeps every track ID in the same Marker_N column and records which IDs each column held."""
+
+    def __init__(self, n_columns):
+        self.owner = [None] * n_columns   # Track ID currently holding each column
+        self.column_of = {}
+        self.history = []                 # {"id", "column", "first_seen", "last_seen"} per ID
+        self.unassigned = []              # IDs that found no free column
+        self.changed = False
+
+    def column(self, track_id, timestamp):
+        """Column of a track (a free one is assigned on first sight), or None when all are taken."""
+        if track_id in self.column_of:
+            entry = self.column_of[track_id]
+            entry["last_seen"] = timestamp
+            return entry["column"]
+        if None not in self.owner:
+            if track_id not in self.unassigned:
+                self.unassigned.append(track_id)
+                self.changed = True
+            return None
+        col = self.owner.index(None)
+        self.owner[col] = track_id
+        entry = {"id": track_id, "column": col, "first_seen": timestamp, "last_seen": timestamp}
+        self.column_of[track_id] = entry
+        self.history.append(entry)
+        self.changed = True
+        return col
+
+    def release(self, track_ids):
+        """Free the columns of tracks that are gone for good (past re-identification)."""
+        for track_id in track_ids:
+            entry = self.column_of.pop(track_id, None)
+            if entry is not None:
+                self.owner[entry["column"]] = None
+                self.changed = True
+
+    def metadata(self):
+        return {"columns": {f"Marker_{col}": [e for e in self.history if e["column"] == col]
+                            for col in range(len(self.owner))},
+                "unassigned_ids": list(self.unassigned)}
@@ -0,0 +1,320 @@
+import cv2
+import numpy as np
+import threading
+import time
+from itertools import combinations
+from marker_tracker import assign
+
+# Multi-camera motion capture: synchronized frame grabbing, the rig (extrinsic)
+# calibration file and DLT triangulation of the 2D marker tracks into 3D.
+#
+# Every camera has its own worker thread that grabs, undistorts, detects and
+# tracks its frames, so the views are processed in parallel and adding a
+# camera does not lower the frame rate (OpenCV releases the GIL). All workers
+# grab at the same trigger; the next frame set is triggered as soon as the
+# current one is collected, so the main thread triangulates one set while the
+# workers process the next.
+#
+# World coordinates (mm) are those of the checkerboard used for the rig
+# calibration (multicam_calibration.py): origin at its first inner corner,
+# X and Y along the board, Z pointing into the board.
+
+RIG_FILE = "multicam_calibration.npz"
+
+
+def open_camera(cam_id, resolution=(1920, 1080)):
+    cap = cv2.VideoCapture(cam_id)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Keep only the newest frame so the grabs of all cameras line up
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open camera {cam_id}")
+    return cap
+
+
+############################ Synchronized capture #############################
+class CameraWorker(threading.Thread):
+    def __init__(self, index, cap, process, capture):
+        super().__init__(name=f"camera-{index}", daemon=True)
+        self.index = index
+        self.cap = cap
+        self.process = process      # process(index, frame, timestamp) -> per-camera result
+        self.capture = capture
+        self.failed_reads = 0
+        self.errors = 0
+
+    def run(self):
+        seq = 0
+        while True:
+            seq = self.capture.wait_trigger(seq)
+            if seq is None:
+                break
+            ok = self.cap.grab()
+            timestamp = time.time()
+            result = None
+            if ok:
+                ok, frame = self.cap.retrieve()
+            if ok:
+                try:
+                    result = self.process(self.index, frame, timestamp)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Processing failed for camera {self.index}: {e}")
+            else:
+                self.failed_reads += 1
+            self.capture.deposit(seq, self.index, timestamp if ok else None, result)
+
+
+class SyncedCapture:
+    """Triggers all cameras at once and collects their processed frames as one frame set."""
+
+    def __init__(self, caps, process, timeout=1.0):
+        self.timeout = timeout
+        self.incomplete_sets = 0   # Sets where a camera did not deliver within the timeout
+        self._cond = threading.Condition()
+        self._trigger = 0
+        self._results = {}         # trigger -> [(timestamp, result) or None per camera]
+        self._stopped = False
+        self.workers = [CameraWorker(i, cap, process, self) for i, cap in enumerate(caps)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self._fire()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=2.0)
+
+    def _fire(self):
+        with self._cond:
+            self._trigger += 1
+            self._results[self._trigger] = [None] * len(self.workers)
+            self._cond.notify_all()
+
+    def wait_trigger(self, seq):
+        """Worker side: wait for a trigger newer than seq (None once stopped)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._stopped or self._trigger > seq)
+            return None if self._stopped else self._trigger
+
+    def deposit(self, seq, index, timestamp, result):
+        with self._cond:
+            slot = self._results.get(seq)
+            if slot is not None:   # Late results of a timed-out set are dropped
+                slot[index] = (timestamp, result)
+                self._cond.notify_all()
+
+    def next_set(self):
+        """Wait for the current frame set and trigger the next one. Returns (timestamps, results) per camera."""
+        with self._cond:
+            seq = self._trigger
+            complete = self._cond.wait_for(lambda: self._stopped or all(self._results[seq]), self.timeout)
+            slot = self._results.pop(seq)
+            if not complete:
+                self.incomplete_sets += 1
+        self._fire()
+        timestamps = [s[0] if s is not None else None for s in slot]
+        results = [s[1] if s is not None else None for s in slot]
+        return timestamps, results
+
+
+############################ Rig calibration file #############################
+def save_rig(path, poses, calib_files, calib_hashes, errors_px):
+    """poses: {cam_id: (R, t)} world -> camera, from the rig calibration."""
+    data = {"camera_ids": np.array(sorted(poses))}
+    for cam_id, (R, t) in poses.items():
+        data[f"R_{cam_id}"] = R
+        data[f"t_{cam_id}"] = np.asarray(t, dtype=float).reshape(3)
+        data[f"calib_{cam_id}"] = np.array(calib_files[cam_id])
+        data[f"calib_hash_{cam_id}"] = np.array(calib_hashes[cam_id])
+        data[f"error_px_{cam_id}"] = np.array(errors_px[cam_id])
+    np.savez(path, **data)
+
+
+def load_rig(path=RIG_FILE):
+    """{cam_id: {"R", "t", "calib", "calib_hash", "error_px"}} from the rig calibration file."""
+    data = np.load(path)
+    rig = {}
+    for cam_id in data["camera_ids"]:
+        cam_id = int(cam_id)
+        rig[cam_id] = {"R": data[f"R_{cam_id}"], "t": data[f"t_{cam_id}"],
+                       "calib": str(data[f"calib_{cam_id}"]), "calib_hash": str(data[f"calib_hash_{cam_id}"]),
+                       "error_px": float(data[f"error_px_{cam_id}"])}
+    return rig
+
+
+############################### Triangulation #################################
+def projection_matrix(R, t):
+    """[R | t] for normalized image coordinates."""
+    return np.hstack([R, np.reshape(t, (3, 1))])
+
+
+def triangulate(projections, points):
+    """
+    DLT triangulation of N points in V views, all points solved at once.
+    projections: (V, 3, 4); points: (N, V, 2) normalized image points, NaN where a view does not see the point.
+    Returns (N, 3) world points (NaN for points seen in fewer than 2 views).
+    """
+    P = np.asarray(projections, dtype=float)
+    points = np.asarray(points, dtype=float)
+    seen = ~np.isnan(points).any(axis=2)
+    x = np.nan_to_num(points[..., 0])[..., None]
+    y = np.nan_to_num(points[..., 1])[..., None]
+    A = np.concatenate([x * P[None, :, 2, :] - P[None, :, 0, :],
+                        y * P[None, :, 2, :] - P[None, :, 1, :]], axis=1)   # (N, 2V, 4)
+    A = A * np.concatenate([seen, seen], axis=1)[..., None]                   # Rows of missing views drop out
+    _, _, vt = np.linalg.svd(A)
+    X = vt[:, -1, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        X = X[:, :3] / X[:, 3:4]
+    X[seen.sum(axis=1) < 2] = np.nan
+    return X
+
+
+def project(projections, X):
+    """(N, 3) world points -> normalized image points (N, V, 2) and depths (N, V) in every view."""
+    Xh = np.hstack([X, np.ones((len(X), 1))])
+    p = np.einsum("vij,nj->nvi", np.asarray(projections, dtype=float), Xh)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return p[..., :2] / p[..., 2:3], p[..., 2]
+
+
+def skew(t):
+    return np.array([[0.0, -t[2], t[1]], [t[2], 0.0, -t[0]], [-t[1], t[0], 0.0]])
+
+
+class Triangulator:
+    """Finds which 2D points of the views belong to the same marker and triangulates them."""
+
+    def __init__(self, projections, focal_px, max_error_px=3.0):
+        self.P = np.asarray(projections, dtype=float)
+        self.focal_px = np.asarray(focal_px, dtype=float)   # px per normalized unit, per view (reprojection error in px)
+        self.max_error_px = max_error_px
+        # Essential matrices of the camera pairs (epipolar pre-filter of candidate pairs)
+        self.E = {}
+        for a, b in combinations(range(len(self.P)), 2):
+            R_ab = self.P[b, :, :3] @ self.P[a, :, :3].T
+            t_ab = self.P[b, :, 3] - R_ab @ self.P[a, :, 3]
+            self.E[(a, b)] = skew(t_ab) @ R_ab
+        self.previous = {}   # (view, 2D track ID) -> index of its trusted 3D match in the last frame set
+
+    def errors_px(self, X, points):
+        """Mean reprojection error (px) of each point over the views that see it; inf behind a camera."""
+        proj, depth = project(self.P, X)
+        seen = ~np.isnan(points).any(axis=2)
+        err = np.linalg.norm(proj - points, axis=2) * self.focal_px
+        err = np.where(seen, err, 0.0).sum(axis=1) / np.maximum(seen.sum(axis=1), 1)
+        err[((depth <= 0) & seen).any(axis=1) | np.isnan(err)] = np.inf
+        return err
+
+    def epipolar_px(self, a, b, pa, pb):
+        """(na, nb) distances (px in view b) of the points of view b from the epipolar lines of the points of view a."""
+        lines = np.hstack([pa, np.ones((len(pa), 1))]) @ self.E[(a, b)].T          # (na, 3)
+        dist = np.abs(lines[:, :2] @ pb.T + lines[:, 2:3]) / np.linalg.norm(lines[:, :2], axis=1, keepdims=True)
+        return dist * self.focal_px[b]
+
+    def match(self, views, ids=None):
+        """
+        views: per camera (M, 2) normalized points; ids: per camera the 2D track IDs of those points.
+        Returns [(X, members, error_px), ...] where members maps view index -> point index.
+
+        Every pair of points from two cameras that passes the epipolar check and triangulates
+        within max_error_px is a candidate, extended with the closest agreeing point of each
+        other view. Candidates are accepted (each 2D point used once) in this order:
+          1. seen by 3+ views, or the same 2D tracks as a match of the last frame set,
+             most views and lowest error first
+          2. the remaining two-view candidates, by optimal assignment per camera pair
+        A third view or the track history resolves two-view ambiguities along epipolar lines.
+        """
+        V = len(views)
+        views = [np.asarray(v, dtype=float).reshape(-1, 2) for v in views]
+        candidates = []
+        for a, b in combinations(range(V), 2):
+            if not len(views[a]) or not len(views[b]):
+                continue
+            ia, ib = np.nonzero(self.epipolar_px(a, b, views[a], views[b]) < 2 * self.max_error_px)
+            if not len(ia):
+                continue
+            cand = np.full((len(ia), V, 2), np.nan)
+            cand[:, a] = views[a][ia]
+            cand[:, b] = views[b][ib]
+            X = triangulate(self.P, cand)
+            ok = self.errors_px(X, cand) < self.max_error_px
+            if not ok.any():
+                continue
+            members = [{a: i, b: j} for i, j in zip(ia[ok], ib[ok])]
+            proj, depth = project(self.P, X[ok])
+            for v in range(V):
+                if v in (a, b) or not len(views[v]):
+                    continue
+                dist = np.linalg.norm(proj[:, v, None, :] - views[v][None, :, :], axis=2) * self.focal_px[v]
+                nearest = dist.argmin(axis=1)
+                agrees = (dist[np.arange(len(nearest)), nearest] < self.max_error_px) & (depth[:, v] > 0)
+                for k in np.flatnonzero(agrees):
+                    members[k][v] = nearest[k]
+            candidates.extend(members)
+        if not candidates:
+            self.previous = {}
+            return []
+
+        points = self._stack(views, candidates)
+        X = triangulate(self.P, points)
+        err = self.errors_px(X, points)
+
+        def linked(members):
+            if ids is None:
+                return False
+            before = {self.previous.get((v, ids[v][i])) for v, i in members.items()}
+            return len(before) == 1 and None not in before
+
+        used = [np.zeros(len(v), dtype=bool) for v in views]
+        accepted = []
+
+        def accept(k):
+            for v, i in candidates[k].items():
+                used[v][i] = True
+            accepted.append(k)
+
+        def free(k):
+            return err[k] < self.max_error_px and not any(used[v][i] for v, i in candidates[k].items())
+
+        trusted = {k for k in range(len(candidates)) if len(candidates[k]) >= 3 or linked(candidates[k])}
+        for k in sorted(trusted, key=lambda k: (-len(candidates[k]), err[k])):
+            if free(k):
+                accept(k)
+        pair_candidates = {}
+        for k in range(len(candidates)):
+            if len(candidates[k]) == 2 and free(k):
+                pair_candidates.setdefault(tuple(sorted(candidates[k])), []).append(k)
+        for (a, b), ks in pair_candidates.items():
+            ks = [k for k in ks if free(k)]
+            if not ks:
+                continue
+            rows = sorted({candidates[k][a] for k in ks})
+            cols = sorted({candidates[k][b] for k in ks})
+            cost = np.full((len(rows), len(cols)), np.inf)
+            index = {}
+            for k in ks:
+                r, c = rows.index(candidates[k][a]), cols.index(candidates[k][b])
+                cost[r, c] = err[k]
+                index[(r, c)] = k
+            for r, c in zip(*assign(cost, self.max_error_px)):
+                accept(index[(r, c)])
+
+        if ids is not None:
+            # Only unambiguous matches (3+ views, or inherited from one) are carried to the next frame set
+            self.previous = {(v, ids[v][i]): n for n, k in enumerate(accepted) if k in trusted
+                             for v, i in candidates[k].items()}
+        return [(X[k], candidates[k], float(err[k])) for k in accepted]
+
+    @staticmethod
+    def _stack(views, matches):
+        points = np.full((len(matches), len(views), 2), np.nan)
+        for k, members in enumerate(matches):
+            for v, i in members.items():
+                points[k, v] = views[v][i]
+        return points
@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+import os
+from camera_model import CameraModel
+from multicam import RIG_FILE, SyncedCapture, open_camera, save_rig
+
+# Extrinsic (rig) calibration of the mocap cameras.
+# Place the checkerboard where all cameras can see it: its first inner corner
+# becomes the origin of the 3D coordinates (mm). Press 'c' once the corners are
+# found in every view to compute each camera's pose and save multicam_calibration.npz,
+# or 'q' to quit without saving.
+# Each camera needs its intrinsics from camera_calibration.py, saved as
+# camera_calibration_cam<ID>.npz (camera_calibration.npz is used otherwise).
+
+CAMERA_IDS = [1, 2]
+RESOLUTION = (1920, 1080)
+
+# Define checkerboard dimensions (inner corners per row, per column).
+# The rows + columns of inner corners must be odd (e.g. a board of 8x7 squares): on a board like
+# the 7x7 one of camera_calibration.py, 180 degree rotations look the same, so the cameras could
+# each put the origin at a different corner.
+CHECKERBOARD = (7, 6)
+square_size = 25.4  # Size of a square in mm
+if sum(CHECKERBOARD) % 2 == 0:
+    print(f"Warning: a {CHECKERBOARD} checkerboard is symmetric. Use one with an odd number of inner rows + columns.")
+
+objp = np.zeros((CHECKERBOARD[0] * CHECKERBOARD[1], 3), np.float32)
+objp[:, :2] = np.mgrid[0:CHECKERBOARD[0], 0:CHECKERBOARD[1]].T.reshape(-1, 2) * square_size
+criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+
+def intrinsics_file(cam_id):
+    path = f"camera_calibration_cam{cam_id}.npz"
+    if os.path.exists(path):
+        return path
+    print(f"No {path}, using camera_calibration.npz for camera {cam_id}")
+    return "camera_calibration.npz"
+
+
+calib_files = {cam_id: intrinsics_file(cam_id) for cam_id in CAMERA_IDS}
+models = [CameraModel(calib_files[cam_id]) for cam_id in CAMERA_IDS]
+
+
+def canonical_corners(gray, corners):
+    """
+    Reorder the detected corners so every camera numbers them the same way: the grid is
+    right-handed in the image (no mirrored ordering), and corner 0 is the one next to a
+    black outer square of the board.
+    """
+    cols, rows = CHECKERBOARD
+    grid = corners.reshape(rows, cols, 2)
+    ex, ey = grid[0, 1] - grid[0, 0], grid[1, 0] - grid[0, 0]
+    if ex[0] * ey[1] - ex[1] * ey[0] < 0:
+        grid = grid[::-1]
+    options = [grid, grid[::-1, ::-1]]
+    if rows == cols:
+        options += [np.rot90(grid, 1), np.rot90(grid, 3)]
+
+    def brightness(point):
+        x = int(np.clip(point[0], 0, gray.shape[1] - 1))
+        y = int(np.clip(point[1], 0, gray.shape[0] - 1))
+        return int(gray[y, x])
+
+    for g in options:
+        ex, ey = g[0, 1] - g[0, 0], g[1, 0] - g[0, 0]
+        corner_square = g[0, 0] - 0.5 * ex - 0.5 * ey   # Outer square diagonal from corner 0
+        edge_square = g[0, 0] + 0.5 * ex - 0.5 * ey     # Its neighbour (opposite colour)
+        if brightness(corner_square) < brightness(edge_square):
+            return np.ascontiguousarray(g).reshape(-1, 1, 2)
+    return None
+
+
+# Runs on each camera's worker thread
+def find_board(index, frame, timestamp):
+    frame_height, frame_width = frame.shape[:2]
+    frame = models[index].undistort(frame)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    found, corners = cv2.findChessboardCorners(gray, CHECKERBOARD, cv2.CALIB_CB_FAST_CHECK)
+    if found:
+        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+        cv2.drawChessboardCorners(frame, CHECKERBOARD, corners, found)
+        corners = canonical_corners(gray, corners)
+        found = corners is not None
+    return (corners if found else None), (frame_width, frame_height), frame
+
+
+caps = [open_camera(cam_id, RESOLUTION) for cam_id in CAMERA_IDS]
+capture = SyncedCapture(caps, find_board, timeout=5.0)
+capture.start()
+
+saved = False
+while True:
+    timestamps, results = capture.next_set()
+    if any(r is None for r in results):
+        continue
+    previews = [cv2.resize(frame, (640, 360)) for _, _, frame in results]
+    cv2.imshow("Rig calibration (c: calibrate, q: quit)", np.hstack(previews))
+    key = cv2.waitKey(1) & 0xFF
+    if key == ord('q'):
+        break
+    if key != ord('c'):
+        continue
+    if any(corners is None for corners, _, _ in results):
+        print("Checkerboard not found in every camera:",
+              [cam_id for cam_id, (corners, _, _) in zip(CAMERA_IDS, results) if corners is None])
+        continue
+
+    # Pose of each camera relative to the board (corners are in the undistorted image: no distortion left)
+    poses, errors = {}, {}
+    for cam_id, model, (corners, size, _) in zip(CAMERA_IDS, models, results):
+        K = model.roi_matrix(*size)
+        ok, rvec, tvec = cv2.solvePnP(objp, corners, K, None)
+        projected, _ = cv2.projectPoints(objp, rvec, tvec, K, None)
+        errors[cam_id] = float(np.sqrt(np.mean(np.sum((projected - corners) ** 2, axis=2))))
+        poses[cam_id] = (cv2.Rodrigues(rvec)[0], tvec.reshape(3))
+        position = -poses[cam_id][0].T @ poses[cam_id][1]
+        print(f"Camera {cam_id}: position {np.round(position, 1)} mm, reprojection error {errors[cam_id]:.2f} px")
+    for a, b in zip(CAMERA_IDS, CAMERA_IDS[1:]):
+        baseline = np.linalg.norm(poses[a][0].T @ poses[a][1] - poses[b][0].T @ poses[b][1])
+        print(f"Baseline camera {a} - camera {b}: {baseline:.1f} mm")
+
+    save_rig(RIG_FILE, poses, calib_files, {cam_id: m.calib_hash for cam_id, m in zip(CAMERA_IDS, models)}, errors)
+    print(f"Rig calibration saved to {RIG_FILE}")
+    saved = True
+    break
+
+capture.stop()
+for cap in caps:
+    cap.release()
+cv2.destroyAllWindows()
+if not saved:
+    print("Rig calibration not saved.")
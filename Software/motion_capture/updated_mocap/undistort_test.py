@@ -1,10 +1,8 @@
 import cv2
-import numpy as np
+from camera_model import CameraModel
 
-# Load calibration data
-calib_data = np.load("camera_calibration.npz")
-camera_matrix = calib_data["camera_matrix"]
-dist_coeffs = calib_data["dist_coeffs"]
+# Load calibration data (undistortion maps are precomputed and cached)
+camera = CameraModel("camera_calibration.npz")
 
 # Known real-world width of reference object (e.g., checkerboard square, coin, card)
 real_width_mm = 50  # Adjust based on your reference object
@@ -17,11 +15,8 @@ while True:
     if not ret:
         break
 
-    h, w = frame.shape[:2]
-
     # Undistort the frame first
-    new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, (w, h), 1, (w, h))
-    undistorted_frame = cv2.undistort(frame, camera_matrix, dist_coeffs, None, new_camera_matrix)
+    undistorted_frame = camera.undistort(frame)
 
     # Convert to grayscale for object detection
     gray = cv2.cvtColor(undistorted_frame, cv2.COLOR_BGR2GRAY)